@@ -1,13 +1,14 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
 import httpx
 from uuid import UUID
-from typing import List
+from typing import List, Optional
 
 from starlette import status
 
 from api_gateway_app.config import MAP_SERVICE_URL
 from api_gateway_app.security import require_user_id
-from api_gateway_app.schemas import LocationCreateRequest, LocationUpdateRequest, LocationResponse
+from api_gateway_app.schemas import (LocationCreateRequest, LocationUpdateRequest, LocationResponse,
+                                     ListLocationResponse, ListLocationClusterResponse)
 
 router = APIRouter()
 
@@ -53,6 +54,54 @@ async def list_locations(map_id: UUID = Query(...)):
 
     return response.json()
 
+@router.get("/viewport", response_model=ListLocationResponse)
+async def list_locations_in_view(map_id: UUID = Query(...),
+                                 min_x: float = Query(...),
+                                 min_y: float = Query(...),
+                                 max_x: float = Query(...),
+                                 max_y: float = Query(...),
+                                 zoom: Optional[int] = Query(None, ge=0),
+                                 limit: int = Query(500, ge=1, le=2000),
+                                 cursor: Optional[str] = Query(None, max_length=64)):
+    params = {"map_id": str(map_id), "min_x": min_x, "min_y": min_y, "max_x": max_x, "max_y": max_y, "limit": limit}
+    if zoom is not None:
+        params["zoom"] = zoom
+    if cursor is not None:
+        params["cursor"] = cursor
+
+    async with httpx.AsyncClient() as client:
+        try:
+            response = await client.get(f"{MAP_SERVICE_URL}/locations/viewport", params=params)
+        except httpx.RequestError:
+            raise HTTPException(status_code=503, detail="Map Service unavailable")
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+
+    return response.json()
+
+@router.get("/clusters", response_model=ListLocationClusterResponse)
+async def list_location_clusters(map_id: UUID = Query(...),
+                                 zoom: int = Query(..., ge=0),
+                                 min_x: float = Query(...),
+                                 min_y: float = Query(...),
+                                 max_x: float = Query(...),
+                                 max_y: float = Query(...),
+                                 limit: int = Query(500, ge=1, le=2000)):
+    params = {"map_id": str(map_id), "zoom": zoom, "min_x": min_x, "min_y": min_y, "max_x": max_x, "max_y": max_y,
+              "limit": limit}
+
+    async with httpx.AsyncClient() as client:
+        try:
+            response = await client.get(f"{MAP_SERVICE_URL}/locations/clusters", params=params)
+        except httpx.RequestError:
+            raise HTTPException(status_code=503, detail="Map Service unavailable")
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+
+    return response.json()
+
 @router.get("/{location_id}", response_model=LocationResponse)
 async def get_location(location_id: UUID):
     async with httpx.AsyncClient() as client:
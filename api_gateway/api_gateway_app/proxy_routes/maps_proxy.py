@@ -1,12 +1,14 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, status, Query, Request
+from fastapi.responses import StreamingResponse, Response
+from starlette.background import BackgroundTask
 import httpx
 from uuid import UUID
 from typing import List, Optional
 
 from api_gateway_app.config import USER_SERVICE_URL, MAP_SERVICE_URL
 from api_gateway_app.security import require_user_id, optional_user_id
-from api_gateway_app.schemas import (MapCreateRequest, MapUpdateRequest, ListMapCardResponse, MapResponse,
-                                     TagStatResponse, ShareIdResponse)
+from api_gateway_app.schemas import (MapCreateRequest, MapCloneRequest, MapUpdateRequest, ListMapCardResponse,
+                                     MapResponse, TagStatResponse, ShareIdResponse, ExportResponse)
 
 router = APIRouter()
 
@@ -54,17 +56,21 @@ async def create_map(map_data: MapCreateRequest, user_id: UUID = require_user_id
 async def get_owned_maps(
         page: int = Query(1, alias="page", ge=1),
         size: int = Query(10, alias="size", ge=1, le=100),
+        cursor: Optional[str] = Query(None, alias="cursor", max_length=512),
         user_id: UUID = require_user_id()
 ):
     headers = {
         "X-User-Id": str(user_id)
     }
+    params: dict[str, object] = {"page": page, "size": size}
+    if cursor:
+        params["cursor"] = cursor
 
     async with httpx.AsyncClient() as client:
         try:
             response = await client.get(
                 f"{MAP_SERVICE_URL}/maps/owned",
-                params={"page": page, "size": size},
+                params=params,
                 headers=headers
             )
         except httpx.RequestError:
@@ -88,10 +94,13 @@ async def get_all_maps(
         size: int = Query(10, alias="size", ge=1, le=100),
         q: Optional[str] = Query(None, alias="q"),
         tags: Optional[str] = Query(None, alias="tags"),
-        tags_mode: str = Query("any", alias="tags_mode")
+        tags_mode: str = Query("any", alias="tags_mode"),
+        cursor: Optional[str] = Query(None, alias="cursor", max_length=512)
 ):
     params: dict[str, object] = {"page": page, "size": size}
 
+    if cursor:
+        params["cursor"] = cursor
     if q:
         params["q"] = q
     if tags:
@@ -299,3 +308,134 @@ async def delete_share(map_id: UUID, user_id: UUID = require_user_id()):
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
 
     return
+
+
+@router.post("/{map_id}/clone", response_model=MapResponse)
+async def clone_map(map_id: UUID, clone_data: MapCloneRequest, user_id: UUID = require_user_id()):
+    headers = {
+        "X-User-Id": str(user_id)
+    }
+
+    async with httpx.AsyncClient() as client:
+        try:
+            user_response = await client.get(
+                f"{USER_SERVICE_URL}/users/me",
+                headers=headers
+            )
+        except httpx.RequestError:
+            raise HTTPException(status_code=503, detail="User service unavailable")
+
+        if user_response.status_code != 200:
+            raise HTTPException(status_code=user_response.status_code, detail=user_response.text)
+
+        body = clone_data.model_dump()
+        body["owner_username"] = user_response.json()["username"]
+
+        try:
+            response = await client.post(
+                f"{MAP_SERVICE_URL}/maps/{map_id}/clone",
+                json=body,
+                headers=headers
+            )
+        except httpx.RequestError:
+            raise HTTPException(status_code=503, detail="Map Service unavailable")
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+
+    return response.json()
+
+
+@router.post("/{map_id}/export", response_model=ExportResponse)
+async def export_map(
+        map_id: UUID,
+        format: str = Query("png"),
+        max_dim: Optional[int] = Query(None),
+        user_id: Optional[UUID] = optional_user_id()
+):
+    headers = {"X-User-Id": str(user_id)} if user_id else None
+    params: dict[str, object] = {"format": format}
+    if max_dim is not None:
+        params["max_dim"] = max_dim
+
+    async with httpx.AsyncClient() as client:
+        try:
+            resp = await client.post(
+                f"{MAP_SERVICE_URL}/maps/{map_id}/export",
+                params=params,
+                headers=headers,
+            )
+        except httpx.RequestError:
+            raise HTTPException(status_code=503, detail="Map Service unavailable")
+
+    if resp.status_code != 200:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+
+    return resp.json()
+
+
+@router.get("/{map_id}/export/{name}")
+async def download_export(map_id: UUID, name: str, user_id: Optional[UUID] = optional_user_id()):
+    # Exports can be poster-sized, so the body is relayed as it arrives.
+    headers = {"X-User-Id": str(user_id)} if user_id else None
+    client = httpx.AsyncClient(timeout=None)
+    request = client.build_request("GET", f"{MAP_SERVICE_URL}/maps/{map_id}/export/{name}", headers=headers)
+
+    try:
+        resp = await client.send(request, stream=True)
+    except httpx.RequestError:
+        await client.aclose()
+        raise HTTPException(status_code=503, detail="Map Service unavailable")
+
+    if resp.status_code != 200:
+        detail = (await resp.aread()).decode(errors="replace")
+        await resp.aclose()
+        await client.aclose()
+        raise HTTPException(status_code=resp.status_code, detail=detail)
+
+    async def close():
+        await resp.aclose()
+        await client.aclose()
+
+    return StreamingResponse(
+        resp.aiter_raw(),
+        media_type=resp.headers.get("content-type"),
+        headers={"Content-Disposition": resp.headers.get("content-disposition", "attachment")},
+        background=BackgroundTask(close),
+    )
+
+
+@router.get("/{map_id}/extract")
+async def extract_region(
+        map_id: UUID,
+        bbox: str = Query(...),
+        width: Optional[int] = Query(None),
+        height: Optional[int] = Query(None),
+        format: str = Query("png"),
+        quality: Optional[int] = Query(None),
+        user_id: Optional[UUID] = optional_user_id()
+):
+    headers = {"X-User-Id": str(user_id)} if user_id else None
+    params: dict[str, object] = {"bbox": bbox, "format": format}
+    for name, value in (("width", width), ("height", height), ("quality", quality)):
+        if value is not None:
+            params[name] = value
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        try:
+            resp = await client.get(
+                f"{MAP_SERVICE_URL}/maps/{map_id}/extract",
+                params=params,
+                headers=headers,
+            )
+        except httpx.RequestError:
+            raise HTTPException(status_code=503, detail="Map Service unavailable")
+
+    if resp.status_code != 200:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+
+    return Response(
+        content=resp.content,
+        media_type=resp.headers.get("content-type"),
+        headers={k: resp.headers[k] for k in ("etag", "cache-control") if k in resp.headers},
+    )
@@ -40,6 +40,11 @@ class MapCreateRequest(BaseModel):
     visibility: Visibility
 
 
+class MapCloneRequest(BaseModel):
+    title: Optional[str] = None
+    visibility: Visibility = "private"
+
+
 class MapUpdateRequest(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
@@ -59,6 +64,8 @@ class MapCardResponse(BaseModel):
 class ListMapCardResponse(BaseModel):
     items: List[MapCardResponse]
     total: int
+    total_exact: bool = True
+    next_cursor: Optional[str] = None
 
 
 class MapResponse(BaseModel):
@@ -74,6 +81,7 @@ class MapResponse(BaseModel):
     width: int
     height: int
     max_zoom: int
+    ready_zoom: Optional[int] = None
     created_at: datetime
     updated_at: datetime
     share_id: Optional[str] = None
@@ -112,10 +120,36 @@ class LocationResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ListLocationResponse(BaseModel):
+    items: List[LocationResponse]
+    next_cursor: Optional[str] = None
+
+
+class LocationClusterResponse(BaseModel):
+    zoom: int
+    cell_x: int
+    cell_y: int
+    count: int
+    x: float
+    y: float
+    location_ids: List[UUID]
+
+
+class ListLocationClusterResponse(BaseModel):
+    items: List[LocationClusterResponse]
+    # More cells touch the box than were returned (the densest ones are).
+    truncated: bool = False
+
+
 class TagStatResponse(BaseModel):
     name: str
     count: int
 
 
 class ShareIdResponse(BaseModel):
-    share_id: Optional[str] = None
\ No newline at end of file
+    share_id: Optional[str] = None
+
+class ExportResponse(BaseModel):
+    status: str
+    url: str
+    detail: Optional[str] = None
@@ -83,6 +83,69 @@ async def test_list_locations_ok(httpx_mock, async_client, map_base_url, test_ma
     assert data[0]["id"] == test_loc_id
 
 
+@pytest.mark.asyncio
+async def test_locations_in_view_passes_bbox_and_cursor(httpx_mock, async_client, map_base_url, test_map_id, test_loc_id):
+    httpx_mock.add_response(
+        method="GET",
+        url=(f"{map_base_url}/locations/viewport?map_id={test_map_id}&min_x=0.0&min_y=10.0&max_x=100.0&max_y=110.0"
+             f"&limit=2&zoom=3&cursor={test_loc_id}"),
+        status_code=200,
+        json={
+            "items": [
+                {
+                    "id": test_loc_id,
+                    "map_id": test_map_id,
+                    "name": "Location 1",
+                    "type": "city",
+                    "x": 50.0,
+                    "y": 60.0,
+                    "created_at": "2000-01-01",
+                    "updated_at": "2000-01-01",
+                }
+            ],
+            "next_cursor": None,
+        },
+    )
+
+    resp = await async_client.get("/locations/viewport", params={
+        "map_id": test_map_id, "min_x": 0, "min_y": 10, "max_x": 100, "max_y": 110,
+        "zoom": 3, "limit": 2, "cursor": test_loc_id,
+    })
+
+    assert resp.status_code == 200
+    data = resp.json()
+    assert [item["id"] for item in data["items"]] == [test_loc_id]
+    assert data["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_location_clusters_passes_zoom_and_bbox(httpx_mock, async_client, map_base_url, test_map_id,
+                                                      test_loc_id):
+    httpx_mock.add_response(
+        method="GET",
+        url=(f"{map_base_url}/locations/clusters?map_id={test_map_id}&zoom=2&min_x=0.0&min_y=10.0&max_x=100.0"
+             f"&max_y=110.0&limit=500"),
+        status_code=200,
+        json={
+            "items": [
+                {"zoom": 2, "cell_x": 0, "cell_y": 0, "count": 7, "x": 40.5, "y": 52.0,
+                 "location_ids": [test_loc_id]},
+            ],
+            "truncated": True,
+        },
+    )
+
+    resp = await async_client.get("/locations/clusters", params={
+        "map_id": test_map_id, "zoom": 2, "min_x": 0, "min_y": 10, "max_x": 100, "max_y": 110,
+    })
+
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["items"][0]["count"] == 7
+    assert data["items"][0]["location_ids"] == [test_loc_id]
+    assert data["truncated"] is True
+
+
 @pytest.mark.asyncio
 async def test_get_location_ok(httpx_mock, async_client, map_base_url, test_map_id, test_loc_id):
     httpx_mock.add_response(
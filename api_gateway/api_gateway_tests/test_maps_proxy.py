@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 def auth_header(token="test-token"):
@@ -124,6 +126,21 @@ async def test_all_maps_ok(httpx_mock, async_client, map_base_url, test_map_id):
     assert data["items"][0]["title"] == "Wizard Tower"
 
 
+@pytest.mark.asyncio
+async def test_all_maps_passes_cursor_through(httpx_mock, async_client, map_base_url):
+    httpx_mock.add_response(
+        method="GET",
+        url=f"{map_base_url}/maps/all?page=1&size=10&cursor=abc&tags_mode=any",
+        status_code=200,
+        json={"items": [], "total": 12, "total_exact": False, "next_cursor": "def"},
+    )
+
+    resp = await async_client.get("/maps/all?size=10&cursor=abc")
+    assert resp.status_code == 200
+    assert resp.json()["next_cursor"] == "def"
+    assert resp.json()["total_exact"] is False
+
+
 @pytest.mark.asyncio
 async def test_get_map_ok(httpx_mock, async_client, map_base_url, test_map_id, test_user_id):
     httpx_mock.add_response(
@@ -526,3 +543,117 @@ async def test_get_map_by_share_id_404_custom_message(httpx_mock, async_client,
     resp = await async_client.get(f"/maps/share/{share_id}")
     assert resp.status_code == 404
     assert resp.json()["detail"] == "Shared map not found or expired"
+
+
+@pytest.mark.asyncio
+async def test_export_map_anonymous(httpx_mock, async_client, map_base_url, test_map_id):
+    httpx_mock.add_response(
+        method="POST",
+        url=f"{map_base_url}/maps/{test_map_id}/export?format=pdf&max_dim=2048",
+        status_code=200,
+        json={"status": "pending", "url": f"/maps/{test_map_id}/export/0123456789abcdef-2048.pdf"},
+    )
+
+    resp = await async_client.post(f"/maps/{test_map_id}/export", params={"format": "pdf", "max_dim": 2048})
+
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "pending"
+
+
+@pytest.mark.asyncio
+async def test_download_export_streams_body(httpx_mock, async_client, map_base_url, test_map_id):
+    name = "0123456789abcdef-2048.png"
+    httpx_mock.add_response(
+        method="GET",
+        url=f"{map_base_url}/maps/{test_map_id}/export/{name}",
+        status_code=200,
+        content=b"\x89PNG" + b"x" * 100_000,
+        headers={"content-type": "image/png", "content-disposition": 'attachment; filename="map.png"'},
+    )
+
+    resp = await async_client.get(f"/maps/{test_map_id}/export/{name}")
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "image/png"
+    assert resp.headers["content-disposition"] == 'attachment; filename="map.png"'
+    assert len(resp.content) == 100_004
+
+
+@pytest.mark.asyncio
+async def test_download_export_not_found(httpx_mock, async_client, map_base_url, test_map_id):
+    httpx_mock.add_response(
+        method="GET",
+        url=f"{map_base_url}/maps/{test_map_id}/export/missing.png",
+        status_code=404,
+        json={"detail": "Export not found"},
+    )
+
+    resp = await async_client.get(f"/maps/{test_map_id}/export/missing.png")
+
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_extract_region(httpx_mock, async_client, map_base_url, test_map_id):
+    httpx_mock.add_response(
+        method="GET",
+        url=f"{map_base_url}/maps/{test_map_id}/extract?bbox=0%2C0%2C100%2C100&format=webp&width=64",
+        status_code=200,
+        content=b"RIFF....WEBP",
+        headers={"content-type": "image/webp", "etag": '"abc"', "cache-control": "public, max-age=86400"},
+    )
+
+    resp = await async_client.get(
+        f"/maps/{test_map_id}/extract", params={"bbox": "0,0,100,100", "format": "webp", "width": 64}
+    )
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "image/webp"
+    assert resp.headers["etag"] == '"abc"'
+    assert resp.content == b"RIFF....WEBP"
+
+
+@pytest.mark.asyncio
+async def test_clone_map_adds_owner_username(httpx_mock, async_client, user_base_url, map_base_url, test_user_id,
+                                             test_map_id):
+    httpx_mock.add_response(
+        method="POST",
+        url=f"{user_base_url}/auth/verify-token",
+        status_code=200,
+        json={"user_id": test_user_id},
+    )
+    httpx_mock.add_response(
+        method="GET",
+        url=f"{user_base_url}/users/me",
+        status_code=200,
+        json={"id": test_user_id, "username": "forker", "email": "f@example.com", "created_at": "2000-01-01"},
+    )
+    httpx_mock.add_response(
+        method="POST",
+        url=f"{map_base_url}/maps/{test_map_id}/clone",
+        status_code=200,
+        json={
+            "id": "22222222-2222-2222-2222-222222222222",
+            "owner_id": test_user_id,
+            "owner_username": "forker",
+            "title": "My fork",
+            "description": None,
+            "tags": ["magic"],
+            "visibility": "private",
+            "source_path": "",
+            "tiles_path": "/tiles/22222222-2222-2222-2222-222222222222/",
+            "width": 800,
+            "height": 600,
+            "max_zoom": 2,
+            "created_at": "2000-01-01",
+            "updated_at": "2000-01-01",
+            "share_id": None,
+        },
+    )
+
+    resp = await async_client.post(f"/maps/{test_map_id}/clone", json={"title": "My fork"}, headers=auth_header())
+
+    assert resp.status_code == 200
+    assert resp.json()["owner_username"] == "forker"
+    sent = httpx_mock.get_requests(url=f"{map_base_url}/maps/{test_map_id}/clone")[0]
+    assert json.loads(sent.content) == {"title": "My fork", "visibility": "private", "owner_username": "forker"}
@@ -52,6 +52,7 @@ export default function EditableMapViewer({
                     width={map.width}
                     height={map.height}
                     maxZoom={map.max_zoom}
+                    readyZoom={map.ready_zoom ?? null}
                     locations={locations}
                     addMode={addMode}
                     previewCoord={newLocationCoords}
@@ -21,6 +21,7 @@ export default function MapViewer({ map, locations }) {
                     width={map.width}
                     height={map.height}
                     maxZoom={map.max_zoom}
+                    readyZoom={map.ready_zoom ?? null}
                     locations={locations}
                     onSelectLocation={setSelectedLocation}
                     selectedLocationId={selectedLocation?.id ?? null}
@@ -33,6 +33,7 @@ export default function OpenLayersMap({
     width,
     height,
     maxZoom,
+    readyZoom = null,
 
     locations = [],
 
@@ -231,6 +232,8 @@ export default function OpenLayersMap({
                     const x = tileCoord[1];
                     const y = -tileCoord[2] - 1;
                     if (z < 0 || z > maxZoom || x < 0 || y < 0) return undefined;
+                    // deeper levels are still being rendered; OL upscales the coarser ones
+                    if (readyZoom !== null && z > readyZoom) return undefined;
                     return `${nginxUrl}/tiles/${mapId}/${z}/${x}/${y}.png`;
                 },
             }),
@@ -444,6 +447,7 @@ export default function OpenLayersMap({
         projection,
         resolutions,
         maxZoom,
+        readyZoom,
         markerIconUrl,
         getMarkerStyle,
         pickLocationFeatureAtPixel,
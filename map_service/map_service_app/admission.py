@@ -0,0 +1,106 @@
+from datetime import datetime, timezone
+from uuid import UUID, uuid4
+
+import httpx
+from redis.exceptions import WatchError
+
+from map_service_app.config import (TILE_SERVICE_URL, TILE_QUEUE_DEFAULT, TILE_QUEUE_HEAVY, TILING_MAX_CPU_SECONDS,
+                                    TILING_MAX_MEMORY_MB, TILING_HEAVY_CPU_SECONDS, TILING_HEAVY_MEMORY_MB,
+                                    TILING_USER_DAILY_CPU_SECONDS, TILING_GLOBAL_HOURLY_CPU_SECONDS)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+async def request_estimate(header: bytes) -> dict:
+    async with httpx.AsyncClient() as client:
+        try:
+            response = await client.post(f"{TILE_SERVICE_URL}/estimate", content=header)
+        except httpx.RequestError:
+            raise AdmissionRejected(503, "Tile service unavailable")
+
+    if response.status_code == 400:
+        raise AdmissionRejected(400, "Image header could not be read")
+    if response.status_code == 413:
+        raise AdmissionRejected(413, "Image is too large to be tiled")
+    if response.status_code != 200:
+        raise AdmissionRejected(503, "Tile service unavailable")
+
+    return response.json()
+
+
+def _user_key(user_id: UUID, now: datetime) -> str:
+    return f"tiling:budget:user:{user_id}:{now:%Y%m%d}"
+
+
+def _global_key(now: datetime) -> str:
+    return f"tiling:budget:global:{now:%Y%m%d%H}"
+
+
+USER_BUDGET_TTL = 2 * 24 * 3600
+GLOBAL_BUDGET_TTL = 2 * 3600
+
+
+def _used(value) -> float:
+    return float(value) if value is not None else 0.0
+
+
+def admit_tiling_job(redis_conn, user_id: UUID, estimate: dict, now: datetime | None = None) -> tuple[str, dict]:
+    # Checks the estimate against the budgets and charges it in one
+    # transaction, so concurrent uploads cannot all pass on the same
+    # headroom. Returns the queue to use and the charge, which goes into the
+    # job's meta so a failed job can give it back.
+    now = now or datetime.now(timezone.utc)
+    cpu = float(estimate["cpu_seconds"])
+
+    if cpu > TILING_MAX_CPU_SECONDS or estimate["peak_memory_mb"] > TILING_MAX_MEMORY_MB:
+        raise AdmissionRejected(413, "Image is too large to be tiled")
+
+    user_key, global_key = _user_key(user_id, now), _global_key(now)
+    charge = {
+        "token": f"tiling:charge:{uuid4().hex}",
+        "cpu": cpu,
+        "keys": [[user_key, USER_BUDGET_TTL], [global_key, GLOBAL_BUDGET_TTL]],
+    }
+
+    with redis_conn.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(user_key, global_key)
+                user_used, global_used = pipe.mget(user_key, global_key)
+                if _used(user_used) + cpu > TILING_USER_DAILY_CPU_SECONDS:
+                    raise AdmissionRejected(429, "Daily tiling budget exceeded, try again tomorrow")
+                if _used(global_used) + cpu > TILING_GLOBAL_HOURLY_CPU_SECONDS:
+                    raise AdmissionRejected(429, "Tiling capacity exhausted, try again later")
+
+                pipe.multi()
+                for key, ttl in charge["keys"]:
+                    pipe.incrbyfloat(key, cpu)
+                    pipe.expire(key, ttl)
+                # Refunds consume the token, so a charge is given back once.
+                pipe.set(charge["token"], cpu, ex=USER_BUDGET_TTL)
+                pipe.execute()
+                break
+            except WatchError:
+                continue
+
+    if cpu > TILING_HEAVY_CPU_SECONDS or estimate["peak_memory_mb"] > TILING_HEAVY_MEMORY_MB:
+        return TILE_QUEUE_HEAVY, charge
+    return TILE_QUEUE_DEFAULT, charge
+
+
+def refund_tiling_job(redis_conn, charge: dict) -> bool:
+    # Gives a charge back unless that already happened; the tile workers do
+    # the same for jobs that fail.
+    if not redis_conn.delete(charge["token"]):
+        return False
+    pipe = redis_conn.pipeline()
+    for key, ttl in charge["keys"]:
+        pipe.incrbyfloat(key, -charge["cpu"])
+        pipe.expire(key, ttl)
+    pipe.execute()
+    return True
@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from map_service_app.crud import list_maps_catalog, list_maps_catalog_async, list_tags, list_tags_async
+from map_service_app.database import SessionLocal, AsyncSessionLocal, engine, async_engine
+
+# Compares the sync path (sync sessions on a bounded threadpool, as sync
+# endpoints run under Starlette) with the async one under the same number
+# of concurrent requests, against the database in DATABASE_URL.
+
+QUERIES = {
+    "catalog": (lambda db: list_maps_catalog(db, q=None, tags=[], tags_mode="any", limit=20),
+                lambda db: list_maps_catalog_async(db, q=None, tags=[], tags_mode="any", limit=20)),
+    "tags": (lambda db: list_tags(db, limit=50),
+             lambda db: list_tags_async(db, limit=50)),
+}
+
+
+def _summary(latencies: list[float], elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+
+async def run_sync_path(query, requests: int, concurrency: int, threads: int) -> dict:
+    def call():
+        with SessionLocal() as db:
+            query(db)
+
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        async def one():
+            async with limit:
+                start = time.perf_counter()
+                await loop.run_in_executor(pool, call)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(requests)])
+    return _summary(latencies, time.perf_counter() - start)
+
+
+async def run_async_path(query, requests: int, concurrency: int) -> dict:
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with limit:
+            start = time.perf_counter()
+            async with AsyncSessionLocal() as db:
+                await query(db)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    return _summary(latencies, time.perf_counter() - start)
+
+
+async def bench(names: list[str], requests: int, concurrency: int, threads: int) -> dict:
+    results = {}
+    for name in names:
+        sync_query, async_query = QUERIES[name]
+        # One warm-up round each, so connection setup is not measured.
+        await run_sync_path(sync_query, concurrency, concurrency, threads)
+        await run_async_path(async_query, concurrency, concurrency)
+        results[name] = {
+            "sync": await run_sync_path(sync_query, requests, concurrency, threads),
+            "async": await run_async_path(async_query, requests, concurrency),
+        }
+    await async_engine.dispose()
+    engine.dispose()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m map_service_app.bench_db",
+                                     description="Compare the sync and async database paths under concurrency.")
+    parser.add_argument("--query", choices=sorted(QUERIES), action="append")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="requests in flight at once")
+    parser.add_argument("--threads", type=int, default=40, help="threadpool size of the sync path "
+                                                                 "(Starlette's default is 40)")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(bench(args.query or sorted(QUERIES), args.requests, args.concurrency, args.threads))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import json
+import statistics
+import time
+
+from sqlalchemy import text
+
+from map_service_app.crud import _catalog_statement, _paginate
+from map_service_app.database import SessionLocal, engine
+
+# Compares catalog tag filtering through a map_tags subquery (what other
+# databases still use) with the && / @> predicates on maps.tag_ids, on a
+# synthetic dataset seeded into the Postgres database in DATABASE_URL.
+# Seeded rows are owned by "bench" and removed with --cleanup.
+#
+# p50 over 10 runs, 20-row first page with its total, --seed 1000000
+# --tags 500 on Postgres 18 (1 vCPU, 5 GB):
+#   any_popular  join 1935 ms  array 278 ms   (160805 maps)
+#   any_rare     join  328 ms  array  18 ms   (5942 maps)
+#   all_popular  join  381 ms  array  23 ms   (4429 maps)
+#   all_rare     join  324 ms  array  11 ms   (266 maps)
+
+BENCH_OWNER = "bench"
+
+SEED_TAGS = """
+    INSERT INTO tags (id, name, created_at)
+    SELECT gen_random_uuid(), 'bench-' || i, now() FROM generate_series(1, :tags) i
+    ON CONFLICT (name) DO NOTHING
+"""
+
+SEED_MAPS = """
+    INSERT INTO maps (id, owner_id, visibility, owner_username, title, source_path, tiles_path, tag_ids,
+                      created_at, updated_at)
+    SELECT gen_random_uuid(), gen_random_uuid(), CASE WHEN random() < 0.9 THEN 'public' ELSE 'private' END,
+           :owner, 'bench map ' || i, '', '', '{}', now(), now() - i * interval '1 second'
+    FROM generate_series(1, :maps) i
+"""
+
+# Up to three tags per map, skewed towards the low-numbered ones so there
+# are both popular and rare tags to filter by.
+SEED_MAP_TAGS = """
+    WITH t AS (SELECT array_agg(id ORDER BY (substr(name, 7))::int) AS ids FROM tags WHERE name LIKE 'bench-%')
+    INSERT INTO map_tags (map_id, tag_id)
+    SELECT m.id, t.ids[1 + floor(power(random(), 2) * array_length(t.ids, 1))::int]
+    FROM maps m CROSS JOIN generate_series(1, 3) CROSS JOIN t
+    WHERE m.owner_username = :owner
+    ON CONFLICT DO NOTHING
+"""
+
+SEED_TAG_IDS = """
+    UPDATE maps SET tag_ids = t.ids
+    FROM (SELECT map_id, array_agg(tag_id) AS ids FROM map_tags GROUP BY map_id) t
+    WHERE maps.id = t.map_id AND maps.owner_username = :owner
+"""
+
+CASES = {
+    "any_popular": (["bench-1", "bench-2"], "any"),
+    "any_rare": (["bench-400", "bench-401"], "any"),
+    "all_popular": (["bench-1", "bench-2"], "all"),
+    "all_rare": (["bench-1", "bench-400"], "all"),
+}
+
+
+def seed(maps: int, tags: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(SEED_TAGS), {"tags": tags})
+        conn.execute(text(SEED_MAPS), {"maps": maps, "owner": BENCH_OWNER})
+        conn.execute(text(SEED_MAP_TAGS), {"owner": BENCH_OWNER})
+        conn.execute(text(SEED_TAG_IDS), {"owner": BENCH_OWNER})
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE maps"))
+        conn.execute(text("ANALYZE map_tags"))
+        conn.execute(text("ANALYZE tags"))
+
+
+def cleanup() -> None:
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM maps WHERE owner_username = :owner"), {"owner": BENCH_OWNER})
+        conn.execute(text("DELETE FROM tags WHERE name LIKE 'bench-%'"))
+
+
+def time_case(names: list[str], tags_mode: str, use_array: bool, runs: int, limit: int) -> dict:
+    stmt, scores = _catalog_statement(None, names, tags_mode, use_array)
+    latencies = []
+    with SessionLocal() as db:
+        for _ in range(runs + 1):
+            start = time.perf_counter()
+            _, total, _ = _paginate(db, stmt, scores, 0, limit, None, None)
+            latencies.append(time.perf_counter() - start)
+    # The first run warms the cache and is not counted.
+    latencies = sorted(latencies[1:])
+    return {
+        "total": total,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+
+def bench(runs: int, limit: int) -> dict:
+    return {
+        name: {
+            "join": time_case(names, mode, False, runs, limit),
+            "array": time_case(names, mode, True, runs, limit),
+        }
+        for name, (names, mode) in CASES.items()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m map_service_app.bench_tags",
+                                     description="Compare join-based and array-based catalog tag filters.")
+    parser.add_argument("--seed", type=int, metavar="MAPS", help="first insert this many synthetic maps")
+    parser.add_argument("--tags", type=int, default=500, help="synthetic tags to spread over the seeded maps")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--cleanup", action="store_true", help="delete the synthetic data and exit")
+    args = parser.parse_args(argv)
+
+    if args.cleanup:
+        cleanup()
+        return
+    if args.seed:
+        seed(args.seed, args.tags)
+    print(json.dumps(bench(args.runs, args.limit), indent=2))
+
+
+if __name__ == "__main__":
+    main()
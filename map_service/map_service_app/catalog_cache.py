@@ -0,0 +1,112 @@
+import hashlib
+import json
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from map_service_app.config import CATALOG_CACHE_TTL, CATALOG_COUNT_TTL
+from map_service_app.crud import prepare_tags
+from map_service_app.models import Map
+
+# Public catalog pages and the tag list are the same for every reader, so
+# whole responses are cached in Redis. Keys live in versioned namespaces:
+# writes that can change what a namespace shows bump its version after
+# committing, and readers fetch the version before querying, so nothing
+# cached under an older version is ever served again (it just expires).
+# The TTLs only bound staleness if a bump is lost while Redis is down.
+# Reads happen in the async catalog endpoints and take an asyncio Redis
+# client; invalidation happens in sync write endpoints.
+CATALOG = "catalog"
+TAGS = "tags"
+
+
+def _version_key(namespace: str) -> str:
+    return f"{namespace}:version"
+
+
+async def namespace_version(redis_conn, namespace: str) -> Optional[int]:
+    try:
+        value = await redis_conn.get(_version_key(namespace))
+    except RedisError:
+        return None
+    return int(value or 0)
+
+
+def bump_versions(redis_conn, *namespaces: str) -> None:
+    try:
+        for namespace in namespaces:
+            redis_conn.incr(_version_key(namespace))
+    except RedisError:
+        pass
+
+
+def cache_key(namespace: str, version: Optional[int], kind: str, params) -> Optional[str]:
+    if version is None:
+        return None
+    digest = hashlib.sha1(json.dumps(params, default=str).encode()).hexdigest()
+    return f"{namespace}:{version}:{kind}:{digest}"
+
+
+def catalog_filters(q: Optional[str], tags: list[str], tags_mode: str) -> list:
+    q = (q or "").strip()
+    names = sorted(prepare_tags(tags))
+    return [q, names, tags_mode if names else None]
+
+
+def catalog_count_key(version: Optional[int], q: Optional[str], tags: list[str], tags_mode: str) -> Optional[str]:
+    # Totals are only worth caching for filtered queries (tag joins with
+    # GROUP BY/HAVING, trigram search); unfiltered ones come exact with the
+    # page. Cached totals are reused across pages for CATALOG_COUNT_TTL.
+    filters = catalog_filters(q, tags, tags_mode)
+    if not filters[0] and not filters[1]:
+        return None
+    return cache_key(CATALOG, version, "count", filters)
+
+
+async def get_cached(redis_conn, key: Optional[str]):
+    if key is None:
+        return None
+    try:
+        value = await redis_conn.get(key)
+    except RedisError:
+        return None
+    return json.loads(value) if value is not None else None
+
+
+async def set_cached(redis_conn, key: Optional[str], value, ttl: int = CATALOG_CACHE_TTL) -> None:
+    if key is None:
+        return
+    try:
+        await redis_conn.set(key, json.dumps(value, default=str), ex=ttl)
+    except RedisError:
+        pass
+
+
+async def get_cached_count(redis_conn, key: Optional[str]) -> Optional[int]:
+    return await get_cached(redis_conn, key)
+
+
+async def cache_count(redis_conn, key: Optional[str], total: int) -> None:
+    await set_cached(redis_conn, key, total, ttl=CATALOG_COUNT_TTL)
+
+
+def card_state(map_obj: Optional[Map]) -> tuple[bool, frozenset]:
+    # What a map contributes to the cached namespaces: whether it is in the
+    # public catalog, and the tags it counts towards.
+    if map_obj is None:
+        return False, frozenset()
+    return map_obj.visibility == "public", frozenset(tag.name for tag in map_obj.tags)
+
+
+def invalidate_for(redis_conn, before: tuple[bool, frozenset], after: tuple[bool, frozenset],
+                   card_changed: bool = True) -> None:
+    # before/after are card_state() of the map around a committed write;
+    # card_changed says whether the write touched anything a public card
+    # shows (title, updated_at, ...).
+    namespaces = []
+    if (before[0] or after[0]) and (card_changed or before != after):
+        namespaces.append(CATALOG)
+    if before[1] != after[1]:
+        namespaces.append(TAGS)
+    if namespaces:
+        bump_versions(redis_conn, *namespaces)
@@ -0,0 +1,192 @@
+import argparse
+import json
+import math
+from uuid import UUID
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from map_service_app.config import CLUSTER_CELL_PX, CLUSTER_SAMPLE
+from map_service_app.models import Location, LocationCluster, Map
+
+# Marker clusters for every zoom level of a map's tile pyramid. At zoom z
+# a cell is CLUSTER_CELL_PX screen pixels, i.e. CLUSTER_CELL_PX *
+# 2 ** (max_zoom - z) source pixels, counted from the origin of the
+# locations' coordinates. Location writes update the cells they touch in
+# the same transaction; a new max_zoom or a bulk copy rebuilds the map.
+# Maps from before clusters get theirs from python -m map_service_app.clusters,
+# which commits map by map.
+
+
+def cell_size(max_zoom: int, zoom: int) -> float:
+    return CLUSTER_CELL_PX * 2 ** (max_zoom - zoom)
+
+
+def cells_of(x: float, y: float, max_zoom: int) -> list[tuple[int, int, int]]:
+    cells = []
+    for zoom in range(max_zoom + 1):
+        size = cell_size(max_zoom, zoom)
+        cells.append((zoom, math.floor(x / size), math.floor(y / size)))
+    return cells
+
+
+def _max_zoom(db: Session, map_id: UUID) -> int:
+    return db.scalar(select(Map.max_zoom).where(Map.id == map_id)) or 0
+
+
+def _cell(map_id: UUID, zoom: int, cell_x: int, cell_y: int) -> tuple:
+    return (LocationCluster.map_id == map_id, LocationCluster.zoom == zoom, LocationCluster.cell_x == cell_x,
+            LocationCluster.cell_y == cell_y)
+
+
+def _shift(db: Session, map_id: UUID, cell: tuple, dcount: int, dx: float, dy: float):
+    # On Postgres the UPDATE also locks the row, so the follow-up sample
+    # change in the same transaction cannot race another writer.
+    return db.execute(
+        update(LocationCluster)
+        .where(*_cell(map_id, *cell))
+        .values(count=LocationCluster.count + dcount, sum_x=LocationCluster.sum_x + dx,
+                sum_y=LocationCluster.sum_y + dy)
+        .returning(LocationCluster.count, LocationCluster.location_ids)
+    ).first()
+
+
+def _set_sample(db: Session, map_id: UUID, cell: tuple, location_ids: list) -> None:
+    db.execute(update(LocationCluster).where(*_cell(map_id, *cell)).values(location_ids=location_ids))
+
+
+def _add(db: Session, map_id: UUID, cell: tuple, location_id: UUID, x: float, y: float) -> None:
+    row = _shift(db, map_id, cell, 1, x, y)
+    if row is None:
+        zoom, cell_x, cell_y = cell
+        try:
+            with db.begin_nested():
+                db.execute(insert(LocationCluster).values(map_id=map_id, zoom=zoom, cell_x=cell_x, cell_y=cell_y,
+                                                          count=1, sum_x=x, sum_y=y, location_ids=[location_id]))
+            return
+        except IntegrityError:
+            row = _shift(db, map_id, cell, 1, x, y)
+    if len(row.location_ids) < CLUSTER_SAMPLE:
+        _set_sample(db, map_id, cell, [*row.location_ids, location_id])
+
+
+def _remove(db: Session, map_id: UUID, max_zoom: int, cell: tuple, location_id: UUID, x: float, y: float) -> None:
+    row = _shift(db, map_id, cell, -1, -x, -y)
+    if row is None:
+        return
+    if row.count <= 0:
+        db.execute(delete(LocationCluster).where(*_cell(map_id, *cell)))
+    elif location_id in row.location_ids:
+        # Refill the sample from what is left in the cell.
+        zoom, cell_x, cell_y = cell
+        size = cell_size(max_zoom, zoom)
+        others = db.scalars(
+            select(Location.id)
+            .where(Location.map_id == map_id, Location.id != location_id,
+                   Location.x >= cell_x * size, Location.x < (cell_x + 1) * size,
+                   Location.y >= cell_y * size, Location.y < (cell_y + 1) * size)
+            .order_by(Location.id)
+            .limit(CLUSTER_SAMPLE)
+        ).all()
+        _set_sample(db, map_id, cell, list(others))
+
+
+def add_location(db: Session, location: Location) -> None:
+    for cell in cells_of(location.x, location.y, _max_zoom(db, location.map_id)):
+        _add(db, location.map_id, cell, location.id, location.x, location.y)
+
+
+def remove_location(db: Session, location: Location) -> None:
+    max_zoom = _max_zoom(db, location.map_id)
+    for cell in cells_of(location.x, location.y, max_zoom):
+        _remove(db, location.map_id, max_zoom, cell, location.id, location.x, location.y)
+
+
+def move_location(db: Session, location: Location, old_x: float, old_y: float) -> None:
+    max_zoom = _max_zoom(db, location.map_id)
+    old_cells = cells_of(old_x, old_y, max_zoom)
+    new_cells = cells_of(location.x, location.y, max_zoom)
+    for old, new in zip(old_cells, new_cells):
+        if old == new:
+            _shift(db, location.map_id, new, 0, location.x - old_x, location.y - old_y)
+        else:
+            _remove(db, location.map_id, max_zoom, old, location.id, old_x, old_y)
+            _add(db, location.map_id, new, location.id, location.x, location.y)
+
+
+def rebuild_clusters(db: Session, map_id: UUID) -> int:
+    # Recomputes all cells of a map from its locations; returns the number
+    # of cells.
+    db.flush()
+    max_zoom = _max_zoom(db, map_id)
+    db.execute(delete(LocationCluster).where(LocationCluster.map_id == map_id))
+
+    cells = {}
+    rows = db.execute(select(Location.id, Location.x, Location.y).where(Location.map_id == map_id)
+                      .order_by(Location.id))
+    for location_id, x, y in rows:
+        for cell in cells_of(x, y, max_zoom):
+            cluster = cells.setdefault(cell, {"count": 0, "sum_x": 0.0, "sum_y": 0.0, "location_ids": []})
+            cluster["count"] += 1
+            cluster["sum_x"] += x
+            cluster["sum_y"] += y
+            if len(cluster["location_ids"]) < CLUSTER_SAMPLE:
+                cluster["location_ids"].append(location_id)
+
+    if cells:
+        db.execute(insert(LocationCluster), [
+            {"map_id": map_id, "zoom": zoom, "cell_x": cell_x, "cell_y": cell_y, **cluster}
+            for (zoom, cell_x, cell_y), cluster in cells.items()
+        ])
+    return len(cells)
+
+
+def _clusters_statement(map_id: UUID, max_zoom: int, zoom: int, bbox: tuple[float, float, float, float],
+                        limit: int):
+    # Cells overlapping the box, densest first if there are more than limit.
+    min_x, min_y, max_x, max_y = bbox
+    size = cell_size(max_zoom, zoom)
+    return (
+        select(LocationCluster)
+        .where(LocationCluster.map_id == map_id, LocationCluster.zoom == zoom,
+               LocationCluster.cell_x.between(math.floor(min_x / size), math.floor(max_x / size)),
+               LocationCluster.cell_y.between(math.floor(min_y / size), math.floor(max_y / size)))
+        .order_by(LocationCluster.count.desc(), LocationCluster.cell_x, LocationCluster.cell_y)
+        .limit(limit)
+    )
+
+
+async def clusters_in_view_async(db: AsyncSession, map_obj: Map, zoom: int, bbox: tuple[float, float, float, float],
+                                 limit: int = 500) -> tuple[list[LocationCluster], bool]:
+    # The cells and whether there were more than limit of them. Past the
+    # deepest level the clusters of that level are the finest.
+    max_zoom = map_obj.max_zoom or 0
+    zoom = min(zoom, max_zoom)
+    cells = list((await db.scalars(_clusters_statement(map_obj.id, max_zoom, zoom, bbox, limit + 1))).all())
+    return cells[:limit], len(cells) > limit
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m map_service_app.clusters",
+                                     description="Rebuild the marker clusters of maps from their locations.")
+    parser.add_argument("--map-id", type=UUID, action="append", help="only these maps (default: all)")
+    args = parser.parse_args(argv)
+
+    from map_service_app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        map_ids = args.map_id or db.scalars(select(Map.id).order_by(Map.id)).all()
+        cells = 0
+        for map_id in map_ids:
+            cells += rebuild_clusters(db, map_id)
+            db.commit()
+    finally:
+        db.close()
+    print(json.dumps({"maps": len(map_ids), "cells": cells}))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,110 @@
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv('DATABASE_URL')
-SOURCE_IMAGES_PATH = os.getenv('SOURCE_IMAGES_PATH')
+# Same database for the async endpoints, through asyncpg.
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL') or re.sub(r'^postgresql(\+psycopg2)?://', 'postgresql+asyncpg://',
+                                                              DATABASE_URL or '')
+# Per-process pool sizing; the async engine gets a pool of its own with the
+# same settings. -1 disables recycling.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '-1'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'false').lower() == 'true'
 REDIS_URL = os.getenv('REDIS_URL')
+# Requests wait up to REDIS_POOL_TIMEOUT for one of REDIS_MAX_CONNECTIONS.
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', '50'))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', '5'))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', '5'))
+SOURCE_IMAGES_PATH = os.getenv('SOURCE_IMAGES_PATH')
 TILES_BASE_PATH = os.getenv('TILES_BASE_PATH')
+TILES_ARCHIVE_PATH = os.getenv('TILES_ARCHIVE_PATH', TILES_BASE_PATH)
 TILE_SERVICE_TASK = os.getenv('TILE_SERVICE_TASK')
+# Runs in the tile worker when an upload's tiling job fails for good.
+TILE_SERVICE_REFUND = os.getenv('TILE_SERVICE_REFUND', 'tile_service_app.tasks.refund_tiling_charge')
+# Links a shared pyramid into a map whose upload was tiled before.
+TILE_LINK_TASK = os.getenv('TILE_LINK_TASK', 'tile_service_app.tasks.link_task')
 MAX_TAGS_PER_MAP = 10
 MAX_TAG_LEN = 25
 SHARE_ID_TRIES = 10
-DESCRIPTION_MAX_LENGTH = 50000
\ No newline at end of file
+DESCRIPTION_MAX_LENGTH = 50000
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+S3_ACCESS_KEY = os.getenv('S3_ACCESS_KEY')
+S3_SECRET_KEY = os.getenv('S3_SECRET_KEY')
+S3_REGION = os.getenv('S3_REGION', 'us-east-1')
+S3_SOURCES_BUCKET = os.getenv('S3_SOURCES_BUCKET', 'sources')
+S3_TILES_BUCKET = os.getenv('S3_TILES_BUCKET', 'tiles')
+S3_MULTIPART_CHUNK = int(os.getenv('S3_MULTIPART_CHUNK', str(8 * 1024 * 1024)))
+S3_UPLOAD_CONCURRENCY = int(os.getenv('S3_UPLOAD_CONCURRENCY', '4'))
+TILE_SERVICE_URL = os.getenv('TILE_SERVICE_URL', 'http://tile-api:8000')
+TILE_QUEUE_DEFAULT = os.getenv('TILE_QUEUE_DEFAULT', 'default')
+TILE_QUEUE_HEAVY = os.getenv('TILE_QUEUE_HEAVY', 'heavy')
+# Must match the tile workers' TILE_FORMAT for uploads to reuse pyramids.
+TILE_FORMAT = os.getenv('TILE_FORMAT', 'png-256-lanczos')
+ESTIMATE_HEADER_BYTES = 64 * 1024
+UPLOAD_MAX_SIDE = int(os.getenv('UPLOAD_MAX_SIDE', '65535'))
+UPLOAD_MAX_PIXELS = int(os.getenv('UPLOAD_MAX_PIXELS', str(1024 * 1024 * 1024)))
+UPLOAD_MAX_BIT_DEPTH = int(os.getenv('UPLOAD_MAX_BIT_DEPTH', '16'))
+UPLOAD_ALLOW_INTERLACED = os.getenv('UPLOAD_ALLOW_INTERLACED', 'true').lower() == 'true'
+TILING_MAX_CPU_SECONDS = float(os.getenv('TILING_MAX_CPU_SECONDS', '3600'))
+TILING_MAX_MEMORY_MB = int(os.getenv('TILING_MAX_MEMORY_MB', '16384'))
+TILING_HEAVY_CPU_SECONDS = float(os.getenv('TILING_HEAVY_CPU_SECONDS', '120'))
+TILING_HEAVY_MEMORY_MB = int(os.getenv('TILING_HEAVY_MEMORY_MB', '2048'))
+TILING_USER_DAILY_CPU_SECONDS = float(os.getenv('TILING_USER_DAILY_CPU_SECONDS', '3600'))
+TILING_GLOBAL_HOURLY_CPU_SECONDS = float(os.getenv('TILING_GLOBAL_HOURLY_CPU_SECONDS', '36000'))
+RETILE_QUEUE = os.getenv('RETILE_QUEUE', 'low')
+RETILE_WORKER_SHARE = float(os.getenv('RETILE_WORKER_SHARE', '0.25'))
+RETILE_POLL_SECONDS = float(os.getenv('RETILE_POLL_SECONDS', '5'))
+RETILE_JOB_TIMEOUT = int(os.getenv('RETILE_JOB_TIMEOUT', '3600'))
+# Long-running map_service jobs (e.g. re-tile drivers) run on map workers
+# from this queue; a driver hands its run to a fresh job after each slice.
+MAP_JOBS_QUEUE = os.getenv('MAP_JOBS_QUEUE', 'map-jobs')
+RETILE_DRIVER_SLICE_SECONDS = int(os.getenv('RETILE_DRIVER_SLICE_SECONDS', '600'))
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+# Sent by the metrics scraper as X-Metrics-Token; /metrics is off without it.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Catalog and tag list responses are invalidated on writes; the TTLs only
+# bound staleness when an invalidation is lost.
+CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', '300'))
+CATALOG_COUNT_TTL = int(os.getenv('CATALOG_COUNT_TTL', '60'))
+# Text search configurations the search vector and queries are built with,
+# and how much location text per map goes into the vector.
+SEARCH_CONFIGS = tuple(c.strip() for c in os.getenv('SEARCH_CONFIGS', 'russian,english').split(',') if c.strip())
+SEARCH_LOCATION_TEXT_MAX = int(os.getenv('SEARCH_LOCATION_TEXT_MAX', '200000'))
+# Location edits reach the search vector this long after the first of them,
+# from a map worker.
+SEARCH_REFRESH_DELAY_SECONDS = int(os.getenv('SEARCH_REFRESH_DELAY_SECONDS', '30'))
+TILE_TIER_TASK = os.getenv('TILE_TIER_TASK', 'tile_service_app.tasks.tier_task')
+TIER_QUEUE = os.getenv('TIER_QUEUE', 'low')
+TIER_JOB_TIMEOUT = int(os.getenv('TIER_JOB_TIMEOUT', '3600'))
+# Must match the tile API's rehydrate job, so a request from either side
+# enqueues it once.
+TILE_REHYDRATE_TASK = os.getenv('TILE_REHYDRATE_TASK', 'tile_service_app.tasks.rehydrate_task')
+REHYDRATE_QUEUE = os.getenv('REHYDRATE_QUEUE', 'default')
+REHYDRATE_LOCK_SECONDS = 600
+TIERING_IDLE_DAYS = int(os.getenv('TIERING_IDLE_DAYS', '90'))
+TIERING_BATCH = int(os.getenv('TIERING_BATCH', '1000'))
+# Views are recorded at most this often per map, for picking idle maps.
+VIEW_TOUCH_SECONDS = int(os.getenv('VIEW_TOUCH_SECONDS', '3600'))
+TILE_EXPORT_TASK = os.getenv('TILE_EXPORT_TASK', 'tile_service_app.tasks.export_task')
+EXPORT_QUEUE = os.getenv('EXPORT_QUEUE', 'default')
+EXPORT_JOB_TIMEOUT = int(os.getenv('EXPORT_JOB_TIMEOUT', '3600'))
+EXPORT_DEFAULT_DIM = int(os.getenv('EXPORT_DEFAULT_DIM', '4096'))
+EXPORT_MAX_DIM = int(os.getenv('EXPORT_MAX_DIM', '16384'))
+# Viewport queries take in locations this many screen pixels outside the
+# bbox, so markers straddling the edge are not cut off.
+LOCATION_MARGIN_PX = int(os.getenv('LOCATION_MARGIN_PX', '32'))
+# Viewport queries key locations by cells of VIEWPORT_CELL_PX source pixels
+# and cover a box with at most VIEWPORT_BLOCKS ** 2 key ranges.
+VIEWPORT_CELL_PX = int(os.getenv('VIEWPORT_CELL_PX', '64'))
+VIEWPORT_BLOCKS = 4
+# Marker clusters are cells of CLUSTER_CELL_PX screen pixels at each zoom
+# level, a fraction of a 256px tile, with up to CLUSTER_SAMPLE
+# representative locations each.
+CLUSTER_CELL_PX = int(os.getenv('CLUSTER_CELL_PX', '64'))
+CLUSTER_SAMPLE = int(os.getenv('CLUSTER_SAMPLE', '3'))
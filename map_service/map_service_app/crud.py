@@ -1,21 +1,34 @@
 from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 from typing import Optional, List
-from sqlalchemy import func, text, desc
+from datetime import datetime, timedelta, timezone
+from functools import reduce
+from sqlalchemy import func, desc, insert, select, update, literal, or_, tuple_
+from sqlalchemy.dialects.postgresql import TSVECTOR, TSQUERY
 from sqlalchemy.exc import IntegrityError
 
 import re
 
-from map_service_app.config import MAX_TAGS_PER_MAP, MAX_TAG_LEN, SHARE_ID_TRIES
-from map_service_app.models import Map, Location, Tag
-from map_service_app.schemas import MapCreate, LocationCreate, MapUpdate, LocationUpdate, TilesInfo
+from map_service_app.config import (MAX_TAGS_PER_MAP, MAX_TAG_LEN, SHARE_ID_TRIES, SEARCH_CONFIGS,
+                                    SEARCH_LOCATION_TEXT_MAX)
+from map_service_app.models import Map, Location, Tag, TilePyramid, map_tags
+from map_service_app import clusters
+from map_service_app.viewport import cell_key, key_ranges
+from map_service_app.schemas import (MapCreate, MapClone, LocationCreate, MapUpdate, LocationUpdate, TilesInfo,
+                                     TilesRecompressed, TilesArchived)
 from map_service_app.utils import generate_share_id
+from map_service_app.pagination import encode_cursor, decode_cursor, after_cursor, page_with_cursor, stable_score
 
 
 
 _strip_re = re.compile(r"[^0-9a-zA-Zа-яА-ЯёЁ\- ]+")
 _spaces_re = re.compile(r"\s+")
 
+# Minimum trigram similarity of fuzzy title and tag matches.
+CATALOG_SIMILARITY = 0.15
+TAGS_SIMILARITY = 0.2
+
 
 def create_map(db: Session, owner_id: UUID, map_in: MapCreate) -> Map:
     db_map = Map(
@@ -36,6 +49,7 @@ def create_map(db: Session, owner_id: UUID, map_in: MapCreate) -> Map:
 
     if map_in.tags:
         set_map_tags(db, db_map, map_in.tags)
+    refresh_search_vector(db, db_map.id)
 
     db.commit()
     db.refresh(db_map)
@@ -43,28 +57,267 @@ def create_map(db: Session, owner_id: UUID, map_in: MapCreate) -> Map:
     return db_map
 
 
-def get_map_by_id(db: Session, map_id: UUID) -> Optional[Map]:
+def _is_postgres(db) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _new_uuid(db: Session):
+    if _is_postgres(db):
+        return func.gen_random_uuid()
+    return func.lower(func.hex(func.randomblob(16)))
+
+
+def _concat(items: list, type_):
+    return reduce(lambda a, b: a.op("||", return_type=type_)(b), items)
+
+
+def _weighted_vector(text, weight: str):
+    text = func.coalesce(text, "")
+    return func.setweight(_concat([func.to_tsvector(config, text) for config in SEARCH_CONFIGS], TSVECTOR), weight,
+                          type_=TSVECTOR)
+
+
+def _location_text(column):
+    return (
+        select(func.left(func.string_agg(column, " "), SEARCH_LOCATION_TEXT_MAX))
+        .where(Location.map_id == Map.id)
+        .scalar_subquery()
+    )
+
+
+def search_vector_update(*criteria):
+    # Title weighs most, then description, location names and location
+    # descriptions. Quiet, like _quiet_update_statement: a location edit
+    # does not move the map in the catalog.
+    vector = _concat([
+        _weighted_vector(Map.title, "A"),
+        _weighted_vector(Map.description, "B"),
+        _weighted_vector(_location_text(Location.name), "C"),
+        _weighted_vector(_location_text(Location.description_md), "D"),
+    ], TSVECTOR)
+    return (
+        update(Map)
+        .where(*criteria)
+        .values({Map.search_vector: vector, Map.updated_at: Map.updated_at})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def refresh_search_vector(db: Session, map_id: UUID) -> None:
+    # Recomputes one map's vector in the caller's transaction, after its
+    # pending changes are flushed.
+    if _is_postgres(db):
+        db.flush()
+        db.execute(search_vector_update(Map.id == map_id))
+
+
+def clone_map(db: Session, source: Map, clone_id: UUID, owner_id: UUID, clone_in: MapClone) -> Map:
+    # The tile pyramid and source image are linked under clone_id by the
+    # caller; here the row, tags and locations are copied in one transaction,
+    # the latter two with INSERT ... SELECT rather than row by row.
+    db_map = Map(
+        id=clone_id,
+        owner_id=owner_id,
+        owner_username=clone_in.owner_username,
+        title=clone_in.title or source.title,
+        description=source.description,
+        visibility=clone_in.visibility,
+        source_path=source.source_path,
+        tiles_path=f"/tiles/{clone_id}/" if source.tiles_path else '',
+        width=source.width,
+        height=source.height,
+        max_zoom=source.max_zoom,
+        ready_zoom=source.ready_zoom,
+        tiles_bytes_saved=source.tiles_bytes_saved,
+        tile_format=source.tile_format,
+        source_digest=source.source_digest,
+        tag_ids=list(source.tag_ids or []),
+    )
+    db.add(db_map)
+    db.flush()
+
+    new_id = literal(clone_id, Map.id.type)
+    db.execute(insert(map_tags).from_select(
+        ["map_id", "tag_id"],
+        select(new_id, map_tags.c.tag_id).where(map_tags.c.map_id == source.id),
+    ))
+
+    columns = ["type", "name", "description_md", "x", "y", "cell_key"]
+    db.execute(insert(Location).from_select(
+        ["id", "map_id", *columns],
+        select(_new_uuid(db), new_id, *(getattr(Location, c) for c in columns))
+        .where(Location.map_id == source.id),
+    ))
+
+    # The linked tiles are the original's, so the clone shares its reference.
+    if source.pyramid_key is not None and _add_pyramid_refs(db, source.pyramid_key, 1):
+        db_map.pyramid_key = source.pyramid_key
+    refresh_search_vector(db, clone_id)
+    clusters.rebuild_clusters(db, clone_id)
+
+    db.commit()
+    db.refresh(db_map)
+    return db_map
+
+
+def _add_pyramid_refs(db: Session, key: str, n: int) -> int:
     return (
-        db.query(Map)
-        .options(selectinload(Map.tags))
-        .filter(Map.id == map_id)
-        .first()
+        db.query(TilePyramid)
+        .filter(TilePyramid.key == key)
+        .update({TilePyramid.ref_count: TilePyramid.ref_count + n}, synchronize_session=False)
+    )
+
+
+def set_map_tile_pyramid(db: Session, map_obj: Map, key: Optional[str], create: bool = False):
+    # Moves the map's reference from its current pyramid to `key` (None
+    # drops it). A missing pyramid is created from the map's tiles when
+    # `create` is set, otherwise the map is left without one. A pyramid
+    # that loses its last reference goes.
+    old = map_obj.pyramid_key
+    pyramid = None
+    if key is not None:
+        held = key == old or _add_pyramid_refs(db, key, 1)
+        if not held and create:
+            digest, tile_format = key.split("/", 1)
+            try:
+                with db.begin_nested():
+                    db.add(TilePyramid(key=key, digest=digest, tile_format=tile_format, width=map_obj.width,
+                                       height=map_obj.height, max_zoom=map_obj.max_zoom, ref_count=1))
+            except IntegrityError:
+                _add_pyramid_refs(db, key, 1)
+            held = True
+        if held:
+            pyramid = db.get(TilePyramid, key)
+
+    map_obj.pyramid_key = key if pyramid is not None else None
+    if old is not None and old != map_obj.pyramid_key:
+        _add_pyramid_refs(db, old, -1)
+        # The map's tiles are being replaced, so they are no longer the
+        # pyramid's to link from.
+        _drop_pyramid_holder(db, map_obj.id, TilePyramid.key == old)
+        (
+            db.query(TilePyramid)
+            .filter(TilePyramid.key == old, TilePyramid.ref_count <= 0)
+            .delete(synchronize_session=False)
+        )
+
+    db.commit()
+    return pyramid
+
+
+def _drop_pyramid_holder(db: Session, map_id: UUID, *criteria) -> None:
+    (
+        db.query(TilePyramid)
+        .filter(TilePyramid.holder_id == map_id, *criteria)
+        .update({TilePyramid.holder_id: None}, synchronize_session=False)
     )
 
 
+def _map_statement(*criteria):
+    return select(Map).options(selectinload(Map.tags)).filter(*criteria).limit(1)
+
+
+def get_map_by_id(db: Session, map_id: UUID) -> Optional[Map]:
+    return db.scalars(_map_statement(Map.id == map_id)).first()
+
+
 def update_map_tiles_info(db: Session, map_id: UUID, tiles_info: TilesInfo) -> Optional[Map]:
     db_map = get_map_by_id(db, map_id)
     if db_map is None:
         return None
+    rebuild = db_map.max_zoom != tiles_info.max_zoom
     db_map.tiles_path = tiles_info.tiles_path
     db_map.width = tiles_info.width
     db_map.height = tiles_info.height
     db_map.max_zoom = tiles_info.max_zoom
+    db_map.ready_zoom = tiles_info.max_zoom if tiles_info.ready_zoom is None else tiles_info.ready_zoom
+    db_map.tiles_bytes_saved = None
+    db_map.tiles_archived_at = None
+    db_map.tiles_bytes_reclaimed = None
+    if tiles_info.tile_format is not None:
+        db_map.tile_format = tiles_info.tile_format
+    # The cluster grid follows the pyramid's levels.
+    if rebuild:
+        clusters.rebuild_clusters(db, map_id)
     db.commit()
     db.refresh(db_map)
     return db_map
 
 
+def update_map_tiles_recompressed(db: Session, map_id: UUID, info: TilesRecompressed) -> Optional[Map]:
+    db_map = get_map_by_id(db, map_id)
+    if db_map is None:
+        return None
+    db_map.tiles_bytes_saved = info.bytes_saved
+    db.commit()
+    db.refresh(db_map)
+    return db_map
+
+
+def _quiet_update_statement(map_id: UUID, values: dict, *criteria):
+    # Bookkeeping that must not bump updated_at, which orders the catalog and
+    # versions exports.
+    return (
+        update(Map)
+        .where(Map.id == map_id, *criteria)
+        .values({**values, Map.updated_at: Map.updated_at})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _update_quietly(db: Session, map_id: UUID, values: dict, *criteria) -> bool:
+    updated = db.execute(_quiet_update_statement(map_id, values, *criteria)).rowcount
+    db.commit()
+    return bool(updated)
+
+
+def _view_touch(min_interval: timedelta) -> tuple[dict, object]:
+    now = datetime.now(timezone.utc)
+    return {Map.last_viewed_at: now}, Map.last_viewed_at.is_(None) | (Map.last_viewed_at < now - min_interval)
+
+
+def touch_map_viewed(db: Session, map_id: UUID, min_interval: timedelta) -> None:
+    _update_quietly(db, map_id, *_view_touch(min_interval))
+
+
+def select_idle_maps(db: Session, idle_before: datetime, limit: int) -> List[UUID]:
+    last_seen = func.coalesce(Map.last_viewed_at, Map.created_at)
+    query = (
+        db.query(Map.id)
+        .filter(Map.width > 0, Map.tiles_archived_at.is_(None), last_seen < idle_before,
+                or_(Map.tiering_checked_at.is_(None), Map.tiering_checked_at < idle_before))
+        .order_by(last_seen, Map.id)
+        .limit(limit)
+    )
+    return [row.id for row in query.all()]
+
+
+def mark_tiering_checked(db: Session, map_ids: List[UUID]) -> None:
+    db.execute(
+        update(Map)
+        .where(Map.id.in_(map_ids))
+        .values({Map.tiering_checked_at: datetime.now(timezone.utc), Map.updated_at: Map.updated_at})
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def update_map_tiles_archived(db: Session, map_id: UUID, info: TilesArchived) -> bool:
+    # Packed tiles can't be linked from.
+    _drop_pyramid_holder(db, map_id)
+    return _update_quietly(db, map_id, {
+        Map.tiles_archived_at: datetime.now(timezone.utc),
+        Map.tiles_bytes_reclaimed: info.bytes_reclaimed,
+    })
+
+
+def update_map_tiles_rehydrated(db: Session, map_id: UUID) -> bool:
+    return _update_quietly(db, map_id, {
+        Map.tiles_archived_at: None,
+        Map.last_viewed_at: datetime.now(timezone.utc),
+    })
+
+
 def update_map(db: Session, map_id: UUID, map_in: MapUpdate) -> Optional[Map]:
     db_map = get_map_by_id(db, map_id)
     if db_map is None:
@@ -85,6 +338,8 @@ def update_map(db: Session, map_id: UUID, map_in: MapUpdate) -> Optional[Map]:
         new_ids = {t.id for t in db_map.tags}
         removed_tags = [t for t in old_tags if t.id not in new_ids]
 
+    if map_in.title is not None or map_in.description is not None:
+        refresh_search_vector(db, db_map.id)
     db.commit()
 
     if removed_tags:
@@ -112,53 +367,146 @@ def delete_map(db: Session, map_id: UUID) -> bool:
 
 
 
-def get_maps_by_owner(db: Session, owner_id: UUID, offset: int = 0, limit: int = 10):
-    query = db.query(Map).options(selectinload(Map.tags)).filter(Map.owner_id == owner_id)
-    total = query.count()
-    maps = query.offset(offset).limit(limit).all()
-    return maps, total
+def _count_statement(stmt):
+    return select(func.count()).select_from(stmt.order_by(None).subquery())
 
 
-def list_maps_catalog(
+def _page_statement(stmt, scores: list, offset: int, limit: int, cursor: Optional[str], count: bool):
+    # Orders by scores (highest first), then (updated_at, id) newest first.
+    # When count is set the total comes from a window count in the page
+    # query itself, so it needs no second round trip.
+    scores = [stable_score(score) for score in scores]
+    sort_columns = [*scores, Map.updated_at, Map.id]
+    if cursor is not None:
+        stmt = after_cursor(stmt, sort_columns, cursor)
+        offset = 0
+    stmt = stmt.add_columns(*[score.label(f"score{i}") for i, score in enumerate(scores)])
+    if count:
+        stmt = stmt.add_columns(func.count().over().label("total"))
+    return stmt.order_by(*[c.desc() for c in sort_columns]).offset(offset).limit(limit + 1)
+
+
+def _page_result(rows: list, n_scores: int, limit: int, total: int):
+    rows, next_cursor = page_with_cursor(rows, limit, lambda r: encode_cursor(
+        [r._mapping[f"score{i}"] for i in range(n_scores)], r.Map.updated_at, r.Map.id, total))
+    return [row.Map for row in rows], total, next_cursor
+
+
+def _cursor_total(cursor: str, scores: list) -> int:
+    # A cursor page only sees the rows after the cursor; the total counted
+    # with the first page comes along in the cursor instead of a recount.
+    return decode_cursor(cursor, len(scores))[3]
+
+
+def _paginate(db: Session, stmt, scores: list, offset: int, limit: int, cursor: Optional[str],
+              total: Optional[int]):
+    if total is None and cursor is not None:
+        total = _cursor_total(cursor, scores)
+    counted = total is None
+    rows = db.execute(_page_statement(stmt, scores, offset, limit, cursor, counted)).all()
+    if counted:
+        if rows:
+            total = rows[0].total
+        else:
+            total = db.scalar(_count_statement(stmt)) if offset else 0
+    return _page_result(rows, len(scores), limit, total)
+
+
+def _owned_statement(owner_id: UUID):
+    return select(Map).options(selectinload(Map.tags)).filter(Map.owner_id == owner_id)
+
+
+def get_maps_by_owner(db: Session, owner_id: UUID, offset: int = 0, limit: int = 10, cursor: Optional[str] = None):
+    return _paginate(db, _owned_statement(owner_id), [], offset, limit, cursor, None)
+
+
+def select_maps_for_retile(
         db: Session,
-        q: Optional[str],
-        tags: List[str],
-        tags_mode: str,
-        offset: int = 0,
-        limit: int = 10,
-):
-    query = db.query(Map).options(selectinload(Map.tags)).filter(Map.visibility == 'public')
+        owner_id: Optional[UUID] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+        not_format: Optional[str] = None,
+) -> List[UUID]:
+    # Only maps that have been tiled at least once have a source to re-tile;
+    # a freshly created map has zero size until its first tiles_info callback.
+    query = db.query(Map.id).filter(Map.width > 0)
+    if owner_id is not None:
+        query = query.filter(Map.owner_id == owner_id)
+    if created_after is not None:
+        query = query.filter(Map.created_at >= created_after)
+    if created_before is not None:
+        query = query.filter(Map.created_at < created_before)
+    if not_format is not None:
+        query = query.filter((Map.tile_format.is_(None)) | (Map.tile_format != not_format))
+    return [row.id for row in query.order_by(Map.created_at, Map.id).all()]
+
+
+def _tag_filter(names: List[str], tags_mode: str, use_array: bool):
+    # On Postgres a single && / @> against the GIN-indexed maps.tag_ids. The
+    # ids are looked up in the same statement; for "all" a name without a tag
+    # row must match nothing rather than be dropped from the array.
+    if use_array:
+        tag_ids = select(func.array_agg(Tag.id)).filter(Tag.name.in_(names)).scalar_subquery()
+        if tags_mode == "all":
+            found = select(func.count(Tag.id)).filter(Tag.name.in_(names)).scalar_subquery()
+            return Map.tag_ids.contains(tag_ids) & (found == len(names))
+        return Map.tag_ids.overlap(tag_ids)
+
+    tagged = select(map_tags.c.map_id).join(Tag, Tag.id == map_tags.c.tag_id).filter(Tag.name.in_(names))
+    if tags_mode == "all":
+        tagged = tagged.group_by(map_tags.c.map_id).having(func.count() == len(names))
+    return Map.id.in_(tagged)
+
+
+def _contains_pattern(q: str) -> str:
+    # q anywhere in the string, its LIKE wildcards taken literally.
+    return "%" + re.sub(r"([/%_])", r"/\1", q) + "%"
+
+
+def _catalog_statement(q: Optional[str], tags: List[str], tags_mode: str, postgres: bool = False):
+    stmt = select(Map).options(selectinload(Map.tags)).filter(Map.visibility == 'public')
     if tags:
         names = prepare_tags(tags)
         if names:
-            n = len(set(names))
-            query = query.join(Map.tags).filter(Tag.name.in_(names))
-
-            if tags_mode == "all":
-                query = query.group_by(Map.id).having(func.count(func.distinct(Tag.name)) == n)
-            else:
-                query = query.group_by(Map.id)
+            stmt = stmt.filter(_tag_filter(names, tags_mode, postgres))
 
+    scores = []
     q = (q or "").strip()
     if q:
         if len(q) < 3:
-            q_pattern = f"%{q.lower()}%"
-            query = query.filter(func.lower(Map.title).like(q_pattern))
-            query = query.order_by(Map.updated_at.desc())
+            # Too short to rank by similarity; a title substring. One or two
+            # characters hold no trigram for ix_maps_title_trgm to look up,
+            # so these scan.
+            stmt = stmt.filter(Map.title.ilike(_contains_pattern(q), escape="/"))
+        elif postgres:
+            # Full-text match on the search vector in any configuration, or a
+            # typo-tolerant match on the title alone. Both operators are
+            # GIN-indexed; % compares against pg_trgm.similarity_threshold,
+            # which _set_similarity sets for the transaction.
+            query = _concat([func.websearch_to_tsquery(config, q) for config in SEARCH_CONFIGS], TSQUERY)
+            stmt = stmt.filter(Map.search_vector.op("@@")(query) | Map.title.op("%")(q))
+            scores.append(func.coalesce(func.ts_rank_cd(Map.search_vector, query), 0) + func.similarity(Map.title, q))
         else:
-            threshold = 0.15
-            query = (
-                query.filter(text("similarity(maps.title, :q) >= :th"))
-                .params(q=q, th=threshold)
-                .order_by(text("similarity(maps.title, :q) DESC"), Map.updated_at.desc())
-                .params(q=q)
-            )
-    else:
-        query = query.order_by(Map.updated_at.desc())
+            q_pattern = f"%{q.lower()}%"
+            stmt = stmt.filter(func.lower(Map.title).like(q_pattern) | func.lower(Map.description).like(q_pattern))
+    return stmt, scores
 
-    total = query.count()
-    items = query.offset(offset).limit(limit).all()
-    return items, total
+
+def list_maps_catalog(
+        db: Session,
+        q: Optional[str],
+        tags: List[str],
+        tags_mode: str,
+        offset: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        total: Optional[int] = None,
+):
+    postgres = _is_postgres(db)
+    stmt, scores = _catalog_statement(q, tags, tags_mode, postgres)
+    if postgres and scores:
+        db.execute(_set_similarity(CATALOG_SIMILARITY))
+    return _paginate(db, stmt, scores, offset, limit, cursor, total)
 
 
 def create_location(db: Session, location_in: LocationCreate) -> Location:
@@ -169,8 +517,11 @@ def create_location(db: Session, location_in: LocationCreate) -> Location:
         description_md=location_in.description_md,
         x=location_in.x,
         y=location_in.y,
+        cell_key=cell_key(location_in.x, location_in.y),
     )
     db.add(location)
+    db.flush()
+    clusters.add_location(db, location)
     db.commit()
     db.refresh(location)
     return location
@@ -180,6 +531,28 @@ def get_locations_by_map_id(db: Session, map_id: UUID) -> List[Location]:
     return db.query(Location).filter(Location.map_id == map_id).all()
 
 
+def _viewport_after(cursor: Optional[str]) -> Optional[tuple[int, UUID]]:
+    if cursor is None:
+        return None
+    try:
+        key, location_id = cursor.split(":")
+        return int(key), UUID(location_id)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def _viewport_statement(map_id: UUID, bbox: tuple[float, float, float, float], key_range: tuple[int, int],
+                        after: Optional[tuple[int, UUID]], limit: int):
+    # One key range of the box, in (cell_key, id) order straight off
+    # ix_locations_map_id_cell_key_id.
+    min_x, min_y, max_x, max_y = bbox
+    stmt = select(Location).filter(Location.map_id == map_id, Location.cell_key.between(*key_range),
+                                   Location.x.between(min_x, max_x), Location.y.between(min_y, max_y))
+    if after is not None:
+        stmt = stmt.filter(tuple_(Location.cell_key, Location.id) > tuple_(*after))
+    return stmt.order_by(Location.cell_key, Location.id).limit(limit)
+
+
 def get_location_by_id(db: Session, location_id: UUID) -> Optional[Location]:
     return db.query(Location).filter(Location.id == location_id).first()
 
@@ -188,6 +561,7 @@ def update_location(db: Session, location_id: UUID, location_in: LocationUpdate)
     location = get_location_by_id(db, location_id)
     if location is None:
         return None
+    old_x, old_y = location.x, location.y
     if location_in.type is not None:
         location.type = location_in.type
     if location_in.name is not None:
@@ -198,6 +572,10 @@ def update_location(db: Session, location_id: UUID, location_in: LocationUpdate)
         location.x = location_in.x
     if location_in.y is not None:
         location.y = location_in.y
+    if (location.x, location.y) != (old_x, old_y):
+        location.cell_key = cell_key(location.x, location.y)
+        db.flush()
+        clusters.move_location(db, location, old_x, old_y)
     db.commit()
     db.refresh(location)
     return location
@@ -207,13 +585,18 @@ def delete_location(db: Session, location_id: UUID) -> bool:
     location = get_location_by_id(db, location_id)
     if location is None:
         return False
+    clusters.remove_location(db, location)
     db.delete(location)
     db.commit()
     return True
 
 
+def _owned_check_statement(user_id: UUID, map_id: UUID):
+    return select(Map.id).filter(Map.owner_id == user_id, Map.id == map_id).limit(1)
+
+
 def is_map_owned_by_user(db: Session, user_id: UUID, map_id: UUID) -> bool:
-    return db.query(Map).filter(Map.owner_id == user_id, Map.id == map_id).first() is not None
+    return db.scalar(_owned_check_statement(user_id, map_id)) is not None
 
 
 def is_location_owned_by_user(db: Session, user_id: UUID, location_id: UUID) -> bool:
@@ -288,6 +671,7 @@ def get_or_create_tags(db: Session, tags: List[str]) -> List[Tag]:
 def set_map_tags(db: Session, map_obj: Map, tag_names: List[str]) -> None:
     tags = get_or_create_tags(db, tag_names)
     map_obj.tags = tags
+    map_obj.tag_ids = [t.id for t in tags]
 
 
 def cleanup_unused_tags(db: Session, removed_tags: List[Tag]) -> None:
@@ -309,9 +693,19 @@ def cleanup_unused_tags(db: Session, removed_tags: List[Tag]) -> None:
             db.delete(removed_by_id[tag_id])
 
 
-def list_tags(db: Session, q: Optional[str] = None, limit: int = 50):
-    query = (
-        db.query(
+def _set_similarity(threshold: float):
+    # Local to the transaction, so pooled connections do not keep it.
+    return select(func.set_config("pg_trgm.similarity_threshold", str(threshold), True))
+
+
+def _fuzzy_tags(q: Optional[str]) -> bool:
+    q_norm = normalize_tag(q) if q else None
+    return bool(q_norm) and len(q_norm) >= 3
+
+
+def _tags_statement(q: Optional[str], limit: int, postgres: bool = False):
+    stmt = (
+        select(
             Tag.name.label("name"),
             func.count(Map.id).label("count"),
         )
@@ -319,29 +713,25 @@ def list_tags(db: Session, q: Optional[str] = None, limit: int = 50):
         .outerjoin(Tag.maps)
         .group_by(Tag.id)
     )
-
-    if q:
-        q_norm = normalize_tag(q)
-        if q_norm:
-            if len(q_norm) < 3:
-                query = query.filter(func.lower(Tag.name).like(f"%{q_norm}%"))
-                query = query.order_by(desc("count"), Tag.name.asc())
-            else:
-                th = 0.2
-                query = (
-                    query.filter(text("similarity(tags.name, :q) >= :th"))
-                    .params(q=q_norm, th=th)
-                    .order_by(text("similarity(tags.name, :q) DESC"), desc("count"), Tag.name.asc())
-                    .params(q=q_norm)
-                )
+    order = [desc("count"), Tag.name.asc()]
+
+    # Names are stored normalized, so they compare without lower().
+    q_norm = normalize_tag(q) if q else None
+    if q_norm:
+        if postgres and len(q_norm) >= 3:
+            stmt = stmt.filter(Tag.name.op("%")(q_norm))
+            order.insert(0, func.similarity(Tag.name, q_norm).desc())
         else:
-            query = query.order_by(desc("count"), Tag.name.asc())
-    else:
-        query = query.order_by(desc("count"), Tag.name.asc())
+            stmt = stmt.filter(Tag.name.like(_contains_pattern(q_norm), escape="/"))
 
-    return query.limit(limit).all()
+    return stmt.order_by(*order).limit(limit)
 
 
+def list_tags(db: Session, q: Optional[str] = None, limit: int = 50):
+    postgres = _is_postgres(db)
+    if postgres and _fuzzy_tags(q):
+        db.execute(_set_similarity(TAGS_SIMILARITY))
+    return db.execute(_tags_statement(q, limit, postgres)).all()
 
 
 def create_share(db: Session, map_id: UUID) -> Optional[str]:
@@ -378,7 +768,82 @@ def delete_share(db: Session, map_id: UUID) -> bool:
 
 
 def get_map_by_share_id(db: Session, share_id: str) -> Optional[Map]:
-    db_map = db.query(Map).options(selectinload(Map.tags)).filter(Map.share_id == share_id).first()
-    if not db_map:
-        return None
-    return db_map
\ No newline at end of file
+    return db.scalars(_map_statement(Map.share_id == share_id)).first()
+
+
+# Async variants of the read paths behind the async endpoints. They run the
+# same statements as their sync counterparts on an AsyncSession.
+
+async def get_map_by_id_async(db: AsyncSession, map_id: UUID) -> Optional[Map]:
+    return (await db.scalars(_map_statement(Map.id == map_id))).first()
+
+
+async def get_map_by_share_id_async(db: AsyncSession, share_id: str) -> Optional[Map]:
+    return (await db.scalars(_map_statement(Map.share_id == share_id))).first()
+
+
+async def is_map_owned_by_user_async(db: AsyncSession, user_id: UUID, map_id: UUID) -> bool:
+    return await db.scalar(_owned_check_statement(user_id, map_id)) is not None
+
+
+async def touch_map_viewed_async(db: AsyncSession, map_id: UUID, min_interval: timedelta) -> None:
+    await db.execute(_quiet_update_statement(map_id, *_view_touch(min_interval)))
+    await db.commit()
+
+
+async def _paginate_async(db: AsyncSession, stmt, scores: list, offset: int, limit: int, cursor: Optional[str],
+                          total: Optional[int]):
+    if total is None and cursor is not None:
+        total = _cursor_total(cursor, scores)
+    counted = total is None
+    rows = (await db.execute(_page_statement(stmt, scores, offset, limit, cursor, counted))).all()
+    if counted:
+        if rows:
+            total = rows[0].total
+        else:
+            total = await db.scalar(_count_statement(stmt)) if offset else 0
+    return _page_result(rows, len(scores), limit, total)
+
+
+async def get_maps_by_owner_async(db: AsyncSession, owner_id: UUID, offset: int = 0, limit: int = 10,
+                                  cursor: Optional[str] = None):
+    return await _paginate_async(db, _owned_statement(owner_id), [], offset, limit, cursor, None)
+
+
+async def list_maps_catalog_async(
+        db: AsyncSession,
+        q: Optional[str],
+        tags: List[str],
+        tags_mode: str,
+        offset: int = 0,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        total: Optional[int] = None,
+):
+    postgres = _is_postgres(db)
+    stmt, scores = _catalog_statement(q, tags, tags_mode, postgres)
+    if postgres and scores:
+        await db.execute(_set_similarity(CATALOG_SIMILARITY))
+    return await _paginate_async(db, stmt, scores, offset, limit, cursor, total)
+
+
+async def list_tags_async(db: AsyncSession, q: Optional[str] = None, limit: int = 50):
+    postgres = _is_postgres(db)
+    if postgres and _fuzzy_tags(q):
+        await db.execute(_set_similarity(TAGS_SIMILARITY))
+    return (await db.execute(_tags_statement(q, limit, postgres))).all()
+
+
+async def get_locations_in_view_async(db: AsyncSession, map_id: UUID, bbox: tuple[float, float, float, float],
+                                      limit: int = 500, cursor: Optional[str] = None):
+    # Pages run through the box cell by cell, so each one reads about limit
+    # rows wherever it starts; the ranges are walked until one is full.
+    after = _viewport_after(cursor)
+    rows = []
+    for key_range in key_ranges(bbox):
+        if after is not None and key_range[1] < after[0]:
+            continue
+        rows += (await db.scalars(_viewport_statement(map_id, bbox, key_range, after, limit + 1 - len(rows)))).all()
+        if len(rows) > limit:
+            break
+    return page_with_cursor(rows, limit, lambda location: f"{location.cell_key}:{location.id}")
@@ -0,0 +1,95 @@
+import hashlib
+from typing import BinaryIO, Optional
+
+from rq import Queue
+from sqlalchemy.orm import Session
+
+from map_service_app.config import TILE_FORMAT, TILE_LINK_TASK, TILE_QUEUE_DEFAULT
+from map_service_app.crud import set_map_tile_pyramid
+from map_service_app.models import Map, TilePyramid
+
+# Maps with the same source image share a tile pyramid: an upload of an
+# image tiled before in the current format gets its tiles linked (on S3,
+# copied) from a map holding them instead of being rendered, so tile URLs
+# stay per map. Links stay between maps, so a map on its own can have its
+# tiles packed away by the tiering job.
+
+
+class HashingReader:
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        self.hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.hash.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self.hash.hexdigest()
+
+
+def hash_upload(f: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    reader = HashingReader(f)
+    while reader.read(chunk_size):
+        pass
+    return reader.hexdigest()
+
+
+def pyramid_key(digest: str, tile_format: str) -> str:
+    return f"{digest}/{tile_format}"
+
+
+def release_pyramid(db: Session, map_obj: Map) -> None:
+    set_map_tile_pyramid(db, map_obj, None)
+
+
+def find_pyramid(db: Session, digest: str) -> Optional[TilePyramid]:
+    # Whether an image has been tiled before in the current format, by a map
+    # whose tiles can still be linked from.
+    pyramid = db.get(TilePyramid, pyramid_key(digest, TILE_FORMAT))
+    return pyramid if pyramid is not None and pyramid.holder_id is not None else None
+
+
+def reuse_pyramid(db: Session, map_obj: Map, digest: str) -> Optional[TilePyramid]:
+    # Called once a new source image is stored. The map's old tiles are being
+    # replaced either way, so its old reference goes regardless. Returns the
+    # pyramid the map now shares if its tiles can be linked in with
+    # rq_enqueue_link(); otherwise the map's own tiling job renders them.
+    map_obj.source_digest = digest
+    pyramid = set_map_tile_pyramid(db, map_obj, pyramid_key(digest, TILE_FORMAT))
+    if pyramid is None or pyramid.holder_id is None or pyramid.holder_id == map_obj.id:
+        return None
+    return pyramid
+
+
+def rq_enqueue_link(redis_conn, map_id, pyramid: TilePyramid) -> None:
+    # On S3 a link is a server-side copy of every tile, so it is left to the
+    # tile workers like the job it replaces; they report the tiles back
+    # through tiles_info.
+    Queue(name=TILE_QUEUE_DEFAULT, connection=redis_conn).enqueue(
+        TILE_LINK_TASK,
+        str(map_id),
+        str(pyramid.holder_id),
+        {
+            "width": pyramid.width,
+            "height": pyramid.height,
+            "max_zoom": pyramid.max_zoom,
+            "ready_zoom": pyramid.max_zoom,
+            "tile_format": pyramid.tile_format,
+            "tiles_path": f"/tiles/{map_id}/",
+        },
+        description=f"link shared tiles into map {map_id}",
+    )
+
+
+def publish_pyramid(db: Session, map_obj: Map) -> None:
+    # Called when a map's tiles are final (after recompression), so later
+    # uploads of the image link the compressed files from this map.
+    if not (map_obj.source_digest and map_obj.tile_format and map_obj.width):
+        return
+
+    pyramid = set_map_tile_pyramid(db, map_obj, pyramid_key(map_obj.source_digest, map_obj.tile_format), create=True)
+    if pyramid.holder_id is None:
+        pyramid.holder_id = map_obj.id
+        db.commit()
@@ -0,0 +1,73 @@
+import hashlib
+import json
+
+from rq import Queue
+from rq.job import JobStatus
+
+from map_service_app.config import TILE_EXPORT_TASK, EXPORT_QUEUE, EXPORT_JOB_TIMEOUT
+from map_service_app.jobs import FAILED_STATUSES, rq_job_status
+from map_service_app.models import Map, Location
+
+EXPORT_MEDIA_TYPES = {"png": "image/png", "pdf": "application/pdf"}
+
+
+def _digest(state) -> str:
+    return hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def tiles_version(map_obj: Map) -> str:
+    # Every tiles_info callback touches updated_at, so a re-tile changes this.
+    return _digest([map_obj.width, map_obj.height, map_obj.max_zoom, map_obj.tile_format, str(map_obj.updated_at)])
+
+
+def export_version(map_obj: Map, locations: list[Location]) -> str:
+    # Changes whenever anything drawn into an export changes. Location edits
+    # do not touch the map row, so the locations are part of the hash.
+    return _digest({
+        "map": tiles_version(map_obj),
+        "locations": sorted([str(loc.id), loc.name, loc.x, loc.y] for loc in locations),
+    })
+
+
+def export_name(version: str, max_dim: int, fmt: str) -> str:
+    return f"{version}-{max_dim}.{fmt}"
+
+
+def export_key(map_id, name: str) -> str:
+    return f"{map_id}/exports/{name}"
+
+
+def rq_enqueue_export(redis_conn, job_id: str, args: tuple) -> None:
+    Queue(name=EXPORT_QUEUE, connection=redis_conn).enqueue(
+        TILE_EXPORT_TASK,
+        *args,
+        job_id=job_id,
+        job_timeout=EXPORT_JOB_TIMEOUT,
+        description=f"export map {args[0]}",
+    )
+
+
+def request_export(redis_conn, storage, map_obj: Map, locations: list[Location], fmt: str, max_dim: int,
+                   enqueue=rq_enqueue_export, job_status=rq_job_status) -> dict:
+    version = export_version(map_obj, locations)
+    name = export_name(version, max_dim, fmt)
+    key = export_key(map_obj.id, name)
+    url = f"/maps/{map_obj.id}/export/{name}"
+
+    if storage.exists(key):
+        return {"status": "ready", "url": url}
+
+    # One job per export; repeated requests while it runs just poll it.
+    job_id = f"export-{map_obj.id}-{version}-{max_dim}-{fmt}"
+    status, reason = job_status(redis_conn, job_id)
+    if status is not None and status not in FAILED_STATUSES and status != JobStatus.FINISHED:
+        return {"status": "pending", "url": url}
+
+    map_info = {"width": map_obj.width, "height": map_obj.height, "max_zoom": map_obj.max_zoom}
+    points = [{"x": loc.x, "y": loc.y, "name": loc.name} for loc in locations]
+    enqueue(redis_conn, job_id, (str(map_obj.id), version, key, fmt, max_dim, map_info, points))
+
+    result = {"status": "pending", "url": url}
+    if reason is not None:
+        result["detail"] = f"Previous attempt failed: {reason}"
+    return result
@@ -0,0 +1,18 @@
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, JobStatus
+
+FAILED_STATUSES = {JobStatus.FAILED, JobStatus.STOPPED, JobStatus.CANCELED}
+
+
+def rq_job_status(redis_conn, job_id: str) -> tuple[str | None, str | None]:
+    try:
+        job = Job.fetch(job_id, connection=redis_conn)
+    except NoSuchJobError:
+        return None, None
+
+    status = job.get_status()
+    reason = None
+    if status in FAILED_STATUSES:
+        lines = [line for line in (job.exc_info or "").splitlines() if line.strip()]
+        reason = lines[-1] if lines else str(status)
+    return status, reason
@@ -3,8 +3,8 @@ from sqlalchemy import text
 import logging
 
 from map_service_app.database import engine
-from map_service_app.models import Base
-from map_service_app.routes import maps, locations
+from map_service_app.models import Base, Location
+from map_service_app.routes import maps, locations, admin, metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("map_service")
@@ -22,20 +22,53 @@ def on_startup() -> None:
 
         Base.metadata.create_all(bind=conn)
 
-        conn.execute(text("""
-            CREATE INDEX IF NOT EXISTS ix_maps_title_trgm 
-            ON maps
-            USING GIN (title gin_trgm_ops)
-        """))
+        conn.execute(text("ALTER TABLE maps ADD COLUMN IF NOT EXISTS ready_zoom INTEGER"))
+        conn.execute(text("ALTER TABLE maps ADD COLUMN IF NOT EXISTS tiles_bytes_saved BIGINT"))
+        conn.execute(text("ALTER TABLE maps ADD COLUMN IF NOT EXISTS tile_format VARCHAR"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_maps_tile_format ON maps (tile_format)"))
+        conn.execute(text("ALTER TABLE maps ADD COLUMN IF NOT EXISTS source_digest VARCHAR"))
+        conn.execute(text("ALTER TABLE maps ADD COLUMN IF NOT EXISTS pyramid_key VARCHAR"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_maps_source_digest ON maps (source_digest)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_maps_pyramid_key ON maps (pyramid_key)"))
+        conn.execute(text(
+            "ALTER TABLE tile_pyramids ADD COLUMN IF NOT EXISTS holder_id UUID REFERENCES maps (id) ON DELETE SET NULL"))
+        conn.execute(text("ALTER TABLE maps ADD COLUMN IF NOT EXISTS last_viewed_at TIMESTAMP WITH TIME ZONE"))
+        conn.execute(text("ALTER TABLE maps ADD COLUMN IF NOT EXISTS tiles_archived_at TIMESTAMP WITH TIME ZONE"))
+        conn.execute(text("ALTER TABLE maps ADD COLUMN IF NOT EXISTS tiles_bytes_reclaimed BIGINT"))
+        conn.execute(text("ALTER TABLE maps ADD COLUMN IF NOT EXISTS tiering_checked_at TIMESTAMP WITH TIME ZONE"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_maps_last_viewed_at ON maps (last_viewed_at)"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_maps_visibility_updated_at_id ON maps (visibility, updated_at DESC, id DESC)"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_maps_owner_id_updated_at_id ON maps (owner_id, updated_at DESC, id DESC)"))
 
-        conn.execute(text("""
-            CREATE INDEX IF NOT EXISTS ix_tags_name_trgm 
-            ON tags
-            USING GIN (name gin_trgm_ops)
-        """))
+        has_tag_ids = conn.execute(text(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = 'maps' AND column_name = 'tag_ids'")).first()
+        if has_tag_ids is None:
+            conn.execute(text("ALTER TABLE maps ADD COLUMN tag_ids UUID[] NOT NULL DEFAULT '{}'"))
+            conn.execute(text("""
+                UPDATE maps SET tag_ids = t.ids
+                FROM (SELECT map_id, array_agg(tag_id) AS ids FROM map_tags GROUP BY map_id) t
+                WHERE maps.id = t.map_id
+            """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_maps_tag_ids ON maps USING GIN (tag_ids)"))
+
+        # Existing maps get their vectors from python -m map_service_app.search_refresh.
+        conn.execute(text("ALTER TABLE maps ADD COLUMN IF NOT EXISTS search_vector TSVECTOR"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_maps_search_vector ON maps USING GIN (search_vector)"))
+
+        # Existing locations get their keys from python -m map_service_app.viewport;
+        # /viewport leaves out locations without one until it has run.
+        conn.execute(text("ALTER TABLE locations ADD COLUMN IF NOT EXISTS cell_key BIGINT"))
+        # Declared on the model only; create_all leaves an existing table's
+        # indexes alone.
+        for index in Location.__table__.indexes:
+            index.create(conn, checkfirst=True)
 
         sim = conn.execute(text("SELECT similarity('wizard tower','wziard towr')")).scalar_one()
         logger.info("pg_trgm OK, similarity=%s", sim)
 
 app.include_router(maps.router, prefix="/maps", tags=["maps"])
-app.include_router(locations.router, prefix="/locations", tags=["locations"])
\ No newline at end of file
+app.include_router(locations.router, prefix="/locations", tags=["locations"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
\ No newline at end of file
@@ -1,11 +1,25 @@
-from sqlalchemy import Column, String, DateTime, Float, ForeignKey, Integer, Table, UniqueConstraint, Text, func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (Column, String, DateTime, Float, ForeignKey, Integer, BigInteger, Table, UniqueConstraint, Text,
+                        Index, JSON, TypeDecorator, func)
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, TSVECTOR
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 import uuid
 
 Base = declarative_base()
 
+
+class UUIDList(TypeDecorator):
+    # Stands in for a Postgres uuid[] on SQLite, for tests.
+    impl = JSON
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else [str(v) for v in value]
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else [uuid.UUID(v) for v in value]
+
+
 map_tags = Table(
     "map_tags",
     Base.metadata,
@@ -29,12 +43,41 @@ class Map(Base):
     width = Column(Integer, nullable=True)
     height = Column(Integer, nullable=True)
     max_zoom = Column(Integer, nullable=True)
+    ready_zoom = Column(Integer, nullable=True)
+    tiles_bytes_saved = Column(BigInteger, nullable=True)
+    tile_format = Column(String, nullable=True, index=True)
+    source_digest = Column(String, nullable=True, index=True)
+    pyramid_key = Column(String, nullable=True, index=True)
+    last_viewed_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    tiles_archived_at = Column(DateTime(timezone=True), nullable=True)
+    tiles_bytes_reclaimed = Column(BigInteger, nullable=True)
+    # When the map was last handed to the tiering job, which may leave it
+    # loose (nothing reclaimable); it is not picked again until it has been
+    # idle that long once more.
+    tiering_checked_at = Column(DateTime(timezone=True), nullable=True)
+    # Copy of the map's map_tags rows, kept by set_map_tags, so the catalog
+    # can filter by tags with one GIN-indexed array predicate.
+    tag_ids = Column(ARRAY(UUID(as_uuid=True)).with_variant(UUIDList(), "sqlite"), nullable=False, default=list)
+    # Title, description and location text for catalog search, refreshed by
+    # crud whenever one of them changes. Postgres only.
+    search_vector = Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True)
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
 
     locations = relationship("Location", back_populates="map", cascade="all, delete-orphan")
     tags = relationship("Tag", secondary=map_tags, lazy="selectin", back_populates="maps")
 
+    # Keyset pagination of the catalog and of a user's own maps; tag filters
+    # and search.
+    __table_args__ = (
+        Index("ix_maps_visibility_updated_at_id", "visibility", updated_at.desc(), id.desc()),
+        Index("ix_maps_owner_id_updated_at_id", "owner_id", updated_at.desc(), id.desc()),
+        Index("ix_maps_tag_ids", tag_ids, postgresql_using="gin"),
+        Index("ix_maps_search_vector", search_vector, postgresql_using="gin"),
+        Index("ix_maps_title_trgm", title, postgresql_using="gin",
+              postgresql_ops={"title": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
+
 class Location(Base):
     __tablename__ = 'locations'
 
@@ -45,11 +88,34 @@ class Location(Base):
     description_md = Column(Text, nullable=False, default='')
     x = Column(Float, nullable=False)
     y = Column(Float, nullable=False)
+    # Grid cell of (x, y) for viewport queries, see viewport.py. NULL for
+    # locations from before it until python -m map_service_app.viewport
+    # has run.
+    cell_key = Column(BigInteger, nullable=True)
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
 
     map = relationship("Map", back_populates="locations")
 
+    # Viewport queries: a map's locations in a range of cells, in key order.
+    __table_args__ = (
+        Index("ix_locations_map_id_cell_key_id", map_id, cell_key, id),
+    )
+
+class LocationCluster(Base):
+    __tablename__ = 'location_clusters'
+
+    # One grid cell of a map's locations at one zoom level, kept up to date
+    # by clusters.py. The centroid is sum_x / count, sum_y / count.
+    map_id = Column(UUID(as_uuid=True), ForeignKey("maps.id", ondelete="CASCADE"), primary_key=True)
+    zoom = Column(Integer, primary_key=True)
+    cell_x = Column(Integer, primary_key=True)
+    cell_y = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)
+    sum_x = Column(Float, nullable=False)
+    sum_y = Column(Float, nullable=False)
+    location_ids = Column(ARRAY(UUID(as_uuid=True)).with_variant(UUIDList(), "sqlite"), nullable=False)
+
 class Tag(Base):
     __tablename__ = 'tags'
 
@@ -59,3 +125,25 @@ class Tag(Base):
 
     maps = relationship("Map", secondary=map_tags, back_populates="tags")
 
+    # Fuzzy and substring tag search.
+    __table_args__ = (
+        Index("ix_tags_name_trgm", name, postgresql_using="gin",
+              postgresql_ops={"name": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+    )
+
+
+class TilePyramid(Base):
+    __tablename__ = 'tile_pyramids'
+
+    # "<sha256 of the source image>/<tile format>".
+    key = Column(String, primary_key=True)
+    digest = Column(String, nullable=False, index=True)
+    tile_format = Column(String, nullable=False)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    max_zoom = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    # A map whose loose tiles are the pyramid's, which uploads of the same
+    # image link from; unset while no map's tiles qualify.
+    holder_id = Column(UUID(as_uuid=True), ForeignKey("maps.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
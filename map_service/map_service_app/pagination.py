@@ -0,0 +1,57 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from uuid import UUID
+
+from sqlalchemy import Numeric, cast, func, tuple_
+
+# Cursors are opaque to clients: the sort key of the last row on a page
+# (scores first, then updated_at and id) and the result's total, which the
+# first page counted, urlsafe-base64 encoded JSON.
+
+# Scores are real on Postgres; neither a JSON float nor a double precision
+# parameter reproduces one exactly, so rows tied at a page boundary would be
+# skipped or repeated. Pages sort, select and compare them as this numeric.
+SCORE_DIGITS = 6
+
+
+def stable_score(score):
+    return func.round(cast(score, Numeric), SCORE_DIGITS)
+
+
+def encode_cursor(scores: list, updated_at: datetime, map_id: UUID, total: int) -> str:
+    raw = json.dumps([*map(str, scores), updated_at.isoformat(), str(map_id), total], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, n_scores: int = 0) -> tuple[list, datetime, UUID, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != n_scores + 3:
+            raise ValueError
+        *key, total = values
+        scores = [Decimal(v) for v in key[:n_scores]]
+        if not all(isinstance(v, str) for v in key) or not all(score.is_finite() for score in scores):
+            raise ValueError
+        if type(total) is not int or total < 0:
+            raise ValueError
+        return scores, datetime.fromisoformat(key[-2]), UUID(key[-1]), total
+    except (ValueError, TypeError, UnicodeDecodeError, InvalidOperation):
+        raise ValueError("Invalid cursor")
+
+
+def after_cursor(query, sort_columns: list, cursor: str):
+    # Rows strictly after the cursor in a (col DESC, ...) ordering. A row
+    # comparison lets Postgres walk the matching composite index.
+    scores, updated_at, map_id, _ = decode_cursor(cursor, len(sort_columns) - 2)
+    return query.filter(tuple_(*sort_columns) < (*scores, updated_at, map_id))
+
+
+def page_with_cursor(rows: list, limit: int, cursor_of) -> tuple[list, str | None]:
+    # Queries fetch limit + 1 rows; the extra one only says whether there is a next page.
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, cursor_of(rows[-1])
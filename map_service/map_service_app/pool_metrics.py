@@ -0,0 +1,144 @@
+import asyncio
+import bisect
+import threading
+import time
+from queue import Empty
+
+from redis import BlockingConnectionPool
+from redis.asyncio import BlockingConnectionPool as AsyncBlockingConnectionPool
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# Connection pools that record how long callers wait for a connection and
+# how often they run into overflow or time out, and report how many
+# connections are in use. Wait times include opening a new connection when
+# the pool has to.
+
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.checkouts = 0
+        self.wait_ms_sum = 0.0
+        self.wait_ms_max = 0.0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+
+    def checked_out(self, seconds: float, overflow: bool = False) -> None:
+        ms = seconds * 1000
+        with self.lock:
+            self.buckets[bisect.bisect_left(WAIT_BUCKETS_MS, ms)] += 1
+            self.checkouts += 1
+            self.wait_ms_sum += ms
+            self.wait_ms_max = max(self.wait_ms_max, ms)
+            self.overflow_checkouts += overflow
+
+    def timed_out(self) -> None:
+        with self.lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip((*WAIT_BUCKETS_MS, "+Inf"), self.buckets):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            return {
+                "checkouts": self.checkouts,
+                "overflow_checkouts": self.overflow_checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms": {
+                    "sum": round(self.wait_ms_sum, 3),
+                    "max": round(self.wait_ms_max, 3),
+                    "buckets": buckets,
+                },
+            }
+
+
+class _MeteredSQLPool:
+    # Pool.connect() is what engines call for a connection; it blocks for up
+    # to pool_timeout when size + max_overflow connections are out.
+
+    @property
+    def metrics(self) -> PoolMetrics:
+        if "_metrics" not in self.__dict__:
+            self._metrics = PoolMetrics()
+        return self._metrics
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except PoolTimeoutError:
+            self.metrics.timed_out()
+            raise
+        self.metrics.checked_out(time.perf_counter() - start, overflow=self.checkedout() > self.size())
+        return conn
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "in_use": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(0, self.overflow()),
+            **self.metrics.snapshot(),
+        }
+
+
+class MeteredQueuePool(_MeteredSQLPool, QueuePool):
+    pass
+
+
+class MeteredAsyncPool(_MeteredSQLPool, AsyncAdaptedQueuePool):
+    pass
+
+
+class MeteredRedisPool(BlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            conn = super().get_connection(*args, **kwargs)
+        except RedisConnectionError as e:
+            # Raised while handling the pool queue's Empty when the wait ran
+            # out; a refused connection has a socket error there instead.
+            if isinstance(e.__context__, Empty):
+                self.metrics.timed_out()
+            raise
+        self.metrics.checked_out(time.perf_counter() - start)
+        return conn
+
+    def stats(self) -> dict:
+        idle = sum(1 for conn in list(self.pool.queue) if conn is not None)
+        return {"max_connections": self.max_connections, "in_use": len(self._connections) - idle, "idle": idle,
+                **self.metrics.snapshot()}
+
+
+class MeteredAsyncRedisPool(AsyncBlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    async def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            conn = await super().get_connection(*args, **kwargs)
+        except RedisConnectionError as e:
+            # Raised from the TimeoutError of the wait for a free connection.
+            if isinstance(e.__cause__, asyncio.TimeoutError):
+                self.metrics.timed_out()
+            raise
+        self.metrics.checked_out(time.perf_counter() - start)
+        return conn
+
+    def stats(self) -> dict:
+        return {"max_connections": self.max_connections, "in_use": len(self._in_use_connections),
+                "idle": len(self._available_connections), **self.metrics.snapshot()}
@@ -0,0 +1,36 @@
+from redis import Redis
+from redis import asyncio as aioredis
+
+from map_service_app.config import REDIS_URL, REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT, REDIS_SOCKET_TIMEOUT
+from map_service_app.pool_metrics import MeteredRedisPool, MeteredAsyncRedisPool
+
+_redis = None
+_async_redis = None
+
+
+def get_redis() -> Redis:
+    # One client (and connection pool) per process for the sync endpoints,
+    # background tasks and RQ enqueues; the client is thread-safe.
+    global _redis
+    if _redis is None:
+        _redis = Redis(connection_pool=MeteredRedisPool.from_url(
+            REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT, socket_connect_timeout=REDIS_SOCKET_TIMEOUT))
+    return _redis
+
+
+def get_async_redis() -> aioredis.Redis:
+    # Same for the async endpoints.
+    global _async_redis
+    if _async_redis is None:
+        _async_redis = aioredis.Redis(connection_pool=MeteredAsyncRedisPool.from_url(
+            REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT, socket_connect_timeout=REDIS_SOCKET_TIMEOUT))
+    return _async_redis
+
+
+def redis_pool_stats() -> dict:
+    return {
+        "sync": _redis.connection_pool.stats() if _redis is not None else None,
+        "async": _async_redis.connection_pool.stats() if _async_redis is not None else None,
+    }
@@ -0,0 +1,275 @@
+import argparse
+import json
+import logging
+import math
+import time
+from datetime import datetime, timezone
+from uuid import UUID, uuid4
+
+from redis import Redis
+from rq import Queue, Retry, Worker, get_current_job
+from rq.job import JobStatus
+
+from map_service_app.crud import select_maps_for_retile
+from map_service_app.jobs import FAILED_STATUSES, rq_job_status
+from map_service_app.config import (REDIS_URL, TILE_SERVICE_TASK, RETILE_QUEUE, RETILE_WORKER_SHARE,
+                                    RETILE_POLL_SECONDS, RETILE_JOB_TIMEOUT, MAP_JOBS_QUEUE,
+                                    RETILE_DRIVER_SLICE_SECONDS)
+
+logger = logging.getLogger("map_service")
+
+
+def _str(value) -> str | None:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def retile_job_id(run_id: str, map_id: str) -> str:
+    return f"retile-{run_id}-{map_id}"
+
+
+def rq_enqueue(redis_conn, map_id: str, job_id: str) -> None:
+    queue = Queue(name=RETILE_QUEUE, connection=redis_conn)
+    queue.enqueue(
+        TILE_SERVICE_TASK,
+        map_id,
+        progressive=False,
+        job_id=job_id,
+        job_timeout=RETILE_JOB_TIMEOUT,
+        result_ttl=7 * 24 * 3600,
+        description=f"re-tile map {map_id}",
+    )
+
+
+def rq_worker_count(redis_conn) -> int:
+    return Worker.count(connection=redis_conn, queue=Queue(name=RETILE_QUEUE, connection=redis_conn))
+
+
+class RetileRun:
+    # All state of a run lives in Redis under retile:<run_id>: the maps still
+    # to do (a list, in selection order), the ones in flight (map -> job id),
+    # and the ones done or failed. Any process can drive a run, a driver can
+    # be killed at any point and the run resumed, and every step is safe to
+    # repeat: a map is only moved off the todo list after its job exists.
+
+    def __init__(self, redis_conn, run_id: str, enqueue=rq_enqueue, job_status=rq_job_status,
+                 worker_count=rq_worker_count):
+        self.redis = redis_conn
+        self.run_id = run_id
+        self.enqueue = enqueue
+        self.job_status = job_status
+        self.worker_count = worker_count
+
+        base = f"retile:{run_id}"
+        self.meta_key = base
+        self.todo_key = f"{base}:todo"
+        self.inflight_key = f"{base}:inflight"
+        self.done_key = f"{base}:done"
+        self.failed_key = f"{base}:failed"
+        self.lock_key = f"{base}:driver"
+
+    def exists(self) -> bool:
+        return bool(self.redis.exists(self.meta_key))
+
+    def create(self, map_ids: list[UUID], filters: dict) -> bool:
+        # Creating a run that already exists is a no-op, so retried admin
+        # calls never select or enqueue the same maps twice.
+        created = self.redis.hsetnx(self.meta_key, "created_at", datetime.now(timezone.utc).isoformat())
+        if not created:
+            return False
+
+        self.redis.hset(self.meta_key, mapping={
+            "status": "pending",
+            "filters": json.dumps(filters, default=str),
+            "total": len(map_ids),
+        })
+        if map_ids:
+            self.redis.rpush(self.todo_key, *[str(m) for m in map_ids])
+        return True
+
+    def capacity(self, share: float) -> int:
+        return max(1, math.floor(share * self.worker_count(self.redis)))
+
+    def reap(self) -> None:
+        for map_id, job_id in self.redis.hgetall(self.inflight_key).items():
+            map_id, job_id = _str(map_id), _str(job_id)
+            status, reason = self.job_status(self.redis, job_id)
+
+            if status is None:
+                # The driver stopped between recording and enqueueing the job.
+                self.enqueue(self.redis, map_id, job_id)
+                continue
+
+            if status == JobStatus.FINISHED:
+                self.redis.sadd(self.done_key, map_id)
+            elif status in FAILED_STATUSES:
+                self.redis.hset(self.failed_key, map_id, reason or str(status))
+            else:
+                continue
+            self.redis.hdel(self.inflight_key, map_id)
+
+    def step(self, capacity: int) -> bool:
+        self.reap()
+
+        while self.redis.hlen(self.inflight_key) < capacity:
+            map_id = _str(self.redis.lindex(self.todo_key, 0))
+            if map_id is None:
+                break
+
+            if not (self.redis.hexists(self.inflight_key, map_id) or self.redis.sismember(self.done_key, map_id)):
+                job_id = retile_job_id(self.run_id, map_id)
+                self.redis.hset(self.inflight_key, map_id, job_id)
+                self.enqueue(self.redis, map_id, job_id)
+            self.redis.lpop(self.todo_key)
+
+        return bool(self.redis.llen(self.todo_key) or self.redis.hlen(self.inflight_key))
+
+    def retry_failed(self) -> int:
+        failed = [_str(m) for m in self.redis.hkeys(self.failed_key)]
+        if failed:
+            self.redis.rpush(self.todo_key, *failed)
+            self.redis.delete(self.failed_key)
+        return len(failed)
+
+    def drive(self, share: float = RETILE_WORKER_SHARE, poll_seconds: float = RETILE_POLL_SECONDS,
+              sleep=time.sleep, max_seconds: float | None = None, clock=time.monotonic) -> bool:
+        # Steps the run until it is finished or, with max_seconds, until the
+        # slice is used up; the run then stays "running" for the next driver.
+        lock_ttl = max(30, int(poll_seconds * 6))
+        if not self.redis.set(self.lock_key, "1", nx=True, ex=lock_ttl):
+            return False
+
+        finished = paused = False
+        started = clock()
+        self.redis.hset(self.meta_key, "status", "running")
+        try:
+            while True:
+                self.redis.expire(self.lock_key, lock_ttl)
+                if not self.step(self.capacity(share)):
+                    finished = True
+                    break
+                logger.info("retile %s: %s", self.run_id, self.progress())
+                if max_seconds is not None and clock() - started >= max_seconds:
+                    paused = True
+                    break
+                sleep(poll_seconds)
+        finally:
+            if finished:
+                self.redis.hset(self.meta_key, mapping={
+                    "status": "finished",
+                    "finished_at": datetime.now(timezone.utc).isoformat(),
+                })
+            elif not paused:
+                self.redis.hset(self.meta_key, "status", "interrupted")
+            self.redis.delete(self.lock_key)
+        return True
+
+    def status(self) -> str | None:
+        return _str(self.redis.hget(self.meta_key, "status"))
+
+    def progress(self) -> dict:
+        meta = {_str(k): _str(v) for k, v in self.redis.hgetall(self.meta_key).items()}
+        failures = {_str(k): _str(v) for k, v in self.redis.hgetall(self.failed_key).items()}
+        return {
+            "run_id": self.run_id,
+            "status": meta.get("status"),
+            "filters": json.loads(meta.get("filters") or "{}"),
+            "total": int(meta.get("total") or 0),
+            "done": self.redis.scard(self.done_key),
+            "failed": len(failures),
+            "in_flight": self.redis.hlen(self.inflight_key),
+            "remaining": self.redis.llen(self.todo_key),
+            "failures": failures,
+            "created_at": meta.get("created_at"),
+            "finished_at": meta.get("finished_at"),
+        }
+
+
+def enqueue_driver(redis_conn, run_id: str, share: float = RETILE_WORKER_SHARE) -> None:
+    Queue(name=MAP_JOBS_QUEUE, connection=redis_conn).enqueue(
+        drive_task,
+        run_id,
+        share,
+        job_timeout=RETILE_DRIVER_SLICE_SECONDS + 10 * int(RETILE_POLL_SECONDS) + 60,
+        retry=Retry(max=3, interval=[30, 60, 120]),
+        description=f"drive re-tile run {run_id}",
+    )
+
+
+def drive_task(run_id: str, share: float) -> None:
+    # Runs on a map worker, one slice at a time, so a deploy or worker
+    # recycle cuts at most a slice short; the run's state is all in Redis.
+    # A second driver of the same run exits at once on the lock.
+    redis_conn = get_current_job().connection
+    run = RetileRun(redis_conn, run_id)
+    if run.drive(share=share, max_seconds=RETILE_DRIVER_SLICE_SECONDS) and run.status() == "running":
+        enqueue_driver(redis_conn, run_id, share)
+
+
+def new_run_id() -> str:
+    return f"{datetime.now(timezone.utc):%Y%m%d%H%M%S}-{uuid4().hex[:8]}"
+
+
+def start_run(db, redis_conn, filters: dict, run_id: str | None = None) -> RetileRun:
+    run = RetileRun(redis_conn, run_id or new_run_id())
+    if not run.exists():
+        run.create(select_maps_for_retile(db, **filters), filters)
+    return run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m map_service_app.retile",
+                                     description="Re-tile maps in bulk, throttled to a share of the tile workers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    start = sub.add_parser("start", help="select maps and re-tile them")
+    start.add_argument("--all", action="store_true", help="select every tiled map")
+    start.add_argument("--owner", type=UUID, dest="owner_id")
+    start.add_argument("--created-after", type=datetime.fromisoformat)
+    start.add_argument("--created-before", type=datetime.fromisoformat)
+    start.add_argument("--not-format", help="only maps whose tiles are not in this format")
+    start.add_argument("--run-id")
+    start.add_argument("--share", type=float, default=RETILE_WORKER_SHARE)
+
+    resume = sub.add_parser("resume", help="continue an interrupted run")
+    resume.add_argument("run_id")
+    resume.add_argument("--retry-failed", action="store_true")
+    resume.add_argument("--share", type=float, default=RETILE_WORKER_SHARE)
+
+    status = sub.add_parser("status", help="print a run's progress")
+    status.add_argument("run_id")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    redis_conn = Redis.from_url(REDIS_URL)
+
+    if args.command == "start":
+        from map_service_app.database import SessionLocal
+
+        filters = {k: getattr(args, k) for k in ("owner_id", "created_after", "created_before", "not_format")
+                   if getattr(args, k) is not None}
+        if not filters and not args.all:
+            parser.error("pass --all or at least one filter")
+
+        db = SessionLocal()
+        try:
+            run = start_run(db, redis_conn, filters, args.run_id)
+        finally:
+            db.close()
+    else:
+        run = RetileRun(redis_conn, args.run_id)
+        if not run.exists():
+            parser.error(f"no such run: {args.run_id}")
+
+    if args.command == "resume" and args.retry_failed:
+        run.retry_failed()
+
+    if args.command != "status":
+        print(f"run {run.run_id}")
+        if not run.drive(share=args.share):
+            print("another process is driving this run")
+
+    print(json.dumps(run.progress(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
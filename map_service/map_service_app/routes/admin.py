@@ -0,0 +1,63 @@
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from map_service_app.config import ADMIN_TOKEN, RETILE_WORKER_SHARE
+from map_service_app.database import get_db
+from map_service_app.redis_client import get_redis
+from map_service_app.retile import RetileRun, start_run, enqueue_driver
+from map_service_app.schemas import RetileCreate, RetileProgress, TieringCreate, TieringResponse
+from map_service_app.tiering import enqueue_idle_maps
+
+router = APIRouter()
+
+
+def require_admin(token: Optional[str] = Header(None, alias="X-Admin-Token")) -> None:
+    # Not routed through the gateway; without ADMIN_TOKEN the endpoints are off.
+    if not ADMIN_TOKEN or token is None or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.post("/retile", response_model=RetileProgress, status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(require_admin)])
+def start_retile_endpoint(data: RetileCreate, db: Session = Depends(get_db)):
+    filters = data.model_dump(include={"owner_id", "created_after", "created_before", "not_format"},
+                              exclude_none=True)
+    if not filters and not data.all:
+        raise HTTPException(status_code=400, detail="Pass all=true or at least one filter")
+
+    run = start_run(db, get_redis(), filters, data.run_id)
+    enqueue_driver(get_redis(), run.run_id, data.share or RETILE_WORKER_SHARE)
+    return run.progress()
+
+
+@router.get("/retile/{run_id}", response_model=RetileProgress, dependencies=[Depends(require_admin)])
+def get_retile_endpoint(run_id: str):
+    run = RetileRun(get_redis(), run_id)
+    if not run.exists():
+        raise HTTPException(status_code=404, detail="Retile run not found")
+    return run.progress()
+
+
+@router.post("/retile/{run_id}/resume", response_model=RetileProgress, status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(require_admin)])
+def resume_retile_endpoint(run_id: str,
+                           retry_failed: bool = Query(False),
+                           share: float = Query(RETILE_WORKER_SHARE, gt=0, le=1)):
+    run = RetileRun(get_redis(), run_id)
+    if not run.exists():
+        raise HTTPException(status_code=404, detail="Retile run not found")
+
+    if retry_failed:
+        run.retry_failed()
+    enqueue_driver(get_redis(), run_id, share)
+    return run.progress()
+
+
+@router.post("/tiering", response_model=TieringResponse, status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(require_admin)])
+def start_tiering_endpoint(data: TieringCreate, db: Session = Depends(get_db)):
+    idle_before, enqueued = enqueue_idle_maps(db, get_redis(), data.idle_days, data.limit)
+    return TieringResponse(idle_before=idle_before, enqueued=enqueued)
@@ -1,12 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Header
 from sqlalchemy.orm import Session
 from uuid import UUID
-from typing import List
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from map_service_app.crud import (create_location, update_location, delete_location, get_location_by_id,
-                                  get_locations_by_map_id, is_map_owned_by_user, is_location_owned_by_user)
-from map_service_app.schemas import LocationCreate, LocationUpdate, LocationResponse
-from map_service_app.database import get_db
+                                  get_locations_by_map_id, is_map_owned_by_user, is_location_owned_by_user,
+                                  get_map_by_id_async, get_locations_in_view_async)
+from map_service_app.schemas import (LocationCreate, LocationUpdate, LocationResponse, ListLocationResponse,
+                                     LocationClusterResponse, ListLocationClusterResponse)
+from map_service_app.database import get_db, get_async_db
+from map_service_app.config import LOCATION_MARGIN_PX
+from map_service_app.redis_client import get_redis
+from map_service_app.search_refresh import schedule_refresh
+from map_service_app.clusters import clusters_in_view_async
 
 router = APIRouter()
 
@@ -18,6 +26,7 @@ def create_location_endpoint(location_data: LocationCreate,
     if not is_map_owned_by_user(db, user_id, location_data.map_id):
         raise HTTPException(status_code=404, detail="Map not owned by user")
     location = create_location(db=db, location_in=location_data)
+    schedule_refresh(get_redis(), location.map_id)
     return location
 
 @router.get("/", response_model=List[LocationResponse])
@@ -25,6 +34,58 @@ def list_locations_endpoint(map_id: UUID = Query(...), db: Session = Depends(get
     locations = get_locations_by_map_id(db=db, map_id=map_id)
     return locations
 
+@router.get("/viewport", response_model=ListLocationResponse)
+async def list_locations_in_view_endpoint(map_id: UUID = Query(...),
+                                          min_x: float = Query(...),
+                                          min_y: float = Query(...),
+                                          max_x: float = Query(...),
+                                          max_y: float = Query(...),
+                                          zoom: Optional[int] = Query(None, ge=0),
+                                          limit: int = Query(500, ge=1, le=2000),
+                                          cursor: Optional[str] = Query(None, max_length=64),
+                                          db: AsyncSession = Depends(get_async_db)):
+    # The box is in source pixels, like the locations. With the viewer's
+    # zoom it is widened by LOCATION_MARGIN_PX screen pixels.
+    if min_x > max_x or min_y > max_y:
+        raise HTTPException(status_code=400, detail="Invalid bbox")
+    map_obj = await get_map_by_id_async(db, map_id)
+    if map_obj is None:
+        raise HTTPException(status_code=404, detail="Map not found")
+
+    margin = 0.0
+    if zoom is not None:
+        margin = LOCATION_MARGIN_PX * 2 ** max(0, (map_obj.max_zoom or 0) - zoom)
+    bbox = (min_x - margin, min_y - margin, max_x + margin, max_y + margin)
+    try:
+        locations, next_cursor = await get_locations_in_view_async(db, map_id, bbox, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ListLocationResponse(items=locations, next_cursor=next_cursor)
+
+@router.get("/clusters", response_model=ListLocationClusterResponse)
+async def list_location_clusters_endpoint(map_id: UUID = Query(...),
+                                          zoom: int = Query(..., ge=0),
+                                          min_x: float = Query(...),
+                                          min_y: float = Query(...),
+                                          max_x: float = Query(...),
+                                          max_y: float = Query(...),
+                                          limit: int = Query(500, ge=1, le=2000),
+                                          db: AsyncSession = Depends(get_async_db)):
+    # Marker clusters of the cells the box touches at the viewer's zoom;
+    # the box is in source pixels, like the viewport endpoint's.
+    if min_x > max_x or min_y > max_y:
+        raise HTTPException(status_code=400, detail="Invalid bbox")
+    map_obj = await get_map_by_id_async(db, map_id)
+    if map_obj is None:
+        raise HTTPException(status_code=404, detail="Map not found")
+
+    cells, truncated = await clusters_in_view_async(db, map_obj, zoom, (min_x, min_y, max_x, max_y), limit=limit)
+    return ListLocationClusterResponse(items=[
+        LocationClusterResponse(zoom=c.zoom, cell_x=c.cell_x, cell_y=c.cell_y, count=c.count,
+                                x=c.sum_x / c.count, y=c.sum_y / c.count, location_ids=c.location_ids)
+        for c in cells
+    ], truncated=truncated)
+
 @router.get("/{location_id}", response_model=LocationResponse)
 def get_location_endpoint(location_id: UUID, db: Session = Depends(get_db)):
     location = get_location_by_id(db=db, location_id=location_id)
@@ -43,6 +104,8 @@ def update_location_endpoint(location_id: UUID,
     location = update_location(db=db, location_id=location_id, location_in=data)
     if not location:
         raise HTTPException(status_code=404, detail="Location not found")
+    if data.name is not None or data.description_md is not None:
+        schedule_refresh(get_redis(), location.map_id)
     return location
 
 @router.delete("/{location_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -52,7 +115,9 @@ def delete_location_endpoint(location_id: UUID,
     user_id = UUID(user_id)
     if not is_location_owned_by_user(db, user_id, location_id):
         raise HTTPException(status_code=404, detail="Location not owned by user")
+    map_id = get_location_by_id(db=db, location_id=location_id).map_id
     success = delete_location(db=db, location_id=location_id)
     if not success:
         raise HTTPException(status_code=404, detail="Location not found")
+    schedule_refresh(get_redis(), map_id)
     return
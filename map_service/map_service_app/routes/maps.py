@@ -1,21 +1,41 @@
-import os
-import shutil
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Header, Query
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Header, Query, Path
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, Response
+from typing import Optional, Literal
 from sqlalchemy.orm import Session
-from uuid import UUID
-from redis import Redis
-from rq import Queue
-
-from map_service_app.crud import (create_map, update_map, delete_map, get_map_by_id, get_maps_by_owner,
-                                  is_map_owned_by_user, list_maps_catalog, list_tags, get_map_by_share_id,
-                                  update_map_tiles_info, create_share, delete_share)
-from map_service_app.schemas import (MapCreate, MapUpdate, ListMapCardResponse, MapResponse, TagStatResponse, TilesInfo,
-                                     ShareIdResponse)
-from map_service_app.database import get_db
-from map_service_app.config import REDIS_URL, SOURCE_IMAGES_PATH, TILES_BASE_PATH, TILE_SERVICE_TASK
+from sqlalchemy.ext.asyncio import AsyncSession
+from uuid import UUID, uuid4
+from datetime import timedelta
+import logging
+import httpx
+from rq import Callback, Queue
+
+from map_service_app.crud import (create_map, update_map, delete_map, get_map_by_id, is_map_owned_by_user,
+                                  update_map_tiles_info, update_map_tiles_recompressed, create_share, delete_share,
+                                  get_locations_by_map_id, clone_map, update_map_tiles_archived,
+                                  update_map_tiles_rehydrated, get_map_by_id_async, get_map_by_share_id_async,
+                                  is_map_owned_by_user_async, touch_map_viewed_async, get_maps_by_owner_async,
+                                  list_maps_catalog_async, list_tags_async)
+from map_service_app.schemas import (MapCreate, MapClone, MapUpdate, ListMapCardResponse, MapResponse, TagStatResponse,
+                                     TilesInfo, TilesRecompressed, TilesArchived, TilesRehydrated, ShareIdResponse,
+                                     ExportResponse)
+from map_service_app.database import get_db, get_async_db
+from map_service_app.redis_client import get_redis, get_async_redis
+from map_service_app.config import (TILE_SERVICE_TASK, TILE_SERVICE_REFUND, ESTIMATE_HEADER_BYTES,
+                                    EXPORT_DEFAULT_DIM, EXPORT_MAX_DIM, TILE_SERVICE_URL, VIEW_TOUCH_SECONDS)
+from map_service_app.admission import AdmissionRejected, request_estimate, admit_tiling_job, refund_tiling_job
+from map_service_app.storage import get_source_storage, get_tile_storage
+from map_service_app.validation import InvalidImage, check_png_header, PngChunkReader
+from map_service_app.dedup import (hash_upload, find_pyramid, reuse_pyramid, rq_enqueue_link, publish_pyramid,
+                                   release_pyramid)
+from map_service_app.tiering import discard_archive, request_rehydrate
+from map_service_app.catalog_cache import (CATALOG, TAGS, namespace_version, cache_key, catalog_filters,
+                                           catalog_count_key, get_cached, set_cached, get_cached_count, cache_count,
+                                           card_state, invalidate_for)
+from map_service_app.export import EXPORT_MEDIA_TYPES, request_export, export_key, tiles_version
 
 router = APIRouter()
+logger = logging.getLogger("map_service")
 
 
 @router.post("/create", response_model=MapResponse)
@@ -27,17 +47,20 @@ def create_map_endpoint(map_data: MapCreate,
         map_obj = create_map(db, user_id, map_data)
     except (ValueError, RuntimeError) as e:
         raise HTTPException(status_code=400, detail=str(e))
+    invalidate_for(get_redis(), card_state(None), card_state(map_obj))
     return map_obj
 
 
 @router.get("/all", response_model=ListMapCardResponse)
-def get_all_maps_endpoint(
+async def get_all_maps_endpoint(
         page: int = Query(1, alias="page", ge=1),
         size: int = Query(10, alias="size", ge=1, le=100),
         q: Optional[str] = Query(None, alias="q"),
         tags: Optional[str] = Query(None, alias="tags"),
         tags_mode: str = Query("any", alias="tags_mode"),
-        db: Session = Depends(get_db)):
+        cursor: Optional[str] = Query(None, alias="cursor", max_length=512),
+        db: AsyncSession = Depends(get_async_db)):
+    # A cursor from a previous page takes precedence over the page number.
     offset = (page - 1) * size
 
     tag_names: list[str] = []
@@ -48,56 +71,87 @@ def get_all_maps_endpoint(
         raise HTTPException(status_code=400, detail="Invalid tags_mode. Must be 'any' or 'all'.")
 
     try:
-        maps, total = list_maps_catalog(
+        redis_conn = get_async_redis()
+        version = await namespace_version(redis_conn, CATALOG)
+        page_key = cache_key(CATALOG, version, "page",
+                             [catalog_filters(q, tag_names, tags_mode), cursor or offset, size])
+        cached_page = await get_cached(redis_conn, page_key)
+        if cached_page is not None:
+            return cached_page
+
+        count_key = catalog_count_key(version, q, tag_names, tags_mode)
+        cached_total = await get_cached_count(redis_conn, count_key)
+        maps, total, next_cursor = await list_maps_catalog_async(
             db,
             q=q,
             tags=tag_names,
             tags_mode=tags_mode,
             offset=offset,
-            limit=size
+            limit=size,
+            cursor=cursor,
+            total=cached_total,
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    return ListMapCardResponse(total=total, items=maps)
+    # Cursor pages report the total their first page counted.
+    exact = cached_total is None and cursor is None
+    if exact:
+        await cache_count(redis_conn, count_key, total)
+    response = ListMapCardResponse(total=total, total_exact=exact, items=maps, next_cursor=next_cursor)
+    await set_cached(redis_conn, page_key, response.model_dump(mode="json"))
+    return response
 
 
 @router.get("/owned", response_model=ListMapCardResponse)
-def get_owned_maps_endpoint(
+async def get_owned_maps_endpoint(
         page: int = Query(1, alias="page", ge=1),
         size: int = Query(10, alias="size", ge=1, le=100),
+        cursor: Optional[str] = Query(None, alias="cursor", max_length=512),
         owner_id: UUID = Header(..., alias="X-User-Id"),
-        db: Session = Depends(get_db)):
+        db: AsyncSession = Depends(get_async_db)):
     offset = (page - 1) * size
-    maps, total = get_maps_by_owner(db, owner_id, offset=offset, limit=size)
-    return ListMapCardResponse(total=total, items=maps)
+    try:
+        maps, total, next_cursor = await get_maps_by_owner_async(db, owner_id, offset=offset, limit=size, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ListMapCardResponse(total=total, total_exact=cursor is None, items=maps, next_cursor=next_cursor)
 
 
 @router.get("/tags", response_model=list[TagStatResponse])
-def list_tags_endpoint(
+async def list_tags_endpoint(
     q: Optional[str] = Query(None, alias="q"),
     limit: int = Query(50, alias="limit", ge=1, le=200),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    rows = list_tags(db, q=q, limit=limit)
-    return [TagStatResponse(name=name, count=int(count)) for name, count in rows]
+    redis_conn = get_async_redis()
+    key = cache_key(TAGS, await namespace_version(redis_conn, TAGS), "list", [(q or "").strip(), limit])
+    cached = await get_cached(redis_conn, key)
+    if cached is not None:
+        return cached
+
+    rows = await list_tags_async(db, q=q, limit=limit)
+    response = [TagStatResponse(name=name, count=int(count)) for name, count in rows]
+    await set_cached(redis_conn, key, [tag.model_dump() for tag in response])
+    return response
 
 
 @router.get("/share/{share_id}", response_model=MapResponse)
-def get_map_by_share_id_endpoint(share_id: str, db: Session = Depends(get_db)):
-    map_obj = get_map_by_share_id(db, share_id)
+async def get_map_by_share_id_endpoint(share_id: str, db: AsyncSession = Depends(get_async_db)):
+    map_obj = await get_map_by_share_id_async(db, share_id)
     if not map_obj:
         raise HTTPException(status_code=404, detail="Shared map not found")
+    await touch_map_viewed_async(db, map_obj.id, timedelta(seconds=VIEW_TOUCH_SECONDS))
     return map_obj
 
 
 @router.get("/{map_id}", response_model=MapResponse)
-def get_map_endpoint(
+async def get_map_endpoint(
         map_id: UUID,
         user_id: Optional[str] = Header(None, alias="X-User-Id"),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    map_obj = get_map_by_id(db, map_id)
+    map_obj = await get_map_by_id_async(db, map_id)
     if not map_obj:
         raise HTTPException(status_code=404, detail="Map not found")
 
@@ -105,12 +159,13 @@ def get_map_endpoint(
 
     if user_id:
         user_id = UUID(user_id)
-        if is_map_owned_by_user(db, user_id, map_id):
+        if await is_map_owned_by_user_async(db, user_id, map_id):
             is_owner = True
 
     if map_obj.visibility != "public" and not is_owner:
         raise HTTPException(status_code=404, detail="Map not found")
 
+    await touch_map_viewed_async(db, map_id, timedelta(seconds=VIEW_TOUCH_SECONDS))
     return map_obj
 
 
@@ -124,12 +179,14 @@ def update_map_endpoint(map_id: UUID,
     if not is_map_owned_by_user(db, user_id, map_id):
         raise HTTPException(status_code=403, detail="You do not own this map")
 
+    before = card_state(get_map_by_id(db, map_id))
     try:
         map_obj = update_map(db, map_id, data)
         if not map_obj:
             raise HTTPException(status_code=404, detail="Map not found")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    invalidate_for(get_redis(), before, card_state(map_obj))
     return map_obj
 
 
@@ -141,17 +198,19 @@ def delete_map_endpoint(map_id: UUID,
     if not is_map_owned_by_user(db, user_id, map_id):
         raise HTTPException(status_code=403, detail="You do not own this map")
 
+    map_obj = get_map_by_id(db, map_id)
+    before = card_state(map_obj)
+    if map_obj:
+        release_pyramid(db, map_obj)
+
     deleted = delete_map(db, map_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Map not found")
+    invalidate_for(get_redis(), before, card_state(None))
 
-    tiles_dir = os.path.join(TILES_BASE_PATH, str(map_id))
-    if os.path.isdir(tiles_dir):
-        shutil.rmtree(tiles_dir)
-
-    src_dir = os.path.join(SOURCE_IMAGES_PATH, str(map_id))
-    if os.path.isdir(src_dir):
-        shutil.rmtree(src_dir)
+    get_tile_storage().delete_prefix(str(map_id))
+    get_source_storage().delete_prefix(str(map_id))
+    discard_archive(map_id)
 
     return
 
@@ -174,18 +233,65 @@ async def upload_image_endpoint(map_id: UUID,
     if file.content_type != "image/png":
         raise HTTPException(status_code=400, detail="Only PNG images are supported")
 
-    save_dir = os.path.join(SOURCE_IMAGES_PATH, str(map_id))
-    os.makedirs(save_dir, exist_ok=True)
-    save_path = os.path.join(save_dir, "source.png")
-
-    with open(save_path, mode="wb") as f:
-        f.write(await file.read())
+    header = await file.read(ESTIMATE_HEADER_BYTES)
+    await file.seek(0)
+    try:
+        check_png_header(header)
+    except InvalidImage as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    # Checked and hashed before anything is stored or charged: a corrupt
+    # upload never replaces the stored image, and one that has been tiled
+    # before in the current format gets that pyramid linked in without
+    # going through admission.
+    try:
+        digest = await run_in_threadpool(hash_upload, PngChunkReader(file.file))
+    except InvalidImage as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    await file.seek(0)
+
+    # Admission (a WATCH/MULTI retry loop), refunds and enqueueing are
+    # blocking Redis round trips, so they go to the threadpool as well.
+    redis_conn = get_redis()
+
+    async def admit():
+        try:
+            estimate = await request_estimate(header)
+            return (estimate, *await run_in_threadpool(admit_tiling_job, redis_conn, user_id, estimate))
+        except AdmissionRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    charge = None
+    if await run_in_threadpool(find_pyramid, db, digest) is None:
+        estimate, queue_name, charge = await admit()
 
-    redis_conn = Redis.from_url(REDIS_URL)
-    q = Queue(connection=redis_conn)
-    q.enqueue(TILE_SERVICE_TASK, map_id)
+    try:
+        await run_in_threadpool(get_source_storage().save_upload, f"{map_id}/source.png", file.file)
+    except Exception:
+        if charge is not None:
+            await run_in_threadpool(refund_tiling_job, redis_conn, charge)
+        raise
+
+    pyramid = await run_in_threadpool(reuse_pyramid, db, map_obj, digest)
+    if pyramid is not None:
+        if charge is not None:
+            await run_in_threadpool(refund_tiling_job, redis_conn, charge)
+        await run_in_threadpool(rq_enqueue_link, redis_conn, map_id, pyramid)
+        return {"status": "image uploaded", "task": "linking existing tiles"}
+
+    if charge is None:
+        # The pyramid went away between the lookup and the claim.
+        estimate, queue_name, charge = await admit()
+
+    q = Queue(name=queue_name, connection=redis_conn)
+    try:
+        await run_in_threadpool(q.enqueue, TILE_SERVICE_TASK, map_id, meta={"tiling_charge": charge},
+                                on_failure=Callback(TILE_SERVICE_REFUND))
+    except Exception:
+        await run_in_threadpool(refund_tiling_job, redis_conn, charge)
+        raise
 
-    return {"status": "image uploaded", "task": "tile generation started"}
+    return {"status": "image uploaded", "task": "tile generation started", "queue": queue_name, "estimate": estimate}
 
 
 @router.post("/{map_id}/tiles_info", status_code=status.HTTP_202_ACCEPTED)
@@ -195,6 +301,38 @@ def tiles_info_endpoint(map_id: UUID, info: TilesInfo, db: Session = Depends(get
     if not updated:
         raise HTTPException(status_code=404, detail="Map not found")
 
+    # New tiles bump updated_at, which orders the catalog.
+    state = card_state(updated)
+    invalidate_for(get_redis(), state, state)
+    return
+
+
+@router.post("/{map_id}/tiles_recompressed", status_code=status.HTTP_202_ACCEPTED)
+def tiles_recompressed_endpoint(map_id: UUID, info: TilesRecompressed, db: Session = Depends(get_db)):
+    updated = update_map_tiles_recompressed(db, map_id, info)
+
+    if not updated:
+        raise HTTPException(status_code=404, detail="Map not found")
+
+    state = card_state(updated)
+    invalidate_for(get_redis(), state, state)
+    publish_pyramid(db, updated)
+
+    return
+
+
+@router.post("/{map_id}/tiles_archived", status_code=status.HTTP_202_ACCEPTED)
+def tiles_archived_endpoint(map_id: UUID, info: TilesArchived, db: Session = Depends(get_db)):
+    if not update_map_tiles_archived(db, map_id, info):
+        raise HTTPException(status_code=404, detail="Map not found")
+    return
+
+
+@router.post("/{map_id}/tiles_rehydrated", status_code=status.HTTP_202_ACCEPTED)
+def tiles_rehydrated_endpoint(map_id: UUID, info: TilesRehydrated, db: Session = Depends(get_db)):
+    if not update_map_tiles_rehydrated(db, map_id):
+        raise HTTPException(status_code=404, detail="Map not found")
+    logger.info("map %s rehydrated %.3fs after first request", map_id, info.seconds)
     return
 
 
@@ -249,4 +387,125 @@ def get_share_id_endpoint(
     if not map_obj:
         raise HTTPException(status_code=404, detail="Map not found")
 
-    return ShareIdResponse(share_id=map_obj.share_id)
\ No newline at end of file
+    return ShareIdResponse(share_id=map_obj.share_id)
+
+def get_visible_map(db: Session, map_id: UUID, user_id: Optional[str]):
+    map_obj = get_map_by_id(db, map_id)
+    if not map_obj:
+        raise HTTPException(status_code=404, detail="Map not found")
+
+    if map_obj.visibility != "public" and not (user_id and is_map_owned_by_user(db, UUID(user_id), map_id)):
+        raise HTTPException(status_code=404, detail="Map not found")
+
+    return map_obj
+
+
+@router.post("/{map_id}/clone", response_model=MapResponse)
+def clone_map_endpoint(map_id: UUID,
+                       data: MapClone,
+                       user_id: str = Header(..., alias="X-User-Id"),
+                       db: Session = Depends(get_db)):
+    source = get_visible_map(db, map_id, user_id)
+    if source.ready_zoom is not None and source.ready_zoom < source.max_zoom:
+        raise HTTPException(status_code=409, detail="Map is still being tiled")
+    if source.tiles_archived_at is not None:
+        request_rehydrate(get_redis(), str(map_id))
+        raise HTTPException(status_code=409, detail="Map tiles are being restored, try again shortly")
+
+    # The clone gets links to the original's tiles and source image rather
+    # than a re-tile; uploading a new image replaces them for the clone only.
+    clone_id = uuid4()
+    tile_storage, source_storage = get_tile_storage(), get_source_storage()
+    try:
+        if source.width:
+            tile_storage.link_prefix(str(map_id), str(clone_id))
+            source_storage.link(f"{map_id}/source.png", f"{clone_id}/source.png")
+        clone = clone_map(db, source, clone_id, UUID(user_id), data)
+    except Exception:
+        db.rollback()
+        tile_storage.delete_prefix(str(clone_id))
+        source_storage.delete_prefix(str(clone_id))
+        raise
+    invalidate_for(get_redis(), card_state(None), card_state(clone))
+    return clone
+
+
+@router.post("/{map_id}/export", response_model=ExportResponse)
+def export_map_endpoint(map_id: UUID,
+                        format: Literal["png", "pdf"] = Query("png"),
+                        max_dim: int = Query(EXPORT_DEFAULT_DIM, ge=256, le=EXPORT_MAX_DIM),
+                        user_id: Optional[str] = Header(None, alias="X-User-Id"),
+                        db: Session = Depends(get_db)):
+    map_obj = get_visible_map(db, map_id, user_id)
+    if not map_obj.width:
+        raise HTTPException(status_code=409, detail="Map has no tiles yet")
+
+    locations = get_locations_by_map_id(db, map_id)
+    return request_export(get_redis(), get_source_storage(), map_obj, locations, format, max_dim)
+
+
+@router.get("/{map_id}/export/{name}")
+def download_export_endpoint(map_id: UUID,
+                             name: str = Path(..., pattern=r"^[0-9a-f]{16}-\d+\.(png|pdf)$"),
+                             user_id: Optional[str] = Header(None, alias="X-User-Id"),
+                             db: Session = Depends(get_db)):
+    get_visible_map(db, map_id, user_id)
+
+    storage = get_source_storage()
+    key = export_key(map_id, name)
+    if not storage.exists(key):
+        raise HTTPException(status_code=404, detail="Export not found")
+
+    fmt = name.rsplit(".", 1)[1]
+    return StreamingResponse(
+        storage.iter_bytes(key),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="map-{map_id}.{fmt}"'},
+    )
+
+
+@router.get("/{map_id}/extract")
+async def extract_region_endpoint(map_id: UUID,
+                                  bbox: str = Query(...),
+                                  width: Optional[int] = Query(None, ge=1),
+                                  height: Optional[int] = Query(None, ge=1),
+                                  format: Literal["png", "webp", "jpeg"] = Query("png"),
+                                  quality: int = Query(85, ge=1, le=100),
+                                  user_id: Optional[str] = Header(None, alias="X-User-Id"),
+                                  db: Session = Depends(get_db)):
+    map_obj = get_visible_map(db, map_id, user_id)
+    if not map_obj.width:
+        raise HTTPException(status_code=409, detail="Map has no tiles yet")
+
+    params = {
+        "bbox": bbox,
+        "format": format,
+        "quality": quality,
+        "src_width": map_obj.width,
+        "src_height": map_obj.height,
+        "max_zoom": map_obj.max_zoom,
+        "version": tiles_version(map_obj),
+    }
+    if width is not None:
+        params["width"] = width
+    if height is not None:
+        params["height"] = height
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        try:
+            response = await client.get(f"{TILE_SERVICE_URL}/extract/{map_id}", params=params)
+        except httpx.RequestError:
+            raise HTTPException(status_code=503, detail="Tile service unavailable")
+
+    if response.status_code != 200:
+        try:
+            detail = response.json().get("detail")
+        except ValueError:
+            detail = response.text
+        raise HTTPException(status_code=response.status_code, detail=detail)
+
+    return Response(
+        content=response.content,
+        media_type=response.headers["content-type"],
+        headers={k: response.headers[k] for k in ("etag", "cache-control") if k in response.headers},
+    )
@@ -0,0 +1,26 @@
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from map_service_app.config import METRICS_TOKEN
+
+from map_service_app.database import engine, async_engine
+from map_service_app.redis_client import redis_pool_stats
+
+router = APIRouter()
+
+
+def require_metrics_token(token: Optional[str] = Header(None, alias="X-Metrics-Token")) -> None:
+    # Pool internals are for the scraper only; without METRICS_TOKEN the
+    # endpoint is off.
+    if not METRICS_TOKEN or token is None or not secrets.compare_digest(token, METRICS_TOKEN):
+        raise HTTPException(status_code=403, detail="Metrics token required")
+
+
+@router.get("", dependencies=[Depends(require_metrics_token)])
+def pool_metrics_endpoint():
+    return {
+        "db": {"sync": engine.pool.stats(), "async": async_engine.pool.stats()},
+        "redis": redis_pool_stats(),
+    }
@@ -4,7 +4,7 @@ from datetime import datetime
 from typing import Optional, List, Dict, Any, Literal
 
 from map_service_app.models import Tag
-from map_service_app.config import DESCRIPTION_MAX_LENGTH
+from map_service_app.config import DESCRIPTION_MAX_LENGTH, TIERING_IDLE_DAYS, TIERING_BATCH
 
 
 Visibility = Literal["private", "public"]
@@ -18,6 +18,12 @@ class MapCreate(BaseModel):
     visibility: Visibility = "private"
 
 
+class MapClone(BaseModel):
+    owner_username: str
+    title: Optional[str] = None
+    visibility: Visibility = "private"
+
+
 class MapUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
@@ -44,6 +50,8 @@ class MapCardResponse(BaseModel):
 class ListMapCardResponse(BaseModel):
     items: List[MapCardResponse]
     total: int
+    total_exact: bool = True
+    next_cursor: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -60,6 +68,7 @@ class MapResponse(BaseModel):
     width: int
     height: int
     max_zoom: int
+    ready_zoom: Optional[int] = None
     visibility: Visibility
     share_id: Optional[str] = None
     created_at: datetime
@@ -77,9 +86,60 @@ class TilesInfo(BaseModel):
     width: int
     height: int
     max_zoom: int
+    ready_zoom: Optional[int] = None
+    tile_format: Optional[str] = None
     tiles_path: str
 
 
+class TilesRecompressed(BaseModel):
+    tiles: int
+    bytes_saved: int
+
+
+class TilesArchived(BaseModel):
+    tiles: int
+    bytes_reclaimed: int
+    archive_bytes: int
+
+
+class TilesRehydrated(BaseModel):
+    seconds: float
+
+
+class TieringCreate(BaseModel):
+    idle_days: int = Field(default=TIERING_IDLE_DAYS, ge=1)
+    limit: int = Field(default=TIERING_BATCH, ge=1, le=100000)
+
+
+class TieringResponse(BaseModel):
+    idle_before: datetime
+    enqueued: int
+
+
+class RetileCreate(BaseModel):
+    all: bool = False
+    owner_id: Optional[UUID] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    not_format: Optional[str] = None
+    run_id: Optional[str] = Field(default=None, pattern=r"^[A-Za-z0-9_.-]{1,64}$")
+    share: Optional[float] = Field(default=None, gt=0, le=1)
+
+
+class RetileProgress(BaseModel):
+    run_id: str
+    status: str
+    filters: Dict[str, Any]
+    total: int
+    done: int
+    failed: int
+    in_flight: int
+    remaining: int
+    failures: Dict[str, str]
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
 class LocationCreate(BaseModel):
     map_id: UUID
     type: str
@@ -111,6 +171,33 @@ class LocationResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ListLocationResponse(BaseModel):
+    items: List[LocationResponse]
+    next_cursor: Optional[str] = None
+
+
+class LocationClusterResponse(BaseModel):
+    zoom: int
+    cell_x: int
+    cell_y: int
+    count: int
+    x: float
+    y: float
+    location_ids: List[UUID]
+
+
+class ListLocationClusterResponse(BaseModel):
+    items: List[LocationClusterResponse]
+    # More cells touch the box than were returned (the densest ones are).
+    truncated: bool = False
+
+
+class ExportResponse(BaseModel):
+    status: Literal["ready", "pending"]
+    url: str
+    detail: Optional[str] = None
+
+
 class TagStatResponse(BaseModel):
     name: str
     count: int
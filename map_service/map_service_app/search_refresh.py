@@ -0,0 +1,113 @@
+import argparse
+import json
+import logging
+from datetime import timedelta
+from uuid import UUID
+
+from redis.exceptions import RedisError
+from rq import Queue, Retry, get_current_job
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from map_service_app.catalog_cache import card_state, invalidate_for
+from map_service_app.config import MAP_JOBS_QUEUE, SEARCH_REFRESH_DELAY_SECONDS
+from map_service_app.crud import get_map_by_id, refresh_search_vector, search_vector_update
+from map_service_app.models import Map
+
+logger = logging.getLogger("map_service")
+
+
+def refresh_lock_key(map_id) -> str:
+    return f"search:refresh:{map_id}"
+
+
+def rq_enqueue_refresh(redis_conn, map_id: str) -> None:
+    Queue(name=MAP_JOBS_QUEUE, connection=redis_conn).enqueue_in(
+        timedelta(seconds=SEARCH_REFRESH_DELAY_SECONDS),
+        refresh_task,
+        map_id,
+        retry=Retry(max=3, interval=[10, 30, 60]),
+        description=f"refresh search vector of map {map_id}",
+    )
+
+
+def schedule_refresh(redis_conn, map_id, enqueue=rq_enqueue_refresh) -> bool:
+    # Location edits rebuild the map's search vector (all of its location
+    # text) on a map worker, once per SEARCH_REFRESH_DELAY_SECONDS however
+    # many edits land in between. The lock outlives the delay, so a lost job
+    # holds refreshes back for a while rather than for good.
+    key = refresh_lock_key(map_id)
+    try:
+        if not redis_conn.set(key, "1", nx=True, ex=2 * SEARCH_REFRESH_DELAY_SECONDS + 60):
+            return False
+        try:
+            enqueue(redis_conn, str(map_id))
+        except Exception:
+            redis_conn.delete(key)
+            raise
+    except RedisError:
+        logger.warning("could not schedule a search refresh for map %s", map_id, exc_info=True)
+        return False
+    return True
+
+
+def refresh_map(db, redis_conn, map_id: UUID) -> None:
+    db_map = get_map_by_id(db, map_id)
+    if db_map is None:
+        return
+    refresh_search_vector(db, map_id)
+    db.commit()
+    # Location text is searchable, so cached catalog pages of a public map
+    # may change.
+    state = card_state(db_map)
+    invalidate_for(redis_conn, state, state)
+
+
+def refresh_task(map_id: str) -> None:
+    # The lock goes first, so edits made while this job runs schedule one
+    # more refresh instead of being missed.
+    redis_conn = get_current_job().connection
+    redis_conn.delete(refresh_lock_key(map_id))
+
+    from map_service_app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        refresh_map(db, redis_conn, UUID(map_id))
+    finally:
+        db.close()
+
+
+def backfill_search_vectors(db: Session, batch: int = 500) -> int:
+    # Builds the vectors of maps written before the column existed, one
+    # batch; returns how many were built. Postgres only.
+    map_ids = db.scalars(select(Map.id).where(Map.search_vector.is_(None)).limit(batch)).all()
+    if map_ids:
+        db.execute(search_vector_update(Map.id.in_(map_ids)))
+    return len(map_ids)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m map_service_app.search_refresh",
+                                     description="Build the search vectors of maps written before catalog search.")
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    from map_service_app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        built = 0
+        while True:
+            n = backfill_search_vectors(db, args.batch)
+            db.commit()
+            built += n
+            if n < args.batch:
+                break
+    finally:
+        db.close()
+    print(json.dumps({"built": built}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
+from typing import BinaryIO
+
+from map_service_app.config import (STORAGE_BACKEND, SOURCE_IMAGES_PATH, TILES_BASE_PATH, S3_ENDPOINT_URL,
+                                    S3_ACCESS_KEY, S3_SECRET_KEY, S3_REGION, S3_SOURCES_BUCKET, S3_TILES_BUCKET,
+                                    S3_MULTIPART_CHUNK, S3_UPLOAD_CONCURRENCY)
+
+S3_DELETE_BATCH = 1000
+COPY_CHUNK = 1024 * 1024
+
+
+class LocalStorage:
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def save_upload(self, key: str, fileobj: BinaryIO) -> int:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f"{path}.part"
+        try:
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(fileobj, f, COPY_CHUNK)
+                size = f.tell()
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        return size
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def iter_bytes(self, key: str, chunk_size: int = COPY_CHUNK):
+        with open(self.path(key), "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def link(self, src_key: str, dst_key: str) -> None:
+        # Hardlinks share the file's blocks. Every writer replaces files
+        # instead of writing into them, so a linked copy stays copy-on-write.
+        dst = self.path(dst_key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.part"
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(self.path(src_key), tmp)
+        except OSError:
+            shutil.copy2(self.path(src_key), tmp)
+        os.replace(tmp, dst)
+
+    def link_prefix(self, src_prefix: str, dst_prefix: str) -> int:
+        base = self.path(src_prefix)
+        count = 0
+        for dirpath, _, files in os.walk(base):
+            rel = os.path.relpath(dirpath, base)
+            for name in files:
+                if name.endswith(".part"):
+                    continue
+                key = os.path.normpath(os.path.join(rel, name))
+                self.link(os.path.join(src_prefix, key), os.path.join(dst_prefix, key))
+                count += 1
+        return count
+
+    def delete_prefix(self, prefix: str) -> int:
+        path = self.path(prefix)
+        if not os.path.isdir(path):
+            return 0
+        count = sum(len(files) for _, _, files in os.walk(path))
+        shutil.rmtree(path)
+        return count
+
+
+class S3Storage:
+    def __init__(self, client, bucket: str, part_size: int = S3_MULTIPART_CHUNK,
+                 concurrency: int = S3_UPLOAD_CONCURRENCY):
+        self.client = client
+        self.bucket = bucket
+        self.part_size = part_size
+        self.concurrency = concurrency
+
+    def save_upload(self, key: str, fileobj: BinaryIO) -> int:
+        first = fileobj.read(self.part_size)
+        nxt = fileobj.read(self.part_size)
+        if not nxt:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=first)
+            return len(first)
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)["UploadId"]
+
+        def upload_part(number: int, data: bytes) -> dict:
+            resp = self.client.upload_part(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=data,
+            )
+            return {"PartNumber": number, "ETag": resp["ETag"]}
+
+        def chunks():
+            yield first
+            yield nxt
+            while chunk := fileobj.read(self.part_size):
+                yield chunk
+
+        size = 0
+        parts = []
+        pending = set()
+        try:
+            # Parts are read sequentially but sent in parallel; at most
+            # `concurrency` parts are held in memory at once.
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                for number, chunk in enumerate(chunks(), start=1):
+                    if len(pending) >= self.concurrency:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        parts.extend(f.result() for f in done)
+                    pending.add(pool.submit(upload_part, number, chunk))
+                    size += len(chunk)
+                parts.extend(f.result() for f in pending)
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+        parts.sort(key=lambda p: p["PartNumber"])
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts},
+        )
+        return size
+
+    def exists(self, key: str) -> bool:
+        resp = self.client.list_objects_v2(Bucket=self.bucket, Prefix=key, MaxKeys=1)
+        return any(obj["Key"] == key for obj in resp.get("Contents", []))
+
+    def iter_bytes(self, key: str, chunk_size: int = COPY_CHUNK):
+        body = self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+        try:
+            while chunk := body.read(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def link(self, src_key: str, dst_key: str) -> None:
+        # S3 has no links; a server-side copy at least keeps the bytes off
+        # this service.
+        self.client.copy({"Bucket": self.bucket, "Key": src_key}, self.bucket, dst_key)
+
+    def link_prefix(self, src_prefix: str, dst_prefix: str) -> int:
+        src_prefix = src_prefix.rstrip("/") + "/"
+        dst_prefix = dst_prefix.rstrip("/") + "/"
+        keys = self.list_keys(src_prefix)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(lambda k: self.link(k, dst_prefix + k[len(src_prefix):]), keys))
+        return len(keys)
+
+    def list_keys(self, prefix: str) -> list[str]:
+        keys = []
+        kwargs = {"Bucket": self.bucket, "Prefix": prefix}
+        while True:
+            resp = self.client.list_objects_v2(**kwargs)
+            keys.extend(obj["Key"] for obj in resp.get("Contents", []))
+            if not resp.get("IsTruncated"):
+                return keys
+            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+
+    def delete_prefix(self, prefix: str) -> int:
+        keys = self.list_keys(prefix.rstrip("/") + "/")
+        for i in range(0, len(keys), S3_DELETE_BATCH):
+            batch = keys[i:i + S3_DELETE_BATCH]
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True},
+            )
+        return len(keys)
+
+
+def make_s3_client():
+    import boto3
+
+    return boto3.client(
+        "s3",
+        endpoint_url=S3_ENDPOINT_URL,
+        aws_access_key_id=S3_ACCESS_KEY,
+        aws_secret_access_key=S3_SECRET_KEY,
+        region_name=S3_REGION,
+    )
+
+
+@lru_cache
+def get_source_storage():
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(make_s3_client(), S3_SOURCES_BUCKET)
+    return LocalStorage(SOURCE_IMAGES_PATH)
+
+
+@lru_cache
+def get_tile_storage():
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(make_s3_client(), S3_TILES_BUCKET)
+    return LocalStorage(TILES_BASE_PATH)
@@ -0,0 +1,104 @@
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from redis import Redis
+from rq import Queue
+from rq.job import JobStatus
+
+from map_service_app.config import (REDIS_URL, TILES_ARCHIVE_PATH, TILE_TIER_TASK, TIER_QUEUE, TIER_JOB_TIMEOUT, TIERING_IDLE_DAYS,
+                                    TIERING_BATCH, TILE_REHYDRATE_TASK, REHYDRATE_QUEUE, REHYDRATE_LOCK_SECONDS)
+from map_service_app.crud import select_idle_maps, mark_tiering_checked
+from map_service_app.jobs import rq_job_status
+
+logger = logging.getLogger("map_service")
+
+PENDING_STATUSES = {JobStatus.QUEUED, JobStatus.STARTED, JobStatus.DEFERRED, JobStatus.SCHEDULED}
+
+
+def tier_job_id(map_id) -> str:
+    return f"tier-{map_id}"
+
+
+def discard_archive(map_id) -> None:
+    # For maps deleted or given new tiles while in the cold tier.
+    if not TILES_ARCHIVE_PATH:
+        return
+    try:
+        os.remove(os.path.join(TILES_ARCHIVE_PATH, f"{map_id}.zip"))
+    except FileNotFoundError:
+        pass
+
+
+def rq_enqueue_tier(redis_conn, map_id: str) -> None:
+    Queue(name=TIER_QUEUE, connection=redis_conn).enqueue(
+        TILE_TIER_TASK,
+        map_id,
+        job_id=tier_job_id(map_id),
+        job_timeout=TIER_JOB_TIMEOUT,
+        description=f"move tiles of map {map_id} to the cold tier",
+    )
+
+
+def rq_enqueue_rehydrate(redis_conn, map_id: str, requested_at: float) -> None:
+    Queue(name=REHYDRATE_QUEUE, connection=redis_conn).enqueue(
+        TILE_REHYDRATE_TASK,
+        map_id,
+        requested_at,
+        description=f"rehydrate tiles of map {map_id}",
+    )
+
+
+def request_rehydrate(redis_conn, map_id: str, enqueue=rq_enqueue_rehydrate) -> bool:
+    # For requests that need a map's loose tiles (e.g. clones). Shares the
+    # tile API's lock, so the job is enqueued once whichever side asks first.
+    if not redis_conn.set(f"tiering:rehydrate:{map_id}", "1", nx=True, ex=REHYDRATE_LOCK_SECONDS):
+        return False
+    enqueue(redis_conn, map_id, time.time())
+    return True
+
+
+def enqueue_idle_maps(db, redis_conn, idle_days: int = TIERING_IDLE_DAYS, limit: int = TIERING_BATCH,
+                      enqueue=rq_enqueue_tier, job_status=rq_job_status) -> tuple[datetime, int]:
+    # Maps not viewed (or, never viewed, not created) since the cutoff have
+    # their pyramids packed into an archive by the tile workers; the archive
+    # is unpacked again on the first tile request. Meant to run from cron.
+    # Picked maps are marked, so those the job leaves loose (nothing to
+    # reclaim) do not hold up the rest of the batch on later runs.
+    idle_before = datetime.now(timezone.utc) - timedelta(days=idle_days)
+    enqueued = 0
+    map_ids = select_idle_maps(db, idle_before, limit)
+    for map_id in map_ids:
+        status, _ = job_status(redis_conn, tier_job_id(map_id))
+        if status in PENDING_STATUSES:
+            continue
+        enqueue(redis_conn, str(map_id))
+        enqueued += 1
+    if map_ids:
+        mark_tiering_checked(db, map_ids)
+    return idle_before, enqueued
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m map_service_app.tiering",
+                                     description="Move the tiles of idle maps to the cold tier.")
+    parser.add_argument("--idle-days", type=int, default=TIERING_IDLE_DAYS)
+    parser.add_argument("--limit", type=int, default=TIERING_BATCH)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    from map_service_app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        idle_before, enqueued = enqueue_idle_maps(db, Redis.from_url(REDIS_URL), args.idle_days, args.limit)
+    finally:
+        db.close()
+    print(json.dumps({"idle_before": idle_before.isoformat(), "enqueued": enqueued}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import struct
+import zlib
+from typing import BinaryIO
+
+from map_service_app.config import UPLOAD_MAX_SIDE, UPLOAD_MAX_PIXELS, UPLOAD_MAX_BIT_DEPTH, UPLOAD_ALLOW_INTERLACED
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_MAX_CHUNK = 2 ** 31 - 1
+CRITICAL_CHUNKS = {b"IHDR", b"PLTE", b"IDAT", b"IEND"}
+# Bit depths the PNG spec allows for each colour type.
+BIT_DEPTHS = {0: (1, 2, 4, 8, 16), 2: (8, 16), 3: (1, 2, 4, 8), 4: (8, 16), 6: (8, 16)}
+
+
+class InvalidImage(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def parse_ihdr(data: bytes) -> dict:
+    if len(data) != 13:
+        raise InvalidImage(400, "Corrupt PNG header")
+    width, height, bit_depth, color_type, compression, filter_method, interlace = struct.unpack("!IIBBBBB", data)
+    if not width or not height or width > PNG_MAX_CHUNK or height > PNG_MAX_CHUNK:
+        raise InvalidImage(400, "Corrupt PNG header")
+    if bit_depth not in BIT_DEPTHS.get(color_type, ()):
+        raise InvalidImage(400, "Corrupt PNG header")
+    if compression != 0 or filter_method != 0 or interlace not in (0, 1):
+        raise InvalidImage(400, "Corrupt PNG header")
+    return {"width": width, "height": height, "bit_depth": bit_depth, "color_type": color_type,
+            "interlaced": interlace == 1}
+
+
+def check_png_header(header: bytes) -> dict:
+    # Only the signature and IHDR are read: no pixels are decoded.
+    if header[:8] != PNG_SIGNATURE:
+        raise InvalidImage(400, "Not a PNG image")
+    if len(header) < 33 or header[8:16] != b"\x00\x00\x00\x0dIHDR":
+        raise InvalidImage(400, "Corrupt PNG header")
+    if zlib.crc32(header[12:29]) != struct.unpack("!I", header[29:33])[0]:
+        raise InvalidImage(400, "Corrupt PNG header")
+
+    info = parse_ihdr(header[16:29])
+    if max(info["width"], info["height"]) > UPLOAD_MAX_SIDE:
+        raise InvalidImage(413, f"Images are limited to {UPLOAD_MAX_SIDE}px per side")
+    if info["width"] * info["height"] > UPLOAD_MAX_PIXELS:
+        raise InvalidImage(413, f"Images are limited to {UPLOAD_MAX_PIXELS} pixels")
+    if info["bit_depth"] > UPLOAD_MAX_BIT_DEPTH:
+        raise InvalidImage(400, f"Images are limited to {UPLOAD_MAX_BIT_DEPTH} bits per channel")
+    if info["interlaced"] and not UPLOAD_ALLOW_INTERLACED:
+        raise InvalidImage(400, "Interlaced PNGs are not supported")
+    return info
+
+
+class PngChunkReader:
+    # Wraps an upload and walks its chunk structure as it is read: lengths,
+    # CRCs, chunk order and a final IEND. Pixel data is only checksummed,
+    # never inflated. Errors are raised from read(), so a storage backend
+    # copying from this reader aborts before anything replaces the old file.
+
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        self.state = "signature"
+        self.buf = b""
+        self.kind = None
+        self.last_kind = None
+        self.remaining = 0
+        self.crc = 0
+        self.ihdr_data = b""
+        self.ihdr = None
+        self.has_plte = False
+        self.has_idat = False
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        if data:
+            self._feed(memoryview(data))
+        elif self.state != "done":
+            raise InvalidImage(400, "Truncated PNG image")
+        return data
+
+    def _field(self, view: memoryview, size: int):
+        # Collects a fixed-size field that may straddle reads.
+        n = size - len(self.buf)
+        self.buf += bytes(view[:n])
+        if len(self.buf) < size:
+            return None, view[len(view):]
+        field, self.buf = self.buf, b""
+        return field, view[n:]
+
+    def _feed(self, view: memoryview) -> None:
+        while view:
+            if self.state == "signature":
+                field, view = self._field(view, 8)
+                if field is not None:
+                    if field != PNG_SIGNATURE:
+                        raise InvalidImage(400, "Not a PNG image")
+                    self.state = "header"
+            elif self.state == "header":
+                field, view = self._field(view, 8)
+                if field is not None:
+                    self._start_chunk(*struct.unpack("!I4s", field))
+            elif self.state == "data":
+                part = view[:self.remaining]
+                self.crc = zlib.crc32(part, self.crc)
+                if self.kind == b"IHDR":
+                    self.ihdr_data += bytes(part)
+                self.remaining -= len(part)
+                view = view[len(part):]
+                if not self.remaining:
+                    self.state = "crc"
+            elif self.state == "crc":
+                field, view = self._field(view, 4)
+                if field is not None:
+                    self._end_chunk(struct.unpack("!I", field)[0])
+            else:
+                raise InvalidImage(400, "Data after the end of the PNG image")
+
+    def _start_chunk(self, length: int, kind: bytes) -> None:
+        if length > PNG_MAX_CHUNK or not (kind.isascii() and kind.isalpha()):
+            raise InvalidImage(400, "Corrupt PNG chunk structure")
+        if (self.ihdr is None) != (kind == b"IHDR") or (kind == b"IHDR" and length != 13):
+            raise InvalidImage(400, "Corrupt PNG header")
+        if kind[:1].isupper() and kind not in CRITICAL_CHUNKS:
+            raise InvalidImage(400, f"Unsupported PNG chunk {kind.decode()}")
+        if kind == b"IDAT":
+            if self.has_idat and self.last_kind != b"IDAT":
+                raise InvalidImage(400, "Corrupt PNG chunk structure")
+            if self.ihdr["color_type"] == 3 and not self.has_plte:
+                raise InvalidImage(400, "Palette PNG without a palette")
+        if kind == b"IEND" and not self.has_idat:
+            raise InvalidImage(400, "PNG image has no pixel data")
+
+        self.kind = kind
+        self.crc = zlib.crc32(kind)
+        self.remaining = length
+        self.state = "data" if length else "crc"
+
+    def _end_chunk(self, crc: int) -> None:
+        if crc != self.crc:
+            raise InvalidImage(400, f"Corrupt PNG chunk {self.kind.decode()}")
+        if self.kind == b"IHDR":
+            self.ihdr = parse_ihdr(self.ihdr_data)
+        self.has_plte |= self.kind == b"PLTE"
+        self.has_idat |= self.kind == b"IDAT"
+        self.last_kind = self.kind
+        self.state = "done" if self.kind == b"IEND" else "header"
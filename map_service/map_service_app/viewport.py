@@ -0,0 +1,99 @@
+import argparse
+import json
+import math
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from map_service_app.config import VIEWPORT_CELL_PX, VIEWPORT_BLOCKS
+from map_service_app.models import Location
+
+# Viewport queries page through a map's locations by a grid-cell key: the
+# Z-order (Morton) code of the VIEWPORT_CELL_PX source-pixel cell a location
+# is in. Any power-of-two aligned block of cells is one contiguous key
+# range, so a box is covered by a few ranges of the btree on (map_id,
+# cell_key, id), each read in key order.
+
+CELL_BITS = 16
+CELL_MAX = (1 << CELL_BITS) - 1
+
+
+def _cell(v: float) -> int:
+    # Coordinates off the grid share its edge cells; the box filter sorts
+    # them out.
+    return min(max(math.floor(v / VIEWPORT_CELL_PX), 0), CELL_MAX)
+
+
+def _spread(v: int) -> int:
+    key = 0
+    for bit in range(CELL_BITS):
+        key |= ((v >> bit) & 1) << (2 * bit)
+    return key
+
+
+def _key(cell_x: int, cell_y: int) -> int:
+    return _spread(cell_x) | (_spread(cell_y) << 1)
+
+
+def cell_key(x: float, y: float) -> int:
+    return _key(_cell(x), _cell(y))
+
+
+def key_ranges(bbox: tuple[float, float, float, float]) -> list[tuple[int, int]]:
+    # The box's cells, rounded out to blocks big enough that there are at
+    # most VIEWPORT_BLOCKS per side, as sorted, merged key ranges.
+    min_x, min_y, max_x, max_y = bbox
+    cx0, cy0, cx1, cy1 = _cell(min_x), _cell(min_y), _cell(max_x), _cell(max_y)
+    level = 0
+    while (cx1 >> level) - (cx0 >> level) >= VIEWPORT_BLOCKS or (cy1 >> level) - (cy0 >> level) >= VIEWPORT_BLOCKS:
+        level += 1
+
+    ranges = sorted(
+        (_key(bx << level, by << level), _key(bx << level, by << level) + 4 ** level - 1)
+        for bx in range((cx0 >> level), (cx1 >> level) + 1)
+        for by in range((cy0 >> level), (cy1 >> level) + 1)
+    )
+    merged = [ranges[0]]
+    for lo, hi in ranges[1:]:
+        if lo == merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def backfill_cell_keys(db: Session, batch: int = 5000) -> int:
+    # Keys the locations written before the column existed, one batch;
+    # returns how many were keyed.
+    rows = db.execute(select(Location.id, Location.x, Location.y).where(Location.cell_key.is_(None))
+                      .limit(batch)).all()
+    if rows:
+        db.execute(update(Location), [{"id": location_id, "cell_key": cell_key(x, y)}
+                                      for location_id, x, y in rows])
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m map_service_app.viewport",
+                                     description="Key locations written before viewport cell keys.")
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    from map_service_app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        keyed = 0
+        while True:
+            n = backfill_cell_keys(db, args.batch)
+            db.commit()
+            keyed += n
+            if n < args.batch:
+                break
+    finally:
+        db.close()
+    print(json.dumps({"keyed": keyed}))
+
+
+if __name__ == "__main__":
+    main()
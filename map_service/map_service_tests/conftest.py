@@ -1,10 +1,15 @@
+import os
+import threading
+import uuid
+
 import pytest
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session, sessionmaker
 
 from map_service_app.models import Base
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+PG_SCHEMA = "map_service_test"
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -17,4 +22,141 @@ def db():
         yield db
     finally:
         db.close()
-        Base.metadata.drop_all(bind=engine)
\ No newline at end of file
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+async def async_db(tmp_path):
+    # aiosqlite cannot share the sync fixture's in-memory database, so the
+    # async tests get a database file of their own.
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'maps.db'}")
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)() as db:
+        yield db
+    await async_engine.dispose()
+
+class FakeS3Client:
+    # In-memory stand-in for a MinIO/S3 endpoint, covering the calls our storage makes.
+
+    def __init__(self, page_size: int = 1000):
+        self.buckets: dict[str, dict[str, bytes]] = {}
+        self.uploads: dict[str, dict[int, bytes]] = {}
+        self.page_size = page_size
+        self.calls: list[str] = []
+        self._lock = threading.Lock()
+
+    def _bucket(self, name: str) -> dict[str, bytes]:
+        return self.buckets.setdefault(name, {})
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        with self._lock:
+            self.calls.append("put_object")
+            self._bucket(Bucket)[Key] = bytes(Body)
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key):
+        with self._lock:
+            upload_id = str(uuid.uuid4())
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self._lock:
+            self.calls.append("upload_part")
+            self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        with self._lock:
+            parts = self.uploads.pop(UploadId)
+            numbers = [p["PartNumber"] for p in MultipartUpload["Parts"]]
+            assert numbers == sorted(parts)
+            self._bucket(Bucket)[Key] = b"".join(parts[n] for n in numbers)
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        with self._lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=None, ContinuationToken=None):
+        with self._lock:
+            keys = sorted(k for k in self._bucket(Bucket) if k.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        limit = min(MaxKeys or self.page_size, self.page_size)
+        resp = {"Contents": [{"Key": k} for k in keys[start:start + limit]]}
+        if start + limit < len(keys):
+            resp["IsTruncated"] = True
+            resp["NextContinuationToken"] = str(start + limit)
+        return resp
+
+    def copy(self, CopySource, Bucket, Key):
+        with self._lock:
+            self.calls.append("copy")
+            self._bucket(Bucket)[Key] = self._bucket(CopySource["Bucket"])[CopySource["Key"]]
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        assert len(Delete["Objects"]) <= 1000
+        with self._lock:
+            self.calls.append("delete_objects")
+            for obj in Delete["Objects"]:
+                self._bucket(Bucket).pop(obj["Key"], None)
+        return {}
+
+
+@pytest.fixture
+def s3_client():
+    return FakeS3Client(page_size=100)
+
+
+@pytest.fixture(scope="session")
+def pg_engine():
+    # A throwaway schema of TEST_POSTGRES_URL, for the queries that only run
+    # on Postgres (trigram and full-text search, array operators).
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    admin = create_engine(url)
+    with admin.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {PG_SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {PG_SCHEMA}"))
+
+    pg = create_engine(url, connect_args={"options": f"-csearch_path={PG_SCHEMA},public"})
+    Base.metadata.create_all(pg)
+    yield pg
+
+    pg.dispose()
+    with admin.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {PG_SCHEMA} CASCADE"))
+    admin.dispose()
+
+
+@pytest.fixture
+def pg_db(pg_engine):
+    db = Session(pg_engine)
+    try:
+        yield db
+    finally:
+        db.close()
+        with pg_engine.begin() as conn:
+            tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+            conn.execute(text(f"TRUNCATE {tables} CASCADE"))
+
+
+@pytest.fixture
+async def pg_async_db(pg_engine, pg_db):
+    # The same schema through asyncpg, for the async queries; pg_db empties
+    # it afterwards.
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    url = pg_engine.url.set(drivername="postgresql+asyncpg")
+    async_engine = create_async_engine(url, connect_args={"server_settings": {"search_path": f"{PG_SCHEMA},public"}})
+    async with async_sessionmaker(async_engine, expire_on_commit=False)() as db:
+        yield db
+    await async_engine.dispose()
@@ -0,0 +1,145 @@
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+
+import map_service_app.admission as admission
+from map_service_app.admission import AdmissionRejected, admit_tiling_job, refund_tiling_job
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+
+    def get(self, key):
+        value = self.data.get(key)
+        return None if value is None else str(value).encode()
+
+    def delete(self, key):
+        return 1 if self.data.pop(key, None) is not None else 0
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    # Queues writes like a MULTI block; WATCH never sees a conflict here.
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.ops = []
+
+    def watch(self, *keys):
+        pass
+
+    def mget(self, *keys):
+        return [self.redis.get(key) for key in keys]
+
+    def multi(self):
+        pass
+
+    def incrbyfloat(self, key, amount):
+        self.ops.append(("incr", key, amount))
+
+    def expire(self, key, seconds):
+        self.ops.append(("expire", key, seconds))
+
+    def set(self, key, value, ex=None):
+        self.ops.append(("set", key, value))
+
+    def execute(self):
+        for op, key, value in self.ops:
+            if op == "incr":
+                self.redis.data[key] = self.redis.data.get(key, 0.0) + value
+            elif op == "set":
+                self.redis.data[key] = value
+            else:
+                self.redis.ttl[key] = value
+        self.ops = []
+
+
+NOW = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def make_estimate(cpu_seconds, peak_memory_mb=500):
+    return {"cpu_seconds": cpu_seconds, "peak_memory_mb": peak_memory_mb, "tiles": 10, "output_bytes": 1000}
+
+
+@pytest.fixture(autouse=True)
+def budgets(monkeypatch):
+    monkeypatch.setattr(admission, "TILING_MAX_CPU_SECONDS", 1000)
+    monkeypatch.setattr(admission, "TILING_MAX_MEMORY_MB", 8000)
+    monkeypatch.setattr(admission, "TILING_HEAVY_CPU_SECONDS", 100)
+    monkeypatch.setattr(admission, "TILING_HEAVY_MEMORY_MB", 2000)
+    monkeypatch.setattr(admission, "TILING_USER_DAILY_CPU_SECONDS", 300)
+    monkeypatch.setattr(admission, "TILING_GLOBAL_HOURLY_CPU_SECONDS", 500)
+
+
+def test_small_jobs_go_to_default_queue_and_big_ones_to_heavy():
+    redis = FakeRedis()
+    assert admit_tiling_job(redis, uuid4(), make_estimate(5), NOW)[0] == "default"
+    assert admit_tiling_job(redis, uuid4(), make_estimate(150), NOW)[0] == "heavy"
+    assert admit_tiling_job(redis, uuid4(), make_estimate(5, peak_memory_mb=3000), NOW)[0] == "heavy"
+
+
+def test_oversized_jobs_are_rejected():
+    with pytest.raises(AdmissionRejected) as e:
+        admit_tiling_job(FakeRedis(), uuid4(), make_estimate(5000), NOW)
+    assert e.value.status_code == 413
+
+    with pytest.raises(AdmissionRejected) as e:
+        admit_tiling_job(FakeRedis(), uuid4(), make_estimate(5, peak_memory_mb=9000), NOW)
+    assert e.value.status_code == 413
+
+
+def test_user_budget_is_enforced_per_day():
+    redis = FakeRedis()
+    user_id = uuid4()
+
+    for _ in range(3):
+        admit_tiling_job(redis, user_id, make_estimate(90), NOW)
+
+    with pytest.raises(AdmissionRejected) as e:
+        admit_tiling_job(redis, user_id, make_estimate(90), NOW)
+    assert e.value.status_code == 429
+
+    assert admit_tiling_job(redis, uuid4(), make_estimate(90), NOW)[0] == "default"
+    tomorrow = NOW.replace(day=2)
+    assert admit_tiling_job(redis, user_id, make_estimate(90), tomorrow)[0] == "default"
+
+
+def test_global_budget_is_enforced_per_hour():
+    redis = FakeRedis()
+    for _ in range(5):
+        admit_tiling_job(redis, uuid4(), make_estimate(99), NOW)
+
+    with pytest.raises(AdmissionRejected) as e:
+        admit_tiling_job(redis, uuid4(), make_estimate(10), NOW)
+    assert e.value.status_code == 429
+
+
+def test_rejected_job_is_not_charged():
+    redis = FakeRedis()
+    user_id = uuid4()
+    admit_tiling_job(redis, user_id, make_estimate(250), NOW)
+
+    with pytest.raises(AdmissionRejected):
+        admit_tiling_job(redis, user_id, make_estimate(90), NOW)
+    assert admit_tiling_job(redis, user_id, make_estimate(50), NOW)[0] == "default"
+
+
+def test_refund_gives_the_charge_back_once():
+    redis = FakeRedis()
+    user_id = uuid4()
+    _, charge = admit_tiling_job(redis, user_id, make_estimate(200), NOW)
+
+    assert refund_tiling_job(redis, charge)
+    assert not refund_tiling_job(redis, charge)
+    for _ in range(3):
+        admit_tiling_job(redis, user_id, make_estimate(100), NOW)
@@ -0,0 +1,60 @@
+from uuid import uuid4
+
+import pytest
+
+from map_service_app.catalog_cache import (CATALOG, TAGS, namespace_version, catalog_count_key, get_cached_count,
+                                           cache_count, card_state, invalidate_for)
+from map_service_app.crud import create_map, update_map
+from map_service_app.schemas import MapCreate, MapUpdate
+
+
+class FakeRedis:
+    # Reads go through the asyncio client, invalidation through the sync one.
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = str(value).encode()
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+
+
+async def test_filtered_counts_are_cached_per_normalized_filters():
+    redis = FakeRedis()
+    assert catalog_count_key(0, None, [], "any") is None
+    key = catalog_count_key(0, " tower ", ["RPG", "magic"], "all")
+    assert key == catalog_count_key(0, "tower", ["Magic", "rpg"], "all")
+    assert key != catalog_count_key(0, "tower", ["Magic", "rpg"], "any")
+    assert key != catalog_count_key(1, "tower", ["Magic", "rpg"], "all")
+
+    assert await get_cached_count(redis, key) is None
+    await cache_count(redis, key, 42)
+    assert await get_cached_count(redis, key) == 42
+
+
+@pytest.mark.parametrize("before, after, card_changed, bumped", [
+    ((True, frozenset()), (True, frozenset()), True, {CATALOG}),
+    ((True, frozenset()), (True, frozenset()), False, set()),
+    ((False, frozenset()), (False, frozenset()), True, set()),
+    ((True, frozenset()), (False, frozenset()), False, {CATALOG}),
+    ((False, frozenset({"a"})), (False, frozenset({"b"})), True, {TAGS}),
+    ((True, frozenset({"a"})), (False, frozenset()), True, {CATALOG, TAGS}),
+])
+async def test_invalidation_only_bumps_affected_namespaces(before, after, card_changed, bumped):
+    redis = FakeRedis()
+    invalidate_for(redis, before, after, card_changed)
+    assert {ns for ns in (CATALOG, TAGS) if await namespace_version(redis, ns)} == bumped
+
+
+
+def test_card_state_follows_visibility_and_tags(db):
+    map_obj = create_map(db, uuid4(), MapCreate(title="m", owner_username="u", visibility="public", tags=["Magic"]))
+    assert card_state(map_obj) == (True, frozenset({"magic"}))
+    update_map(db, map_obj.id, MapUpdate(visibility="private", tags=[]))
+    assert card_state(map_obj) == (False, frozenset())
+    assert card_state(None) == (False, frozenset())
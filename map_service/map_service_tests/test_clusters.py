@@ -0,0 +1,122 @@
+from uuid import uuid4
+
+from sqlalchemy import select
+
+from map_service_app import clusters
+from map_service_app.crud import (create_map, create_location, update_location, delete_location,
+                                  update_map_tiles_info, get_map_by_id_async)
+from map_service_app.models import LocationCluster
+from map_service_app.schemas import MapCreate, LocationCreate, LocationUpdate, TilesInfo
+
+# With max_zoom 2 and 64px cells, a cell is 256, 128 and 64 source pixels
+# at zoom 0, 1 and 2.
+
+
+def make_map(db, max_zoom=2):
+    map_obj = create_map(db, uuid4(), MapCreate(title="m", owner_username="u", visibility="public", tags=[]))
+    update_map_tiles_info(db, map_obj.id, TilesInfo(width=256, height=256, max_zoom=max_zoom, tiles_path="/t/"))
+    return map_obj
+
+
+def add(db, map_obj, x, y):
+    return create_location(db, LocationCreate(map_id=map_obj.id, type="city", name=f"{x},{y}", x=x, y=y))
+
+
+def snapshot(db, map_id):
+    rows = db.scalars(select(LocationCluster).where(LocationCluster.map_id == map_id)).all()
+    return {(c.zoom, c.cell_x, c.cell_y): (c.count, c.sum_x, c.sum_y, len(c.location_ids)) for c in rows}
+
+
+def test_cells_follow_the_tile_pyramid():
+    assert clusters.cells_of(200, 70, 2) == [(0, 0, 0), (1, 1, 0), (2, 3, 1)]
+
+
+def test_location_writes_update_clusters(db):
+    map_obj = make_map(db)
+    a = add(db, map_obj, 10, 10)
+    b = add(db, map_obj, 20, 30)
+    c = add(db, map_obj, 200, 10)
+
+    cells = snapshot(db, map_obj.id)
+    assert cells[(0, 0, 0)] == (3, 230, 50, 3)
+    assert cells[(1, 0, 0)] == (2, 30, 40, 2)
+    assert cells[(2, 0, 0)] == (2, 30, 40, 2)
+    assert cells[(2, 3, 0)] == (1, 200, 10, 1)
+
+    # Within its cell at every zoom: only the sums change.
+    update_location(db, b.id, LocationUpdate(x=25))
+    assert snapshot(db, map_obj.id)[(2, 0, 0)] == (2, 35, 40, 2)
+
+    # Into the next cell at zoom 2 only.
+    update_location(db, a.id, LocationUpdate(x=70))
+    cells = snapshot(db, map_obj.id)
+    assert cells[(1, 0, 0)] == (2, 95, 40, 2)
+    assert cells[(2, 0, 0)] == (1, 25, 30, 1)
+    assert cells[(2, 1, 0)] == (1, 70, 10, 1)
+
+    delete_location(db, c.id)
+    cells = snapshot(db, map_obj.id)
+    assert cells[(0, 0, 0)] == (2, 95, 40, 2)
+    assert (1, 1, 0) not in cells and (2, 3, 0) not in cells
+
+
+def test_sample_is_refilled_when_a_representative_goes(db, monkeypatch):
+    monkeypatch.setattr(clusters, "CLUSTER_SAMPLE", 2)
+    map_obj = make_map(db)
+    first, second, third = (add(db, map_obj, 10 + i, 10) for i in range(3))
+
+    cluster = db.scalar(select(LocationCluster).where(LocationCluster.map_id == map_obj.id,
+                                                      LocationCluster.zoom == 2))
+    assert cluster.location_ids == [first.id, second.id]
+
+    delete_location(db, first.id)
+    db.refresh(cluster)
+    assert cluster.count == 2
+    assert sorted(cluster.location_ids) == sorted([second.id, third.id])
+
+
+def test_rebuild_matches_incremental_updates(db):
+    map_obj = make_map(db)
+    locations = [add(db, map_obj, (i * 37) % 256, (i * 91) % 256) for i in range(30)]
+    for location in locations[::3]:
+        update_location(db, location.id, LocationUpdate(x=(location.x + 100) % 256))
+    for location in locations[1::5]:
+        delete_location(db, location.id)
+
+    incremental = snapshot(db, map_obj.id)
+    clusters.rebuild_clusters(db, map_obj.id)
+    db.commit()
+    assert snapshot(db, map_obj.id) == incremental
+
+
+def test_new_pyramid_depth_regrids_clusters(db):
+    map_obj = make_map(db, max_zoom=1)
+    add(db, map_obj, 10, 10)
+    assert {zoom for zoom, _, _ in snapshot(db, map_obj.id)} == {0, 1}
+
+    update_map_tiles_info(db, map_obj.id, TilesInfo(width=512, height=512, max_zoom=3, tiles_path="/t/"))
+    assert {zoom for zoom, _, _ in snapshot(db, map_obj.id)} == {0, 1, 2, 3}
+
+
+async def test_clusters_in_view(async_db):
+    def populate(db):
+        map_obj = make_map(db)
+        for x in range(0, 256, 16):
+            for y in range(0, 256, 16):
+                add(db, map_obj, x, y)
+        return map_obj.id
+    map_id = await async_db.run_sync(populate)
+    map_obj = await get_map_by_id_async(async_db, map_id)
+
+    cells, truncated = await clusters.clusters_in_view_async(async_db, map_obj, 2, (0, 0, 100, 60))
+    assert sorted((c.cell_x, c.cell_y) for c in cells) == [(0, 0), (1, 0)]
+    assert all(c.count == 16 for c in cells)
+    assert not truncated
+
+    # Deeper zooms than the pyramid fall back to its last level.
+    cells, truncated = await clusters.clusters_in_view_async(async_db, map_obj, 9, (0, 0, 255, 255))
+    assert (len(cells), truncated) == (16, False)
+    cells, truncated = await clusters.clusters_in_view_async(async_db, map_obj, 2, (0, 0, 255, 255), limit=16)
+    assert (len(cells), truncated) == (16, False)
+    cells, truncated = await clusters.clusters_in_view_async(async_db, map_obj, 2, (0, 0, 255, 255), limit=5)
+    assert (len(cells), truncated) == (5, True)
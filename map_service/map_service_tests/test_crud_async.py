@@ -0,0 +1,88 @@
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+
+from map_service_app.crud import (create_map, create_share, list_maps_catalog, get_maps_by_owner, list_tags,
+                                  get_map_by_id_async, get_map_by_share_id_async, is_map_owned_by_user_async,
+                                  touch_map_viewed_async, list_maps_catalog_async, get_maps_by_owner_async,
+                                  list_tags_async, create_location, get_locations_in_view_async)
+from map_service_app.models import Map
+from map_service_app.schemas import MapCreate, LocationCreate
+
+
+def make_map(owner_id, title, visibility="public", tags=()):
+    return MapCreate(title=title, owner_username="u", visibility=visibility, tags=list(tags))
+
+
+async def test_async_lookups(async_db):
+    owner_id = uuid4()
+    map_obj = await async_db.run_sync(lambda db: create_map(db, owner_id, make_map(owner_id, "m", tags=["Magic"])))
+    share_id = await async_db.run_sync(lambda db: create_share(db, map_obj.id))
+
+    found = await get_map_by_id_async(async_db, map_obj.id)
+    assert found.title == "m" and [t.name for t in found.tags] == ["magic"]
+    assert (await get_map_by_share_id_async(async_db, share_id)).id == map_obj.id
+    assert await get_map_by_id_async(async_db, uuid4()) is None
+
+    assert await is_map_owned_by_user_async(async_db, owner_id, map_obj.id)
+    assert not await is_map_owned_by_user_async(async_db, uuid4(), map_obj.id)
+
+    await touch_map_viewed_async(async_db, map_obj.id, timedelta(hours=1))
+    assert (await async_db.get(Map, map_obj.id, populate_existing=True)).last_viewed_at is not None
+
+
+async def test_async_lists_match_sync(async_db):
+    owner_id = uuid4()
+
+    def populate(db):
+        for i in range(5):
+            create_map(db, owner_id, make_map(owner_id, f"Map {i}", tags=["Magic"] if i % 2 else ["War"]))
+        create_map(db, owner_id, make_map(owner_id, "Hidden", visibility="private"))
+
+    await async_db.run_sync(populate)
+
+    def ids(page):
+        maps, total, cursor = page
+        return [m.id for m in maps], total, cursor
+
+    for tags in ([], ["magic"]):
+        first = await list_maps_catalog_async(async_db, q=None, tags=tags, tags_mode="any", limit=2)
+        expected = await async_db.run_sync(
+            lambda db: list_maps_catalog(db, q=None, tags=tags, tags_mode="any", limit=2))
+        assert ids(first) == ids(expected)
+
+        second = await list_maps_catalog_async(async_db, q=None, tags=tags, tags_mode="any", limit=2, cursor=first[2])
+        expected = await async_db.run_sync(
+            lambda db: list_maps_catalog(db, q=None, tags=tags, tags_mode="any", limit=2, cursor=first[2]))
+        assert ids(second) == ids(expected)
+
+    owned = await get_maps_by_owner_async(async_db, owner_id, offset=4, limit=10)
+    assert ids(owned) == ids(await async_db.run_sync(lambda db: get_maps_by_owner(db, owner_id, offset=4, limit=10)))
+    assert owned[1] == 6
+
+    assert await list_tags_async(async_db) == await async_db.run_sync(lambda db: list_tags(db))
+
+
+async def test_locations_in_view_pages_through_bbox(async_db):
+    map_obj = await async_db.run_sync(lambda db: create_map(db, uuid4(), make_map(None, "m")))
+
+    def populate(db):
+        for x in range(10):
+            for y in range(10):
+                create_location(db, LocationCreate(map_id=map_obj.id, type="city", name=f"{x},{y}", x=x * 10, y=y * 10))
+    await async_db.run_sync(populate)
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = await get_locations_in_view_async(async_db, map_obj.id, (15, 15, 40, 30), limit=3,
+                                                         cursor=cursor)
+        assert len(page) <= 3
+        seen += [location.name for location in page]
+        if cursor is None:
+            break
+
+    assert sorted(seen) == sorted(f"{x},{y}" for x in (2, 3, 4) for y in (2, 3))
+    assert await get_locations_in_view_async(async_db, uuid4(), (0, 0, 100, 100)) == ([], None)
+    with pytest.raises(ValueError):
+        await get_locations_in_view_async(async_db, map_obj.id, (0, 0, 100, 100), cursor="nope")
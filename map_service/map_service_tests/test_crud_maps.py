@@ -1,3 +1,4 @@
+from datetime import datetime, timedelta, timezone
 from uuid import uuid4
 import pytest
 
@@ -7,13 +8,18 @@ from map_service_app.crud import (
     update_map,
     is_map_owned_by_user,
     update_map_tiles_info,
+    update_map_tiles_recompressed,
     delete_map,
     get_maps_by_owner,
     create_share,
     delete_share,
     get_map_by_share_id,
+    clone_map,
+    create_location,
+    get_locations_by_map_id,
 )
-from map_service_app.schemas import MapCreate, MapUpdate, TilesInfo, Visibility
+from map_service_app.schemas import (MapCreate, MapUpdate, MapClone, TilesInfo, TilesRecompressed, Visibility,
+                                     LocationCreate)
 from map_service_app.models import Tag, Map
 from map_service_app.config import MAX_TAGS_PER_MAP, MAX_TAG_LEN
 
@@ -70,6 +76,7 @@ def test_update_map_updates_title_and_description(db, map_obj):
 def test_update_map_replaces_tags_and_cleans_unused(db, map_obj):
     updated = update_map(db, map_obj.id, MapUpdate(tags=["magic"]))
     assert {tag.name for tag in updated.tags} == {"magic"}
+    assert updated.tag_ids == [tag.id for tag in updated.tags]
 
     assert db.query(Tag).filter(Tag.name == "tower").first() is None
 
@@ -113,20 +120,49 @@ def test_delete_map_does_not_delete_tags_still_used(db, owner_id):
     assert db.query(Tag).filter(Tag.name.in_(["magic", "tower"])).count() == 0
 
 
+def set_updated_at(db, map_id, minutes_ago):
+    db.query(Map).filter(Map.id == map_id).update(
+        {Map.updated_at: datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)})
+    db.commit()
+
+
 def test_get_maps_by_owner_pagination_and_total(db, owner_id):
-    create_map(db, owner_id, make_map_create(title="Map1", tags=()))
-    create_map(db, owner_id, make_map_create(title="Map2", tags=()))
-    create_map(db, owner_id, make_map_create(title="Map3", tags=()))
+    for i, title in enumerate(("Map1", "Map2", "Map3")):
+        m = create_map(db, owner_id, make_map_create(title=title, tags=()))
+        set_updated_at(db, m.id, 10 - i)
 
-    maps, total = get_maps_by_owner(db, owner_id, offset=0, limit=2)
+    maps, total, next_cursor = get_maps_by_owner(db, owner_id, offset=0, limit=2)
     assert total == 3
     assert len(maps) == 2
     assert all(m.owner_id == owner_id for m in maps)
+    assert next_cursor is not None
 
-    maps2, total2 = get_maps_by_owner(db, owner_id, offset=2, limit=2)
+    maps2, total2, _ = get_maps_by_owner(db, owner_id, offset=2, limit=2)
     assert total2 == 3
     assert len(maps2) == 1
-    assert maps2[0].title == "Map3"
+    assert maps2[0].title == "Map1"
+
+
+def test_get_maps_by_owner_cursor_survives_edits(db, owner_id):
+    ids = [create_map(db, owner_id, make_map_create(title=f"Map{i}", tags=())).id for i in range(5)]
+    db.query(Map).update({Map.updated_at: datetime(2024, 1, 1, tzinfo=timezone.utc)})
+    db.commit()
+
+    first, _, cursor = get_maps_by_owner(db, owner_id, limit=2)
+    # Rows with the same updated_at are ordered by id.
+    assert [m.id for m in first] == sorted(ids, key=lambda i: i.hex, reverse=True)[:2]
+
+    # An edit moves a map to the front; with offsets the next page would
+    # repeat a row, with the cursor it carries on where it left off.
+    update_map(db, first[0].id, MapUpdate(title="Edited"))
+    seen = [m.id for m in first]
+    while cursor:
+        page, _, cursor = get_maps_by_owner(db, owner_id, limit=2, cursor=cursor)
+        seen += [m.id for m in page]
+    assert sorted(seen) == sorted(ids)
+
+    with pytest.raises(ValueError):
+        get_maps_by_owner(db, owner_id, cursor="not-a-cursor")
 
 
 @pytest.mark.parametrize(
@@ -178,4 +214,53 @@ def test_get_share_id_and_get_map_by_share_id(db, map_obj):
     assert by_share.id == map_obj.id
 
     delete_share(db, map_obj.id)
-    assert get_map_by_share_id(db, sid) is None
\ No newline at end of file
+    assert get_map_by_share_id(db, sid) is None
+
+def test_update_map_tiles_info_progressive(db, map_obj):
+    interim = TilesInfo(width=4096, height=2048, max_zoom=4, ready_zoom=1, tiles_path="/tiles/p/")
+    updated = update_map_tiles_info(db, map_obj.id, interim)
+    assert updated.max_zoom == 4
+    assert updated.ready_zoom == 1
+
+    final = TilesInfo(width=4096, height=2048, max_zoom=4, tiles_path="/tiles/p/")
+    updated = update_map_tiles_info(db, map_obj.id, final)
+    assert updated.ready_zoom == 4
+
+
+def test_recompressed_bytes_reset_on_retile(db, map_obj):
+    info = TilesInfo(width=512, height=512, max_zoom=1, tiles_path="/tiles/p/")
+    update_map_tiles_info(db, map_obj.id, info)
+
+    updated = update_map_tiles_recompressed(db, map_obj.id, TilesRecompressed(tiles=5, bytes_saved=12345))
+    assert updated.tiles_bytes_saved == 12345
+
+    updated = update_map_tiles_info(db, map_obj.id, info)
+    assert updated.tiles_bytes_saved is None
+
+    assert update_map_tiles_recompressed(db, uuid4(), TilesRecompressed(tiles=0, bytes_saved=0)) is None
+
+
+def test_clone_map_copies_row_tags_and_locations(db, map_obj):
+    update_map_tiles_info(db, map_obj.id, TilesInfo(width=800, height=600, max_zoom=2, tile_format="png-256",
+                                                    tiles_path=f"/tiles/{map_obj.id}/"))
+    for i in range(3):
+        create_location(db, LocationCreate(map_id=map_obj.id, type="city", name=f"L{i}", description_md="d", x=i, y=2 * i))
+
+    new_owner, clone_id = uuid4(), uuid4()
+    clone = clone_map(db, map_obj, clone_id, new_owner, MapClone(owner_username="other"))
+
+    assert clone.id == clone_id
+    assert (clone.owner_id, clone.owner_username, clone.visibility) == (new_owner, "other", "private")
+    assert (clone.title, clone.width, clone.height, clone.max_zoom) == (map_obj.title, 800, 600, 2)
+    assert clone.tiles_path == f"/tiles/{clone_id}/"
+    assert {t.name for t in clone.tags} == {t.name for t in map_obj.tags}
+    assert set(clone.tag_ids) == {t.id for t in map_obj.tags}
+
+    copied = get_locations_by_map_id(db, clone_id)
+    original = get_locations_by_map_id(db, map_obj.id)
+    assert sorted((l.name, l.x, l.y) for l in copied) == sorted((l.name, l.x, l.y) for l in original)
+    assert not {l.id for l in copied} & {l.id for l in original}
+
+    # Editing the clone leaves the original alone.
+    update_map(db, clone_id, MapUpdate(tags=["fork"]))
+    assert {t.name for t in get_map_by_id(db, map_obj.id).tags} == {"magic", "tower"}
@@ -0,0 +1,107 @@
+import hashlib
+import io
+import os
+from uuid import uuid4
+
+from map_service_app.config import TILE_FORMAT
+from map_service_app.crud import create_map, update_map_tiles_info, clone_map
+from map_service_app.crud import update_map_tiles_archived
+from map_service_app.dedup import (HashingReader, hash_upload, find_pyramid, reuse_pyramid, publish_pyramid,
+                                   release_pyramid)
+from map_service_app.models import TilePyramid
+from map_service_app.schemas import MapCreate, MapClone, TilesInfo, TilesArchived
+from map_service_app.storage import LocalStorage
+
+
+def new_map(db, title="m"):
+    return create_map(db, uuid4(), MapCreate(title=title, owner_username="u"))
+
+
+def tile(db, storage, map_obj, fmt=TILE_FORMAT):
+    for key in ("0/0/0.png", "1/0/0.png", "1/1/0.png"):
+        storage.save_upload(f"{map_obj.id}/{key}", io.BytesIO(key.encode()))
+    update_map_tiles_info(db, map_obj.id, TilesInfo(
+        width=300, height=200, max_zoom=1, tile_format=fmt, tiles_path=f"/tiles/{map_obj.id}/"))
+    publish_pyramid(db, map_obj)
+
+
+def ref_count(db, key):
+    pyramid = db.get(TilePyramid, key)
+    if pyramid is None:
+        return 0
+    db.refresh(pyramid)
+    return pyramid.ref_count
+
+
+def test_hashing_reader_hashes_what_is_read():
+    reader = HashingReader(io.BytesIO(b"abc" * 1000))
+    while reader.read(7):
+        pass
+    assert reader.hexdigest() == hashlib.sha256(b"abc" * 1000).hexdigest()
+    assert hash_upload(io.BytesIO(b"abc" * 1000), chunk_size=7) == reader.hexdigest()
+
+
+def test_same_image_reuses_pyramid_and_is_reference_counted(db, tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    first, second = new_map(db, "first"), new_map(db, "second")
+
+    assert find_pyramid(db, "d1") is None
+    assert not reuse_pyramid(db, first, "d1")
+    tile(db, storage, first)
+    key = first.pyramid_key
+    assert key == f"d1/{TILE_FORMAT}"
+    assert ref_count(db, key) == 1
+    # Publishing links nothing, so the tiering job can pack a map on its own.
+    assert os.stat(tmp_path / str(first.id) / "1/1/0.png").st_nlink == 1
+
+    # The tiles themselves are linked in from the first map by a tile worker.
+    assert find_pyramid(db, "d1").key == key
+    pyramid = reuse_pyramid(db, second, "d1")
+    assert (pyramid.width, pyramid.height, pyramid.max_zoom, pyramid.tile_format) == (300, 200, 1, TILE_FORMAT)
+    assert pyramid.holder_id == first.id
+    assert second.pyramid_key == key
+    assert ref_count(db, key) == 2
+
+    clone = clone_map(db, second, uuid4(), uuid4(), MapClone(owner_username="v"))
+    assert clone.pyramid_key == key
+    assert ref_count(db, key) == 3
+
+    # A different image drops the old reference and needs a tiling job.
+    assert not reuse_pyramid(db, second, "d2")
+    assert second.pyramid_key is None
+    assert ref_count(db, key) == 2
+
+    release_pyramid(db, first)
+    assert ref_count(db, key) == 1
+    release_pyramid(db, clone)
+    assert db.get(TilePyramid, key) is None
+    assert (tmp_path / str(first.id) / "0/0/0.png").read_bytes() == b"0/0/0.png"
+
+
+def test_archived_holder_is_not_linked_from(db, tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    first, second = new_map(db, "first"), new_map(db, "second")
+    reuse_pyramid(db, first, "d1")
+    tile(db, storage, first)
+
+    assert update_map_tiles_archived(db, first.id, TilesArchived(tiles=3, bytes_reclaimed=10, archive_bytes=12))
+    assert find_pyramid(db, "d1") is None
+    # The image is tiled again; the map shares the pyramid all the same and
+    # holds it once its tiles are in.
+    assert not reuse_pyramid(db, second, "d1")
+    assert ref_count(db, first.pyramid_key) == 2
+    tile(db, storage, second)
+    assert find_pyramid(db, "d1").holder_id == second.id
+
+
+def test_retile_moves_reference_to_new_format(db, tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    map_obj = new_map(db)
+    reuse_pyramid(db, map_obj, "d1")
+    tile(db, storage, map_obj, "png-128")
+    old_key = map_obj.pyramid_key
+
+    tile(db, storage, map_obj, "png-512")
+    assert map_obj.pyramid_key == "d1/png-512"
+    assert db.get(TilePyramid, old_key) is None
+    assert db.get(TilePyramid, "d1/png-512").holder_id == map_obj.id
@@ -0,0 +1,70 @@
+from uuid import uuid4
+
+from rq.job import JobStatus
+
+from map_service_app.crud import create_map, create_location, update_location, update_map_tiles_info
+from map_service_app.export import export_version, request_export
+from map_service_app.schemas import MapCreate, LocationCreate, LocationUpdate, TilesInfo
+from map_service_app.storage import LocalStorage
+
+
+class FakeJobs:
+    def __init__(self):
+        self.statuses = {}
+        self.enqueued = []
+
+    def enqueue(self, redis_conn, job_id, args):
+        self.enqueued.append((job_id, args))
+        self.statuses[job_id] = JobStatus.QUEUED
+
+    def status(self, redis_conn, job_id):
+        status = self.statuses.get(job_id)
+        return status, ("MemoryError" if status == JobStatus.FAILED else None)
+
+
+def tiled_map(db):
+    m = create_map(db, uuid4(), MapCreate(title="m", owner_username="u"))
+    return update_map_tiles_info(db, m.id, TilesInfo(width=1500, height=1000, max_zoom=3, tiles_path="/t/"))
+
+
+def test_version_follows_locations(db):
+    m = tiled_map(db)
+    empty = export_version(m, [])
+
+    loc = create_location(db, LocationCreate(map_id=m.id, type="city", name="A", x=1, y=2))
+    with_loc = export_version(m, [loc])
+    assert with_loc != empty
+
+    loc = update_location(db, loc.id, LocationUpdate(x=5))
+    assert export_version(m, [loc]) not in (empty, with_loc)
+
+
+def test_request_export_enqueues_once_then_serves_cache(db, tmp_path):
+    m = tiled_map(db)
+    loc = create_location(db, LocationCreate(map_id=m.id, type="city", name="A", x=1, y=2))
+    storage, jobs = LocalStorage(str(tmp_path)), FakeJobs()
+
+    def request():
+        return request_export(None, storage, m, [loc], "pdf", 2048, enqueue=jobs.enqueue, job_status=jobs.status)
+
+    first = request()
+    assert first["status"] == "pending"
+    assert request() == first
+    assert len(jobs.enqueued) == 1
+
+    job_id, (map_id, version, key, fmt, max_dim, map_info, points) = jobs.enqueued[0]
+    assert (map_id, fmt, max_dim) == (str(m.id), "pdf", 2048)
+    assert map_info == {"width": 1500, "height": 1000, "max_zoom": 3}
+    assert points == [{"x": 1, "y": 2, "name": "A"}]
+    assert first["url"] == f"/maps/{m.id}/export/{key.rsplit('/', 1)[1]}"
+
+    jobs.statuses[job_id] = JobStatus.FAILED
+    retried = request()
+    assert retried["detail"] == "Previous attempt failed: MemoryError"
+    assert len(jobs.enqueued) == 2
+
+    (tmp_path / key).parent.mkdir(parents=True)
+    (tmp_path / key).write_bytes(b"%PDF")
+    jobs.statuses[job_id] = JobStatus.FINISHED
+    assert request() == {"status": "ready", "url": first["url"]}
+    assert len(jobs.enqueued) == 2
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from map_service_app.pool_metrics import PoolMetrics, MeteredQueuePool, MeteredRedisPool, MeteredAsyncRedisPool
+
+
+class FakeConnection:
+    def __init__(self, **kwargs):
+        self.pid = os.getpid()
+
+    def connect(self):
+        pass
+
+    def can_read(self):
+        return False
+
+    def disconnect(self):
+        pass
+
+
+class RefusedConnection(FakeConnection):
+    def connect(self):
+        raise RedisConnectionError("Error 111 connecting to localhost:6379. Connection refused.")
+
+
+class FakeAsyncConnection(FakeConnection):
+    async def connect(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    async def can_read_destructive(self):
+        return False
+
+    async def re_auth(self):
+        pass
+
+
+def test_wait_buckets_are_cumulative():
+    metrics = PoolMetrics()
+    metrics.checked_out(0.0005)
+    metrics.checked_out(0.003)
+    metrics.checked_out(20, overflow=True)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["checkouts"] == 3
+    assert snapshot["overflow_checkouts"] == 1
+    assert snapshot["wait_ms"]["max"] == 20000
+    assert snapshot["wait_ms"]["buckets"]["1"] == 1
+    assert snapshot["wait_ms"]["buckets"]["5"] == 2
+    assert snapshot["wait_ms"]["buckets"]["10000"] == 2
+    assert snapshot["wait_ms"]["buckets"]["+Inf"] == 3
+
+
+def test_sql_pool_counts_overflow_and_timeouts(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=MeteredQueuePool,
+                           pool_size=1, max_overflow=1, pool_timeout=0.05)
+    first, second = engine.connect(), engine.connect()
+    first.execute(text("SELECT 1"))
+
+    stats = engine.pool.stats()
+    assert stats["in_use"] == 2
+    assert stats["overflow"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["overflow_checkouts"] == 1
+
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    assert engine.pool.stats()["timeouts"] == 1
+
+    first.close()
+    second.close()
+    stats = engine.pool.stats()
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 1
+    engine.dispose()
+
+
+def test_redis_pool_counts_checkouts_and_timeouts():
+    pool = MeteredRedisPool(connection_class=FakeConnection, max_connections=1, timeout=0.05)
+    conn = pool.get_connection()
+    assert pool.stats()["in_use"] == 1
+
+    with pytest.raises(RedisConnectionError):
+        pool.get_connection()
+
+    pool.release(conn)
+    stats = pool.stats()
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 1
+    assert stats["checkouts"] == 1
+    assert stats["timeouts"] == 1
+
+
+def test_refused_redis_connection_is_not_a_pool_timeout():
+    pool = MeteredRedisPool(connection_class=RefusedConnection, max_connections=1, timeout=0.05)
+    with pytest.raises(RedisConnectionError):
+        pool.get_connection()
+    assert pool.stats()["timeouts"] == 0
+
+
+async def test_async_redis_pool_counts_timeouts():
+    pool = MeteredAsyncRedisPool(connection_class=FakeAsyncConnection, max_connections=1, timeout=0.05)
+    conn = await pool.get_connection()
+
+    with pytest.raises(RedisConnectionError):
+        await pool.get_connection()
+
+    await pool.release(conn)
+    stats = pool.stats()
+    assert (stats["checkouts"], stats["timeouts"]) == (1, 1)
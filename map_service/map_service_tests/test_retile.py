@@ -0,0 +1,197 @@
+from uuid import uuid4
+
+from rq.job import JobStatus
+
+from map_service_app.crud import create_map, update_map_tiles_info, select_maps_for_retile
+from map_service_app.retile import RetileRun, retile_job_id
+from map_service_app.schemas import MapCreate, TilesInfo
+
+
+class FakeRedis:
+    # Just the list/hash/set commands a retile run uses.
+
+    def __init__(self):
+        self.data = {}
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def hsetnx(self, key, field, value):
+        h = self.data.setdefault(key, {})
+        if field in h:
+            return 0
+        h[field] = str(value)
+        return 1
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        h = self.data.setdefault(key, {})
+        if field is not None:
+            h[field] = str(value)
+        for k, v in (mapping or {}).items():
+            h[k] = str(v)
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hkeys(self, key):
+        return list(self.data.get(key, {}))
+
+    def hexists(self, key, field):
+        return field in self.data.get(key, {})
+
+    def hdel(self, key, field):
+        self.data.get(key, {}).pop(field, None)
+
+    def hlen(self, key):
+        return len(self.data.get(key, {}))
+
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(values)
+
+    def lindex(self, key, index):
+        items = self.data.get(key, [])
+        return items[index] if items else None
+
+    def lpop(self, key):
+        items = self.data.get(key, [])
+        return items.pop(0) if items else None
+
+    def llen(self, key):
+        return len(self.data.get(key, []))
+
+    def sadd(self, key, value):
+        self.data.setdefault(key, set()).add(value)
+
+    def sismember(self, key, value):
+        return value in self.data.get(key, set())
+
+    def scard(self, key):
+        return len(self.data.get(key, set()))
+
+
+class FakeJobs:
+    def __init__(self):
+        self.statuses = {}
+        self.enqueued = []
+
+    def enqueue(self, redis_conn, map_id, job_id):
+        self.enqueued.append(map_id)
+        self.statuses[job_id] = JobStatus.QUEUED
+
+    def status(self, redis_conn, job_id):
+        status = self.statuses.get(job_id)
+        return status, ("RuntimeError: boom" if status == JobStatus.FAILED else None)
+
+
+def make_run(redis, jobs, run_id="r1", workers=4):
+    return RetileRun(redis, run_id, enqueue=jobs.enqueue, job_status=jobs.status, worker_count=lambda r: workers)
+
+
+def test_select_maps_for_retile(db):
+    owner = uuid4()
+    tiled, other_owner, current, untiled = (
+        create_map(db, o, MapCreate(title=t, owner_username="u"))
+        for o, t in ((owner, "a"), (uuid4(), "b"), (owner, "c"), (owner, "d"))
+    )
+    for m, fmt in ((tiled, None), (other_owner, "png-128"), (current, "png-256")):
+        update_map_tiles_info(db, m.id, TilesInfo(width=1, height=1, max_zoom=0, tile_format=fmt, tiles_path="/t/"))
+
+    assert set(select_maps_for_retile(db)) == {tiled.id, other_owner.id, current.id}
+    assert set(select_maps_for_retile(db, owner_id=owner)) == {tiled.id, current.id}
+    assert set(select_maps_for_retile(db, not_format="png-256")) == {tiled.id, other_owner.id}
+
+
+def test_run_is_throttled_and_reports_progress():
+    redis, jobs = FakeRedis(), FakeJobs()
+    maps = [str(uuid4()) for _ in range(5)]
+    run = make_run(redis, jobs, workers=5)
+    assert run.create(maps, {"not_format": "png-256"})
+    assert not run.create(maps[:1], {})
+
+    capacity = run.capacity(0.5)
+    assert capacity == 2
+    assert run.step(capacity)
+    assert jobs.enqueued == maps[:2]
+
+    jobs.statuses[retile_job_id("r1", maps[0])] = JobStatus.FINISHED
+    jobs.statuses[retile_job_id("r1", maps[1])] = JobStatus.FAILED
+    run.step(capacity)
+    assert jobs.enqueued == maps[:4]
+
+    progress = run.progress()
+    assert (progress["total"], progress["done"], progress["failed"]) == (5, 1, 1)
+    assert (progress["in_flight"], progress["remaining"]) == (2, 1)
+    assert progress["failures"] == {maps[1]: "RuntimeError: boom"}
+    assert progress["filters"] == {"not_format": "png-256"}
+
+
+def test_run_resumes_without_duplicate_jobs():
+    redis, jobs = FakeRedis(), FakeJobs()
+    maps = [str(uuid4()) for _ in range(3)]
+    run = make_run(redis, jobs)
+    run.create(maps, {})
+
+    # A driver died after recording maps[0] as in flight but before
+    # enqueueing it or popping it off the todo list.
+    redis.hset(run.inflight_key, maps[0], retile_job_id("r1", maps[0]))
+    run.step(capacity=2)
+    assert jobs.enqueued == maps[:2]
+    assert run.progress()["remaining"] == 1
+
+    def finish_all(seconds):
+        for job_id in jobs.statuses:
+            jobs.statuses[job_id] = JobStatus.FINISHED
+
+    resumed = make_run(redis, jobs)
+    assert resumed.drive(share=1, poll_seconds=0, sleep=finish_all)
+    assert sorted(jobs.enqueued) == sorted(maps)
+    assert resumed.progress()["done"] == 3
+    assert resumed.progress()["status"] == "finished"
+
+    # Running a finished run again does nothing.
+    assert resumed.drive(share=1, poll_seconds=0, sleep=finish_all)
+    assert len(jobs.enqueued) == 3
+
+
+def test_drive_hands_off_after_its_slice():
+    redis, jobs = FakeRedis(), FakeJobs()
+    maps = [str(uuid4()) for _ in range(3)]
+    run = make_run(redis, jobs, workers=1)
+    run.create(maps, {})
+
+    ticks = iter(range(100))
+    assert run.drive(share=1, poll_seconds=0, sleep=lambda s: None, max_seconds=2, clock=lambda: next(ticks))
+    assert run.status() == "running"
+    assert jobs.enqueued == maps[:1]
+    assert redis.exists(run.lock_key) == 0
+
+
+def test_retry_failed_requeues_maps():
+    redis, jobs = FakeRedis(), FakeJobs()
+    map_id = str(uuid4())
+    run = make_run(redis, jobs)
+    run.create([map_id], {})
+    run.step(1)
+    jobs.statuses[retile_job_id("r1", map_id)] = JobStatus.FAILED
+    run.step(1)
+    assert run.progress()["failed"] == 1
+
+    assert run.retry_failed() == 1
+    run.step(1)
+    assert jobs.enqueued == [map_id, map_id]
+    assert run.progress()["failed"] == 0
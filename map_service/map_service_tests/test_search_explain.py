@@ -0,0 +1,81 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from map_service_app.crud import (CATALOG_SIMILARITY, TAGS_SIMILARITY, _catalog_statement, _page_statement,
+                                  _set_similarity, _tags_statement, search_vector_update)
+from map_service_app.models import Base
+
+# Checks on a real Postgres that catalog and tag search are answered from
+# their indexes. Runs in a throwaway schema of TEST_POSTGRES_URL.
+
+POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+SCHEMA = "search_explain_test"
+MAPS = 200000
+TAGS = 200000
+
+pytestmark = pytest.mark.skipif(not POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+
+
+@pytest.fixture(scope="module")
+def pg_engine():
+    admin = create_engine(POSTGRES_URL)
+    with admin.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    engine = create_engine(POSTGRES_URL, connect_args={"options": f"-csearch_path={SCHEMA},public"})
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO maps (id, owner_id, visibility, owner_username, title, description, source_path, tiles_path,
+                              tag_ids, created_at, updated_at)
+            SELECT gen_random_uuid(), gen_random_uuid(), 'public', 'explain',
+                   CASE WHEN i % 1000 = 0 THEN 'Wizard Tower ' || i ELSE md5(i::text) END,
+                   md5((-i)::text), '', '', '{}', now(), now()
+            FROM generate_series(1, :maps) i
+        """), {"maps": MAPS})
+        conn.execute(text("""
+            INSERT INTO tags (id, name, created_at)
+            SELECT gen_random_uuid(), CASE WHEN i % 1000 = 0 THEN 'magic ' || i ELSE md5(i::text) END, now()
+            FROM generate_series(1, :tags) i
+        """), {"tags": TAGS})
+        conn.execute(search_vector_update())
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE"))
+
+    yield engine
+
+    engine.dispose()
+    with admin.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    admin.dispose()
+
+
+def explain(engine, stmt, threshold: float) -> str:
+    compiled = stmt.compile(engine, compile_kwargs={"render_postcompile": True})
+    with Session(engine) as db:
+        db.execute(_set_similarity(threshold))
+        rows = db.connection().exec_driver_sql(f"EXPLAIN {compiled}", compiled.params)
+        return "\n".join(row[0] for row in rows)
+
+
+def catalog_plan(engine, q: str) -> str:
+    stmt, scores = _catalog_statement(q, [], "any", postgres=True)
+    return explain(engine, _page_statement(stmt, scores, 0, 20, None, True), CATALOG_SIMILARITY)
+
+
+def test_fuzzy_title_search_uses_trigram_index(pg_engine):
+    plan = catalog_plan(pg_engine, "wizard towr")
+    assert "ix_maps_title_trgm" in plan
+    assert "ix_maps_search_vector" in plan
+    assert "Seq Scan on maps" not in plan
+
+
+def test_tag_search_uses_trigram_index(pg_engine):
+    plan = explain(pg_engine, _tags_statement("magik", 50, postgres=True), TAGS_SIMILARITY)
+    assert "ix_tags_name_trgm" in plan
+    assert "Seq Scan on tags" not in plan
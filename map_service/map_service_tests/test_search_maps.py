@@ -1,7 +1,11 @@
+from datetime import datetime, timezone
 from uuid import uuid4
 import pytest
 
-from map_service_app.crud import create_map, list_maps_catalog
+from sqlalchemy.dialects import postgresql
+
+from map_service_app.crud import create_map, list_maps_catalog, list_tags, _catalog_statement
+from map_service_app.models import Map
 from map_service_app.schemas import MapCreate, Visibility
 
 
@@ -32,7 +36,7 @@ def test_catalog_returns_only_public(db, owner_id):
         MapCreate(title="Hidden Base", description=None, visibility="private", owner_username="u1", tags=["Secret"]),
     )
 
-    maps, total = list_maps_catalog(db, q=None, tags=[], tags_mode="any")
+    maps, total, _ = list_maps_catalog(db, q=None, tags=[], tags_mode="any")
     assert total == 1
     assert len(maps) == 1
     assert maps[0].title == "Alpha City"
@@ -50,15 +54,149 @@ def test_catalog_filters_by_tags(db, owner_id, filter_tags, tags_mode, expected_
     create_map(db, owner_id, make_public_map("Orc Camp", tags=["RPG", "War"]))
     create_map(db, owner_id, make_public_map("Lonely Hill", tags=["Nature"]))
 
-    maps, total = list_maps_catalog(db, q=None, tags=filter_tags, tags_mode=tags_mode)
+    maps, total, _ = list_maps_catalog(db, q=None, tags=filter_tags, tags_mode=tags_mode)
     assert total == 1
     assert maps[0].title == expected_title
 
 
+def test_catalog_all_tags_with_unknown_tag_matches_nothing(db, owner_id):
+    create_map(db, owner_id, make_public_map("Orc Camp", tags=["RPG", "War"]))
+
+    maps, total, _ = list_maps_catalog(db, q=None, tags=["rpg", "no such tag"], tags_mode="all")
+    assert (maps, total) == ([], 0)
+
+
+@pytest.mark.parametrize("tags_mode, operator", [("any", "&&"), ("all", "@>")])
+def test_catalog_tag_filter_on_postgres_is_one_array_predicate(tags_mode, operator):
+    stmt, _ = _catalog_statement(None, ["magic", "rpg"], tags_mode, postgres=True)
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert f"maps.tag_ids {operator} (SELECT array_agg(tags.id)" in sql
+    assert "GROUP BY" not in sql and "JOIN" not in sql
+
+
 def test_search_len_lt_3_uses_like(db, owner_id):
     create_map(db, owner_id, make_public_map("Alpha City"))
     create_map(db, owner_id, make_public_map("Beta Town"))
 
-    maps, total = list_maps_catalog(db, q="Al", tags=[], tags_mode="any")
+    maps, total, _ = list_maps_catalog(db, q="Al", tags=[], tags_mode="any")
     assert total == 1
-    assert maps[0].title == "Alpha City"
\ No newline at end of file
+    assert maps[0].title == "Alpha City"
+    # Anywhere in the title, not just a prefix.
+    maps, total, _ = list_maps_catalog(db, q="ty", tags=[], tags_mode="any")
+    assert [m.title for m in maps] == ["Alpha City"]
+    maps, total, _ = list_maps_catalog(db, q="%", tags=[], tags_mode="any")
+    assert maps == []
+
+
+def test_short_search_is_a_substring_on_postgres(pg_db, owner_id):
+    create_map(pg_db, owner_id, make_public_map("Alpha City", tags=["Magic"]))
+    create_map(pg_db, owner_id, make_public_map("Beta Town", tags=["War"]))
+
+    maps, total, _ = list_maps_catalog(pg_db, q="ty", tags=[], tags_mode="any")
+    assert [m.title for m in maps] == ["Alpha City"]
+    maps, total, _ = list_maps_catalog(pg_db, q="%", tags=[], tags_mode="any")
+    assert maps == []
+    assert [row.name for row in list_tags(pg_db, q="gi")] == ["magic"]
+    assert [row.name for row in list_tags(pg_db, q="ar")] == ["war"]
+
+
+def test_search_matches_description_without_postgres(db, owner_id):
+    create_map(db, owner_id, MapCreate(title="Alpha City", description="Home of the wizard guild",
+                                       visibility="public", owner_username="u1"))
+    create_map(db, owner_id, make_public_map("Beta Town"))
+
+    maps, total, _ = list_maps_catalog(db, q="Wizard", tags=[], tags_mode="any")
+    assert [m.title for m in maps] == ["Alpha City"]
+
+
+def test_search_on_postgres_ranks_full_text_and_title_matches():
+    stmt, scores = _catalog_statement("wizard tower", [], "any", postgres=True)
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert "maps.search_vector @@ (websearch_to_tsquery(" in sql
+    assert "OR (maps.title %% " in sql
+    assert "similarity(maps.title" not in sql
+    assert "ts_rank_cd(maps.search_vector" in str(scores[0].compile(dialect=postgresql.dialect()))
+
+
+def test_catalog_cursor_pages_through_tag_filter(db, owner_id):
+    updated_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(5):
+        create_map(db, owner_id, make_public_map(f"Map {i}", tags=["Magic"]))
+    create_map(db, owner_id, make_public_map("Other", tags=["War"]))
+    db.query(Map).update({Map.updated_at: updated_at})
+    db.commit()
+
+    seen, cursor = [], None
+    while True:
+        maps, total, cursor = list_maps_catalog(db, q=None, tags=["magic"], tags_mode="any", limit=2, cursor=cursor)
+        assert total == 5
+        seen += [m.title for m in maps]
+        if cursor is None:
+            break
+    assert sorted(seen) == [f"Map {i}" for i in range(5)]
+
+
+def test_catalog_total_comes_with_the_page(db, owner_id):
+    for i in range(3):
+        create_map(db, owner_id, make_public_map(f"Map {i}", tags=["Magic"]))
+
+    maps, total, _ = list_maps_catalog(db, q=None, tags=[], tags_mode="any", offset=2, limit=2)
+    assert (len(maps), total) == (1, 3)
+    maps, total, _ = list_maps_catalog(db, q=None, tags=[], tags_mode="any", offset=10, limit=2)
+    assert (maps, total) == ([], 3)
+
+    # A total known from the cache is passed through without counting.
+    maps, total, _ = list_maps_catalog(db, q=None, tags=["magic"], tags_mode="any", limit=2, total=7)
+    assert (len(maps), total) == (2, 7)
+
+
+
+def test_search_cursor_pages_through_tied_scores_on_postgres(pg_db, owner_id):
+    # Equal titles score the same, so every page boundary falls in a tie and
+    # the cursor must match the score exactly to neither skip nor repeat.
+    for i in range(7):
+        create_map(pg_db, owner_id, make_public_map("Wizard Tower"))
+    for i in range(3):
+        create_map(pg_db, owner_id, make_public_map(f"Wizard Towers of Doom {i}"))
+    create_map(pg_db, owner_id, make_public_map("Orc Camp"))
+
+    seen, cursor = [], None
+    while True:
+        maps, total, cursor = list_maps_catalog(pg_db, q="wizard tower", tags=[], tags_mode="any", limit=3,
+                                                cursor=cursor)
+        assert total == 10
+        seen += [m.id for m in maps]
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 10
+
+
+def test_cursor_pages_take_the_total_from_the_cursor(db, owner_id):
+    for i in range(3):
+        create_map(db, owner_id, make_public_map(f"Map {i}"))
+
+    _, total, cursor = list_maps_catalog(db, q=None, tags=[], tags_mode="any", limit=2)
+    assert total == 3
+    # Not recounted: the map added since does not change the reported total.
+    create_map(db, owner_id, make_public_map("Late"))
+    _, total, _ = list_maps_catalog(db, q=None, tags=[], tags_mode="any", limit=2, cursor=cursor)
+    assert total == 3
+
+
+@pytest.mark.parametrize("filter_tags, tags_mode, expected", [
+    (["magic"], "any", {"Wizard Tower"}),
+    (["magic", "war"], "any", {"Wizard Tower", "Orc Camp"}),
+    (["rpg", "war"], "all", {"Orc Camp"}),
+    (["rpg", "nowhere"], "all", set()),
+    (["nowhere"], "any", set()),
+])
+def test_tag_filter_on_postgres_uses_tag_id_array(pg_db, owner_id, filter_tags, tags_mode, expected):
+    create_map(pg_db, owner_id, make_public_map("Wizard Tower", tags=["Magic", "RPG"]))
+    create_map(pg_db, owner_id, make_public_map("Orc Camp", tags=["RPG", "War"]))
+    create_map(pg_db, owner_id, make_public_map("Lonely Hill", tags=["Nature"]))
+
+    stmt, _ = _catalog_statement(None, filter_tags, tags_mode, postgres=True)
+    assert "maps.tag_ids" in str(stmt.compile(dialect=postgresql.dialect()))
+    maps, total, _ = list_maps_catalog(pg_db, q=None, tags=filter_tags, tags_mode=tags_mode)
+    assert {m.title for m in maps} == expected
+    assert total == len(expected)
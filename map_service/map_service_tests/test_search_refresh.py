@@ -0,0 +1,113 @@
+from uuid import uuid4
+
+import pytest
+from redis.exceptions import RedisError
+from sqlalchemy import func, select, update
+
+from map_service_app.catalog_cache import CATALOG, _version_key
+from map_service_app.crud import create_map, create_location, update_location, delete_location, list_maps_catalog
+from map_service_app.schemas import MapCreate, LocationCreate, LocationUpdate
+from map_service_app.models import Map
+from map_service_app.search_refresh import refresh_lock_key, schedule_refresh, refresh_map, backfill_search_vectors
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+
+
+class DownRedis:
+    def set(self, key, value, nx=False, ex=None):
+        raise RedisError("down")
+
+
+@pytest.fixture
+def owner_id():
+    return uuid4()
+
+
+def test_refresh_is_scheduled_once_per_burst_of_edits():
+    redis, enqueued = FakeRedis(), []
+
+    def enqueue(redis_conn, map_id):
+        enqueued.append(map_id)
+
+    assert schedule_refresh(redis, "m1", enqueue)
+    assert not schedule_refresh(redis, "m1", enqueue)
+    assert schedule_refresh(redis, "m2", enqueue)
+    assert enqueued == ["m1", "m2"]
+
+    # The job drops the lock before it reads, so later edits schedule again.
+    redis.delete(refresh_lock_key("m1"))
+    assert schedule_refresh(redis, "m1", enqueue)
+    assert enqueued == ["m1", "m2", "m1"]
+
+
+def test_failed_enqueue_releases_the_lock():
+    redis = FakeRedis()
+
+    def enqueue(redis_conn, map_id):
+        raise RedisError("down")
+
+    assert not schedule_refresh(redis, "m1", enqueue)
+    assert refresh_lock_key("m1") not in redis.data
+    # An edit is committed either way; only its search refresh is lost.
+    assert not schedule_refresh(DownRedis(), "m1", enqueue)
+
+
+def test_location_text_is_searchable_after_the_refresh_on_postgres(pg_db, owner_id):
+    redis = FakeRedis()
+    db_map = create_map(pg_db, owner_id, MapCreate(title="Northern Realm", description=None, visibility="public",
+                                                   owner_username="u1", tags=[]))
+    location = create_location(pg_db, LocationCreate(map_id=db_map.id, type="city", name="Драконьи горы",
+                                                     description_md="Логово старого дракона", x=10, y=20))
+
+    def found(q):
+        maps, total, _ = list_maps_catalog(pg_db, q=q, tags=[], tags_mode="any")
+        return [m.id for m in maps]
+
+    # Edits alone leave the vector as it was.
+    assert found("драконьи") == []
+    refresh_map(pg_db, redis, db_map.id)
+    assert redis.data[_version_key(CATALOG)] == 1
+    # By location name, through the stemmer ("дракон" matches "Драконьи"),
+    # and by location description.
+    assert found("драконьи") == [db_map.id]
+    assert found("дракон") == [db_map.id]
+    assert found("старого") == [db_map.id]
+
+    update_location(pg_db, location.id, LocationUpdate(name="Ледяные пустоши"))
+    refresh_map(pg_db, redis, db_map.id)
+    assert found("пустошь") == [db_map.id]
+    assert found("горы") == []
+
+    delete_location(pg_db, location.id)
+    refresh_map(pg_db, redis, db_map.id)
+    assert found("пустошь") == []
+    assert found("northern") == [db_map.id]
+
+
+def test_backfill_builds_missing_vectors_on_postgres(pg_db, owner_id):
+    for title in ("Dragon Keep", "Frozen Wastes", "Amber Coast"):
+        create_map(pg_db, owner_id, MapCreate(title=title, visibility="public", owner_username="u1", tags=[]))
+    pg_db.execute(update(Map).values(search_vector=None))
+    pg_db.commit()
+
+    assert backfill_search_vectors(pg_db, batch=2) == 2
+    assert backfill_search_vectors(pg_db, batch=2) == 1
+    assert backfill_search_vectors(pg_db, batch=2) == 0
+    pg_db.commit()
+    matched = pg_db.scalars(select(Map.title).where(Map.search_vector.op("@@")(func.plainto_tsquery("frozen"))))
+    assert matched.all() == ["Frozen Wastes"]
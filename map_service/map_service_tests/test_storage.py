@@ -0,0 +1,74 @@
+import io
+import os
+
+from map_service_app.storage import LocalStorage, S3Storage
+
+
+def test_local_save_upload_and_delete_prefix(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+
+    size = storage.save_upload("m1/source.png", io.BytesIO(b"x" * 5000))
+    assert size == 5000
+    assert (tmp_path / "m1" / "source.png").read_bytes() == b"x" * 5000
+    assert not os.path.exists(tmp_path / "m1" / "source.png.part")
+
+    assert storage.delete_prefix("m1") == 1
+    assert not (tmp_path / "m1").exists()
+    assert storage.delete_prefix("m1") == 0
+
+
+def test_s3_small_upload_uses_single_put(s3_client):
+    storage = S3Storage(s3_client, "sources", part_size=1024, concurrency=2)
+
+    storage.save_upload("m1/source.png", io.BytesIO(b"small"))
+    assert s3_client.buckets["sources"]["m1/source.png"] == b"small"
+    assert "upload_part" not in s3_client.calls
+
+
+def test_s3_large_upload_is_multipart(s3_client):
+    storage = S3Storage(s3_client, "sources", part_size=1024, concurrency=3)
+    payload = os.urandom(1024 * 10 + 17)
+
+    size = storage.save_upload("m2/source.png", io.BytesIO(payload))
+    assert size == len(payload)
+    assert s3_client.buckets["sources"]["m2/source.png"] == payload
+    assert s3_client.calls.count("upload_part") == 11
+    assert s3_client.uploads == {}
+
+
+def test_s3_delete_prefix_batches(s3_client):
+    storage = S3Storage(s3_client, "tiles")
+    for i in range(2500):
+        s3_client.put_object(Bucket="tiles", Key=f"m3/1/{i}.png", Body=b"t")
+    s3_client.put_object(Bucket="tiles", Key="m30/0/0/0.png", Body=b"t")
+
+    assert storage.delete_prefix("m3") == 2500
+    assert list(s3_client.buckets["tiles"]) == ["m30/0/0/0.png"]
+    assert s3_client.calls.count("delete_objects") == 3
+
+
+def test_local_link_prefix_is_copy_on_write(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    storage.save_upload("m1/0/0/0.png", io.BytesIO(b"a"))
+    storage.save_upload("m1/1/0/0.png", io.BytesIO(b"b"))
+    (tmp_path / "m1" / "1" / "0" / "1.png.part").write_bytes(b"partial")
+
+    assert storage.link_prefix("m1", "m2") == 2
+    assert os.path.samefile(tmp_path / "m1" / "1" / "0" / "0.png", tmp_path / "m2" / "1" / "0" / "0.png")
+    assert not (tmp_path / "m2" / "1" / "0" / "1.png.part").exists()
+
+    storage.save_upload("m2/1/0/0.png", io.BytesIO(b"new"))
+    assert (tmp_path / "m1" / "1" / "0" / "0.png").read_bytes() == b"b"
+    assert (tmp_path / "m2" / "1" / "0" / "0.png").read_bytes() == b"new"
+
+
+def test_s3_link_prefix_copies_server_side(s3_client):
+    storage = S3Storage(s3_client, "tiles", concurrency=4)
+    for i in range(150):
+        s3_client.put_object(Bucket="tiles", Key=f"m1/1/{i}.png", Body=b"t%d" % i)
+    s3_client.put_object(Bucket="tiles", Key="m10/0/0/0.png", Body=b"other")
+
+    assert storage.link_prefix("m1", "m2") == 150
+    assert s3_client.buckets["tiles"]["m2/1/149.png"] == b"t149"
+    assert "m2/0/0/0.png" not in s3_client.buckets["tiles"]
+    assert s3_client.calls.count("copy") == 150
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from rq.job import JobStatus
+
+from map_service_app.crud import (create_map, get_map_by_id, update_map_tiles_info, touch_map_viewed,
+                                  select_idle_maps, update_map_tiles_archived, update_map_tiles_rehydrated)
+from map_service_app.models import Map
+from map_service_app.schemas import MapCreate, TilesInfo, TilesArchived
+from map_service_app.tiering import enqueue_idle_maps, tier_job_id, request_rehydrate
+
+
+def tiled_map(db, last_viewed_days=None):
+    m = create_map(db, uuid4(), MapCreate(title="m", owner_username="u"))
+    update_map_tiles_info(db, m.id, TilesInfo(width=10, height=10, max_zoom=0, tiles_path=f"/tiles/{m.id}/"))
+    if last_viewed_days is not None:
+        db.query(Map).filter(Map.id == m.id).update(
+            {Map.last_viewed_at: datetime.now(timezone.utc) - timedelta(days=last_viewed_days)})
+        db.commit()
+    return m
+
+
+def test_views_are_recorded_without_touching_updated_at(db):
+    m = tiled_map(db)
+    updated_at = m.updated_at
+
+    touch_map_viewed(db, m.id, timedelta(hours=1))
+    db.refresh(m)
+    first_view = m.last_viewed_at
+    assert first_view is not None
+    assert m.updated_at == updated_at
+
+    touch_map_viewed(db, m.id, timedelta(hours=1))
+    db.refresh(m)
+    assert m.last_viewed_at == first_view
+
+
+def test_idle_maps_are_selected_oldest_first(db):
+    idle, idler, recent = tiled_map(db, 100), tiled_map(db, 200), tiled_map(db, 1)
+    untiled = create_map(db, uuid4(), MapCreate(title="u", owner_username="u"))
+    archived = tiled_map(db, 300)
+    update_map_tiles_archived(db, archived.id, TilesArchived(tiles=1, bytes_reclaimed=10, archive_bytes=12))
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=90)
+    assert select_idle_maps(db, cutoff, 10) == [idler.id, idle.id]
+    assert select_idle_maps(db, cutoff, 1) == [idler.id]
+    assert recent.id not in select_idle_maps(db, cutoff, 10) and untiled.id not in select_idle_maps(db, cutoff, 10)
+
+
+def test_archive_state_follows_callbacks_and_retiles(db):
+    m = tiled_map(db, 100)
+    updated_at = m.updated_at
+
+    assert update_map_tiles_archived(db, m.id, TilesArchived(tiles=3, bytes_reclaimed=3000, archive_bytes=3100))
+    m = get_map_by_id(db, m.id)
+    db.refresh(m)
+    assert m.tiles_archived_at is not None and m.tiles_bytes_reclaimed == 3000
+    assert m.updated_at == updated_at
+
+    assert update_map_tiles_rehydrated(db, m.id)
+    db.refresh(m)
+    assert m.tiles_archived_at is None
+    assert not update_map_tiles_rehydrated(db, uuid4())
+
+    update_map_tiles_archived(db, m.id, TilesArchived(tiles=3, bytes_reclaimed=3000, archive_bytes=3100))
+    update_map_tiles_info(db, m.id, TilesInfo(width=10, height=10, max_zoom=0, tiles_path=f"/tiles/{m.id}/"))
+    db.refresh(m)
+    assert m.tiles_archived_at is None and m.tiles_bytes_reclaimed is None
+
+
+def test_enqueue_idle_maps_skips_pending_jobs(db):
+    first, second = tiled_map(db, 200), tiled_map(db, 100)
+    statuses = {tier_job_id(first.id): JobStatus.QUEUED, tier_job_id(second.id): JobStatus.FINISHED}
+    enqueued = []
+
+    _, count = enqueue_idle_maps(db, None, idle_days=90, limit=10,
+                                 enqueue=lambda r, map_id: enqueued.append(map_id),
+                                 job_status=lambda r, job_id: (statuses.get(job_id), None))
+    assert count == 1
+    assert enqueued == [str(second.id)]
+
+
+def test_maps_left_loose_do_not_stall_later_runs(db):
+    first, second = tiled_map(db, 200), tiled_map(db, 100)
+    enqueued = []
+
+    def run():
+        enqueue_idle_maps(db, None, idle_days=90, limit=1, enqueue=lambda r, map_id: enqueued.append(map_id),
+                          job_status=lambda r, job_id: (None, None))
+
+    # Nothing reclaimable: the job never reports first as archived.
+    run()
+    run()
+    assert enqueued == [str(first.id), str(second.id)]
+    db.refresh(first)
+    assert first.tiering_checked_at is not None
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+
+def test_rehydrate_is_requested_once_per_lock():
+    redis, enqueued = FakeRedis(), []
+
+    def enqueue(redis_conn, map_id, requested_at):
+        enqueued.append(map_id)
+
+    assert request_rehydrate(redis, "m1", enqueue)
+    assert not request_rehydrate(redis, "m1", enqueue)
+    assert enqueued == ["m1"]
+    assert "tiering:rehydrate:m1" in redis.data
@@ -0,0 +1,99 @@
+import io
+import struct
+import zlib
+
+import pytest
+
+import map_service_app.validation as validation
+from map_service_app.storage import LocalStorage
+from map_service_app.validation import InvalidImage, check_png_header, PngChunkReader
+
+
+def chunk(kind, data):
+    return struct.pack("!I", len(data)) + kind + data + struct.pack("!I", zlib.crc32(kind + data))
+
+
+def ihdr(width, height, bit_depth=8, color_type=2, interlace=0):
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack("!IIBBBBB", width, height, bit_depth, color_type, 0, 0,
+                                                                 interlace))
+
+
+def png_bytes(width=64, height=48, color_type=2, idat_size=1 << 20):
+    channels = {2: 3, 3: 1, 6: 4}[color_type]
+    pixels = zlib.compress((b"\x00" + b"\x7f" * width * channels) * height)
+    data = ihdr(width, height, color_type=color_type) + chunk(b"tEXt", b"Title\x00map")
+    if color_type == 3:
+        data += chunk(b"PLTE", b"\xff\x00\x00")
+    for i in range(0, len(pixels), idat_size):
+        data += chunk(b"IDAT", pixels[i:i + idat_size])
+    return data + chunk(b"IEND", b"")
+
+
+def read_all(data, size=7):
+    reader = PngChunkReader(io.BytesIO(data))
+    out = b""
+    while chunk := reader.read(size):
+        out += chunk
+    return out
+
+
+def test_header_check_reads_dimensions_only():
+    info = check_png_header(png_bytes()[:40])
+    assert (info["width"], info["height"], info["bit_depth"], info["interlaced"]) == (64, 48, 8, False)
+
+
+@pytest.mark.parametrize("header, status", [
+    (b"GIF89a" + b"\0" * 40, 400),
+    (ihdr(10, 10)[:20], 400),
+    (ihdr(10, 10, bit_depth=16, color_type=3), 400),
+    (ihdr(0, 10), 400),
+    (ihdr(100_000, 10), 413),
+    (ihdr(40_000, 40_000), 413),
+])
+def test_header_check_rejects(header, status):
+    with pytest.raises(InvalidImage) as e:
+        check_png_header(header)
+    assert e.value.status_code == status
+
+
+def test_header_check_applies_configured_limits(monkeypatch):
+    monkeypatch.setattr(validation, "UPLOAD_MAX_BIT_DEPTH", 8)
+    monkeypatch.setattr(validation, "UPLOAD_ALLOW_INTERLACED", False)
+    with pytest.raises(InvalidImage, match="bits per channel"):
+        check_png_header(ihdr(10, 10, bit_depth=16))
+    with pytest.raises(InvalidImage, match="Interlaced"):
+        check_png_header(ihdr(10, 10, interlace=1))
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"color_type": 3}, {"color_type": 6, "idat_size": 16}])
+def test_chunk_reader_passes_valid_images_through(kwargs):
+    data = png_bytes(**kwargs)
+    assert read_all(data) == data
+    assert read_all(data, size=1 << 20) == data
+
+
+def test_chunk_reader_rejects_bad_structure():
+    data = png_bytes()
+    idat = data.index(b"IDAT")
+
+    with pytest.raises(InvalidImage, match="Truncated"):
+        read_all(data[:-6])
+    with pytest.raises(InvalidImage, match="Corrupt PNG chunk IDAT"):
+        read_all(data[:idat + 10] + bytes([data[idat + 10] ^ 1]) + data[idat + 11:])
+    with pytest.raises(InvalidImage, match="after the end"):
+        read_all(data + b"junk")
+    with pytest.raises(InvalidImage, match="Unsupported PNG chunk"):
+        read_all(data[:33] + chunk(b"ABCD", b"") + data[33:])
+    with pytest.raises(InvalidImage, match="without a palette"):
+        read_all(ihdr(4, 4, color_type=3) + data[33:])
+
+
+def test_rejected_upload_keeps_stored_image(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    good = png_bytes()
+    storage.save_upload("m/source.png", PngChunkReader(io.BytesIO(good)))
+
+    with pytest.raises(InvalidImage):
+        storage.save_upload("m/source.png", PngChunkReader(io.BytesIO(good[:-20])))
+    assert (tmp_path / "m" / "source.png").read_bytes() == good
+    assert not (tmp_path / "m" / "source.png.part").exists()
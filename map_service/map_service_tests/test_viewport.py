@@ -0,0 +1,94 @@
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import insert, select, text
+
+from map_service_app import viewport
+from map_service_app.crud import (create_map, create_location, update_location, get_locations_in_view_async,
+                                  _viewport_statement)
+from map_service_app.models import Location
+from map_service_app.schemas import MapCreate, LocationCreate, LocationUpdate
+
+# With the default 64px cells.
+
+
+def make_map(db):
+    return create_map(db, uuid4(), MapCreate(title="m", owner_username="u", visibility="public", tags=[]))
+
+
+def add(db, map_obj, x, y):
+    return create_location(db, LocationCreate(map_id=map_obj.id, type="city", name=f"{x},{y}", x=x, y=y))
+
+
+def test_cell_keys_interleave_cell_coordinates():
+    assert viewport.cell_key(0, 0) == 0
+    assert viewport.cell_key(64, 0) == 0b01
+    assert viewport.cell_key(0, 64) == 0b10
+    assert viewport.cell_key(3 * 64, 3 * 64) == 0b1111
+    # Off the grid: clamped to its edge cells.
+    assert viewport.cell_key(-500, -1) == 0
+    assert viewport.cell_key(1e12, 0) == viewport._key(viewport.CELL_MAX, 0)
+
+
+@pytest.mark.parametrize("bbox", [(10, 10, 20, 20), (0, 0, 4095, 4095), (100, 900, 5000, 1300),
+                                  (-100, -100, 65535, 65535), (1000, 60000, 1064, 64000)])
+def test_key_ranges_cover_the_box(bbox):
+    ranges = viewport.key_ranges(bbox)
+    assert len(ranges) <= viewport.VIEWPORT_BLOCKS ** 2
+    assert all(lo <= hi < next_lo for (lo, hi), (next_lo, _) in zip(ranges, ranges[1:]))
+    min_x, min_y, max_x, max_y = bbox
+    for x in (min_x, (min_x + max_x) / 2, max_x):
+        for y in (min_y, (min_y + max_y) / 2, max_y):
+            key = viewport.cell_key(x, y)
+            assert any(lo <= key <= hi for lo, hi in ranges)
+
+
+def test_location_writes_keep_the_cell_key(db):
+    map_obj = make_map(db)
+    location = add(db, map_obj, 10, 10)
+    assert location.cell_key == viewport.cell_key(10, 10)
+    location = update_location(db, location.id, LocationUpdate(x=700, y=90))
+    assert location.cell_key == viewport.cell_key(700, 90)
+
+
+def test_backfill_keys_old_locations(db):
+    map_obj = make_map(db)
+    db.execute(insert(Location), [{"map_id": map_obj.id, "type": "city", "name": str(i), "x": i * 100, "y": 5}
+                                  for i in range(5)])
+    db.commit()
+
+    assert viewport.backfill_cell_keys(db, batch=3) == 3
+    assert viewport.backfill_cell_keys(db, batch=3) == 2
+    assert viewport.backfill_cell_keys(db, batch=3) == 0
+    db.commit()
+    rows = db.execute(select(Location.x, Location.y, Location.cell_key)).all()
+    assert all(key == viewport.cell_key(x, y) for x, y, key in rows)
+
+
+async def test_viewport_pages_through_the_box_on_postgres(pg_db, pg_async_db):
+    map_obj = make_map(pg_db)
+    for x in range(0, 2000, 50):
+        for y in range(0, 1000, 50):
+            add(pg_db, map_obj, x, y)
+
+    bbox = (120, 80, 1330, 640)
+    seen, cursor = [], None
+    while True:
+        page, cursor = await get_locations_in_view_async(pg_async_db, map_obj.id, bbox, limit=37, cursor=cursor)
+        assert len(page) <= 37
+        seen += [location.name for location in page]
+        if cursor is None:
+            break
+
+    expected = {f"{x},{y}" for x in range(150, 1330, 50) for y in range(100, 640, 50)}
+    assert len(seen) == len(expected) and set(seen) == expected
+
+
+def test_viewport_range_is_read_in_index_order_on_postgres(pg_db):
+    map_id = uuid4()
+    stmt = _viewport_statement(map_id, (0, 0, 500, 500), (0, 63), (12, uuid4()), 101)
+    compiled = stmt.compile(pg_db.get_bind(), compile_kwargs={"render_postcompile": True})
+    pg_db.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = "\n".join(row[0] for row in pg_db.connection().exec_driver_sql(f"EXPLAIN {compiled}", compiled.params))
+    assert "ix_locations_map_id_cell_key_id" in plan
+    assert "Sort" not in plan
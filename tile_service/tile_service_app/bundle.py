@@ -0,0 +1,56 @@
+import struct
+from typing import Iterator
+
+# Bundle layout (network byte order):
+#   header: magic "TBND", version u8, z u8, tile count u32
+#   per tile: x u32, y u32, etag length u16, data length u32, etag, data
+# A tile that does not exist is sent with empty etag and data.
+BUNDLE_MAGIC = b"TBND"
+BUNDLE_VERSION = 1
+BUNDLE_MEDIA_TYPE = "application/x-tile-bundle"
+
+_header = struct.Struct("!4sBBI")
+_entry = struct.Struct("!IIHI")
+
+
+def iter_tile_range(x_min: int, x_max: int, y_min: int, y_max: int):
+    # Row by row from the top of the viewport, the order a viewer paints in.
+    for y in range(y_max, y_min - 1, -1):
+        for x in range(x_min, x_max + 1):
+            yield x, y
+
+
+def encode_bundle(source, z: int, coords: list[tuple[int, int]]) -> Iterator[bytes]:
+    try:
+        yield _header.pack(BUNDLE_MAGIC, BUNDLE_VERSION, z, len(coords))
+
+        for x, y in coords:
+            tile = source.read_tile(z, x, y)
+            if tile is None:
+                yield _entry.pack(x, y, 0, 0)
+                continue
+
+            data, etag = tile
+            etag_bytes = etag.encode("ascii")
+            yield _entry.pack(x, y, len(etag_bytes), len(data)) + etag_bytes + data
+    finally:
+        source.close()
+
+
+def decode_bundle(payload: bytes) -> dict:
+    magic, version, z, count = _header.unpack_from(payload, 0)
+    if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+        raise ValueError("Not a tile bundle")
+
+    offset = _header.size
+    tiles = {}
+    for _ in range(count):
+        x, y, etag_len, data_len = _entry.unpack_from(payload, offset)
+        offset += _entry.size
+        etag = payload[offset:offset + etag_len].decode("ascii")
+        offset += etag_len
+        data = payload[offset:offset + data_len]
+        offset += data_len
+        tiles[(x, y)] = (data, etag) if data_len else None
+
+    return {"z": z, "tiles": tiles}
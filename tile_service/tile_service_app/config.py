@@ -9,4 +9,80 @@ SOURCE_IMAGES_PATH = os.getenv("SOURCE_IMAGES_PATH", "/shared_uploads")
 
 TILES_OUTPUT_PATH = os.getenv("TILES_OUTPUT_PATH", "/tiles")
 
-MAP_SERVICE_URL = os.getenv("MAP_SERVICE_URL", "http://map_service:8000")
\ No newline at end of file
+MAP_SERVICE_URL = os.getenv("MAP_SERVICE_URL", "http://map_service:8000")
+
+TILES_ARCHIVE_PATH = os.getenv("TILES_ARCHIVE_PATH", TILES_OUTPUT_PATH)
+
+BUNDLE_MAX_TILES = int(os.getenv("BUNDLE_MAX_TILES", "256"))
+
+TILE_ENCODE_WORKERS = int(os.getenv("TILE_ENCODE_WORKERS", str(os.cpu_count() or 2)))
+
+TILE_WRITE_WORKERS = int(os.getenv("TILE_WRITE_WORKERS", "4"))
+
+TILE_QUEUE_SIZE = int(os.getenv("TILE_QUEUE_SIZE", "64"))
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+
+S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY")
+
+S3_SECRET_KEY = os.getenv("S3_SECRET_KEY")
+
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+
+S3_SOURCES_BUCKET = os.getenv("S3_SOURCES_BUCKET", "sources")
+
+S3_TILES_BUCKET = os.getenv("S3_TILES_BUCKET", "tiles")
+
+FANOUT_MIN_PIXELS = int(os.getenv("FANOUT_MIN_PIXELS", str(100_000_000)))
+
+FANOUT_REGION_SIZE = int(os.getenv("FANOUT_REGION_SIZE", "8192"))
+
+FANOUT_RETRIES = int(os.getenv("FANOUT_RETRIES", "3"))
+
+FANOUT_JOB_TIMEOUT = int(os.getenv("FANOUT_JOB_TIMEOUT", "1800"))
+
+WORKER_MODE = os.getenv("WORKER_MODE", "fork")
+
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", "2"))
+
+WORKER_MAX_JOBS = int(os.getenv("WORKER_MAX_JOBS", "500"))
+
+WORKER_RECYCLE_RSS_MB = int(os.getenv("WORKER_RECYCLE_RSS_MB", "2048"))
+
+WORKER_MEMORY_LIMIT_MB = int(os.getenv("WORKER_MEMORY_LIMIT_MB", "0"))
+
+ESTIMATE_CPU_SECONDS_PER_TILE = float(os.getenv("ESTIMATE_CPU_SECONDS_PER_TILE", "0.004"))
+
+ESTIMATE_CPU_SECONDS_PER_MEGAPIXEL = float(os.getenv("ESTIMATE_CPU_SECONDS_PER_MEGAPIXEL", "0.12"))
+
+ESTIMATE_BYTES_PER_TILE = int(os.getenv("ESTIMATE_BYTES_PER_TILE", "40000"))
+
+ESTIMATE_BASE_MEMORY_MB = int(os.getenv("ESTIMATE_BASE_MEMORY_MB", "120"))
+
+ESTIMATE_HEADER_BYTES = int(os.getenv("ESTIMATE_HEADER_BYTES", str(64 * 1024)))
+
+TILE_QUEUES = [q.strip() for q in os.getenv("TILE_QUEUES", "default,low").split(",") if q.strip()]
+
+MAX_SOURCE_PIXELS = int(os.getenv("MAX_SOURCE_PIXELS", str(4_000_000_000)))
+
+TILE_COMPRESS_LEVEL = int(os.getenv("TILE_COMPRESS_LEVEL", "1"))
+
+RECOMPRESS_QUEUE = os.getenv("RECOMPRESS_QUEUE", "low")
+
+RECOMPRESS_JOB_TIMEOUT = int(os.getenv("RECOMPRESS_JOB_TIMEOUT", "3600"))
+
+TILE_FORMAT = os.getenv("TILE_FORMAT", "png-256-lanczos")
+
+EXPORT_PDF_DPI = int(os.getenv("EXPORT_PDF_DPI", "150"))
+
+EXTRACT_MAX_DIM = int(os.getenv("EXTRACT_MAX_DIM", "4096"))
+
+TIER_QUEUE = os.getenv("TIER_QUEUE", "low")
+
+REHYDRATE_QUEUE = os.getenv("REHYDRATE_QUEUE", "default")
+
+ARCHIVE_CACHE_SIZE = int(os.getenv("ARCHIVE_CACHE_SIZE", "32"))
+
+TIER_JOB_TIMEOUT = int(os.getenv("TIER_JOB_TIMEOUT", "3600"))
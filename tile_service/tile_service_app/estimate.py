@@ -0,0 +1,51 @@
+import io
+import math
+from PIL import Image
+
+from tile_service_app.config import (ESTIMATE_CPU_SECONDS_PER_TILE, ESTIMATE_CPU_SECONDS_PER_MEGAPIXEL,
+                                     ESTIMATE_BYTES_PER_TILE, ESTIMATE_BASE_MEMORY_MB, TILE_QUEUE_SIZE,
+                                     FANOUT_MIN_PIXELS)
+from tile_service_app.fanout import plan_fanout
+from tile_service_app.tiler import TILE_SIZE, compute_max_zoom
+
+
+def read_image_header(header: bytes) -> tuple[int, int, str]:
+    # Image.open only parses the header; pixel data is never touched, so a
+    # truncated prefix of the file is enough.
+    with Image.open(io.BytesIO(header)) as img:
+        return img.width, img.height, img.mode
+
+
+def count_tiles(width: int, height: int, max_zoom: int) -> int:
+    total = 0
+    for z in range(max_zoom + 1):
+        scale = 2 ** (max_zoom - z)
+        total += math.ceil(math.ceil(width / scale) / TILE_SIZE) * math.ceil(math.ceil(height / scale) / TILE_SIZE)
+    return total
+
+
+def estimate_tiling_cost(width: int, height: int, mode: str = "RGBA") -> dict:
+    max_zoom = compute_max_zoom(width, height)
+    tiles = count_tiles(width, height, max_zoom)
+    pixels = width * height
+    bands = Image.getmodebands(mode) if mode else 4
+
+    # Resizing touches every source pixel once per level; the level sizes form
+    # a geometric series, so the total is bounded by ~4/3 of the source.
+    megapixels = pixels / 1_000_000
+    cpu_seconds = tiles * ESTIMATE_CPU_SECONDS_PER_TILE + megapixels * ESTIMATE_CPU_SECONDS_PER_MEGAPIXEL * 4 / 3
+
+    # Decoded source + RGBA copy + full-size resized level, plus tiles in flight.
+    in_flight = 2 * TILE_QUEUE_SIZE * TILE_SIZE * TILE_SIZE * 4
+    peak_memory = pixels * (bands + 4 + 4) + in_flight + ESTIMATE_BASE_MEMORY_MB * 1024 * 1024
+
+    return {
+        "width": width,
+        "height": height,
+        "max_zoom": max_zoom,
+        "tiles": tiles,
+        "cpu_seconds": round(cpu_seconds, 2),
+        "peak_memory_mb": math.ceil(peak_memory / (1024 * 1024)),
+        "output_bytes": tiles * ESTIMATE_BYTES_PER_TILE,
+        "fanout": pixels >= FANOUT_MIN_PIXELS and plan_fanout(width, height) is not None,
+    }
@@ -0,0 +1,226 @@
+import io
+import math
+import struct
+import zlib
+from PIL import Image, ImageDraw, ImageFont
+
+from tile_service_app.config import EXPORT_PDF_DPI
+from tile_service_app.tiler import TILE_SIZE
+
+# Largest page side a PDF viewer is required to handle, in points.
+PDF_MAX_PAGE_POINTS = 14400
+
+
+def choose_export_level(width: int, height: int, max_zoom: int, max_dim: int):
+    # The coarsest level that still has at least the requested resolution, so
+    # the export is only ever scaled down, and by less than a factor of two.
+    target = min(max_dim, max(width, height))
+    for z in range(max_zoom + 1):
+        scale = 2 ** (max_zoom - z)
+        level_w, level_h = math.ceil(width / scale), math.ceil(height / scale)
+        if max(level_w, level_h) >= target:
+            break
+
+    factor = target / max(level_w, level_h)
+    out_size = (max(1, round(level_w * factor)), max(1, round(level_h * factor)))
+    return z, (level_w, level_h), out_size
+
+
+class LevelRows:
+    # Rows of one zoom level, stitched from its tiles a tile row at a time from
+    # the top. Bands must be requested top to bottom; rows above the last band
+    # are dropped, so at most about two tile rows are held at once.
+
+    def __init__(self, read_tile, z: int, width: int, height: int):
+        self.read_tile = read_tile
+        self.z = z
+        self.width = width
+        self.height = height
+        self.tiles_x = math.ceil(width / TILE_SIZE)
+        self.next_tile_y = math.ceil(height / TILE_SIZE) - 1
+        self.top = 0
+        self.buf = Image.new("RGB", (width, 0))
+        self.peak_rows = 0
+
+    def _load_next(self) -> None:
+        y = self.next_tile_y
+        strip = Image.new("RGB", (self.tiles_x * TILE_SIZE, TILE_SIZE), "white")
+        for x in range(self.tiles_x):
+            data = self.read_tile(self.z, x, y)
+            if data is None:
+                continue
+            with Image.open(io.BytesIO(data)) as tile:
+                tile = tile.convert("RGBA")
+                strip.paste(tile, (x * TILE_SIZE, 0), tile)
+
+        # Tiles are counted from the bottom; the top row is padded above.
+        strip_top = self.height - (y + 1) * TILE_SIZE
+        strip = strip.crop((0, max(0, -strip_top), self.width, TILE_SIZE))
+
+        buf = Image.new("RGB", (self.width, self.buf.height + strip.height))
+        buf.paste(self.buf, (0, 0))
+        buf.paste(strip, (0, self.buf.height))
+        self.buf = buf
+        self.next_tile_y -= 1
+        self.peak_rows = max(self.peak_rows, buf.height)
+
+    def band(self, top: int, bottom: int) -> Image.Image:
+        if top < self.top:
+            raise ValueError("bands must be requested top to bottom")
+        if top > self.top:
+            self.buf = self.buf.crop((0, top - self.top, self.width, self.buf.height))
+            self.top = top
+        while self.top + self.buf.height < bottom:
+            self._load_next()
+        return self.buf.crop((0, 0, self.width, bottom - self.top))
+
+
+class LocationPainter:
+    def __init__(self, locations: list[dict], src_size: tuple[int, int], out_size: tuple[int, int]):
+        # Locations use the viewer's coordinates: source pixels, y up from the bottom.
+        src_w, src_h = src_size
+        sx, sy = out_size[0] / src_w, out_size[1] / src_h
+        self.points = [(loc["x"] * sx, (src_h - loc["y"]) * sy, loc.get("name") or "") for loc in locations]
+        self.radius = max(4, max(out_size) // 300)
+        self.font = ImageFont.load_default(size=self.radius * 3)
+        self.reach = self.radius * 4
+
+    def paint(self, band: Image.Image, top: int) -> None:
+        draw = ImageDraw.Draw(band)
+        r = self.radius
+        for x, y, name in self.points:
+            y -= top
+            if y < -self.reach or y > band.height + self.reach:
+                continue
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=(200, 30, 30), outline="white", width=max(1, r // 3))
+            if name:
+                draw.text((x + r + 2, y), name, font=self.font, anchor="lm", fill="black",
+                          stroke_width=max(1, r // 3), stroke_fill="white")
+
+
+def iter_export_bands(read_tile, map_info: dict, locations: list[dict], max_dim: int):
+    width, height = map_info["width"], map_info["height"]
+    z, (level_w, level_h), (out_w, out_h) = choose_export_level(width, height, map_info["max_zoom"], max_dim)
+    rows = LevelRows(read_tile, z, level_w, level_h)
+    painter = LocationPainter(locations, (width, height), (out_w, out_h))
+
+    fx, fy = out_w / level_w, out_h / level_h
+    # Source rows either side of a band that Lanczos (support 3) reads from.
+    margin = math.ceil(3 / fy) + 1
+    band_rows = max(1, math.floor(TILE_SIZE * fy))
+
+    for out_top in range(0, out_h, band_rows):
+        out_bottom = min(out_h, out_top + band_rows)
+        src_top, src_bottom = out_top / fy, out_bottom / fy
+        top = max(0, math.floor(src_top) - margin)
+        bottom = min(level_h, math.ceil(src_bottom) + margin)
+
+        source = rows.band(top, bottom)
+        if (out_w, out_h) == (level_w, level_h):
+            band = source.crop((0, out_top - top, out_w, out_bottom - top))
+        else:
+            band = source.resize((out_w, out_bottom - out_top), Image.LANCZOS,
+                                 box=(0, src_top - top, level_w, src_bottom - top))
+
+        painter.paint(band, out_top)
+        yield band
+
+
+class PngStreamWriter:
+    # Writes an RGB PNG band by band: rows go through one zlib stream and out
+    # as IDAT chunks, so the whole image never has to exist in memory.
+
+    def __init__(self, f, width: int, height: int, compress_level: int = 6):
+        self.f = f
+        self.width = width
+        self.compressor = zlib.compressobj(compress_level)
+        f.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack("!IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def write(self, band: Image.Image) -> None:
+        raw = band.tobytes()
+        stride = self.width * 3
+        # Filter type 0 (None) in front of every scanline.
+        data = b"".join(b"\x00" + raw[i:i + stride] for i in range(0, len(raw), stride))
+        out = self.compressor.compress(data)
+        if out:
+            self._chunk(b"IDAT", out)
+
+    def close(self) -> None:
+        self._chunk(b"IDAT", self.compressor.flush())
+        self._chunk(b"IEND", b"")
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self.f.write(struct.pack("!I", len(data)) + kind + data + struct.pack("!I", zlib.crc32(kind + data)))
+
+
+class PdfStreamWriter:
+    # A one-page PDF holding a single Flate-compressed RGB image. The image
+    # stream's length is an indirect object written after the stream, so the
+    # image can be compressed band by band like the PNG.
+
+    def __init__(self, f, width: int, height: int, compress_level: int = 6):
+        self.f = f
+        self.width = width
+        self.pos = 0
+        self.offsets = []
+        self.compressor = zlib.compressobj(compress_level)
+        self.stream_length = 0
+
+        dpi = max(EXPORT_PDF_DPI, max(width, height) * 72 / PDF_MAX_PAGE_POINTS)
+        page_w, page_h = width * 72 / dpi, height * 72 / dpi
+        content = f"q {page_w:.2f} 0 0 {page_h:.2f} 0 0 cm /Im0 Do Q".encode()
+
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>")
+        self._object(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w:.2f} {page_h:.2f}] "
+            f"/Resources << /XObject << /Im0 5 0 R >> >> /Contents 4 0 R >>".encode()
+        )
+        self._object(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+
+        self.offsets.append(self.pos)
+        self._write(
+            f"5 0 obj\n<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode /Length 6 0 R >>\nstream\n".encode()
+        )
+
+    def write(self, band: Image.Image) -> None:
+        self._stream(self.compressor.compress(band.tobytes()))
+
+    def close(self) -> None:
+        self._stream(self.compressor.flush())
+        self._write(b"\nendstream\nendobj\n")
+        self._object(str(self.stream_length).encode())
+
+        xref = self.pos
+        entries = "".join(f"{offset:010d} 00000 n \n" for offset in self.offsets)
+        self._write(
+            f"xref\n0 {len(self.offsets) + 1}\n0000000000 65535 f \n{entries}"
+            f"trailer\n<< /Size {len(self.offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+        )
+
+    def _stream(self, data: bytes) -> None:
+        self.stream_length += len(data)
+        self._write(data)
+
+    def _object(self, body: bytes) -> None:
+        self.offsets.append(self.pos)
+        self._write(b"%d 0 obj\n" % len(self.offsets) + body + b"\nendobj\n")
+
+    def _write(self, data: bytes) -> None:
+        self.f.write(data)
+        self.pos += len(data)
+
+
+EXPORT_WRITERS = {"png": PngStreamWriter, "pdf": PdfStreamWriter}
+
+
+def export_map(read_tile, map_info: dict, locations: list[dict], fmt: str, max_dim: int, f) -> tuple[int, int]:
+    _, _, (out_w, out_h) = choose_export_level(map_info["width"], map_info["height"], map_info["max_zoom"], max_dim)
+    writer = EXPORT_WRITERS[fmt](f, out_w, out_h)
+    for band in iter_export_bands(read_tile, map_info, locations, max_dim):
+        writer.write(band)
+    writer.close()
+    return out_w, out_h
@@ -0,0 +1,112 @@
+import hashlib
+import io
+import math
+from PIL import Image
+
+from tile_service_app.tiler import TILE_SIZE
+
+EXTRACT_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+# Extra level pixels read around the box so Lanczos has its full support.
+RESAMPLE_MARGIN = 4
+
+
+def normalize_extract(bbox: tuple[float, float, float, float], width: int | None, height: int | None,
+                      src_width: int, src_height: int, max_dim: int):
+    # bbox is in the viewer's map coordinates (source pixels, y up). It is
+    # clipped to the map and rounded, and a missing output side follows the
+    # box's aspect ratio, so equivalent requests share one cache entry.
+    min_x, min_y, max_x, max_y = bbox
+    min_x, max_x = max(0.0, min(min_x, max_x)), min(float(src_width), max(min_x, max_x))
+    min_y, max_y = max(0.0, min(min_y, max_y)), min(float(src_height), max(min_y, max_y))
+    box = tuple(round(v, 2) for v in (min_x, min_y, max_x, max_y))
+
+    box_w, box_h = box[2] - box[0], box[3] - box[1]
+    if box_w <= 0 or box_h <= 0:
+        raise ValueError("Bounding box does not overlap the map")
+
+    if width is None and height is None:
+        scale = min(1.0, max_dim / max(box_w, box_h))
+        width, height = round(box_w * scale), round(box_h * scale)
+    elif width is None:
+        width = round(height * box_w / box_h)
+    elif height is None:
+        height = round(width * box_h / box_w)
+
+    width, height = max(1, width), max(1, height)
+    if width > max_dim or height > max_dim:
+        raise ValueError(f"Output size is limited to {max_dim}px per side")
+
+    return box, (width, height)
+
+
+def extract_key(map_id: str, version: str, box, size, fmt: str, quality: int) -> str:
+    digest = hashlib.sha1(repr((box, size, fmt, quality)).encode()).hexdigest()[:20]
+    return f"{map_id}/extracts/{version}/{digest}.{fmt}"
+
+
+def choose_extract_level(box, size, max_zoom: int) -> int:
+    # The coarsest level with at least as many pixels across the box as the
+    # output; requests beyond the source resolution use the deepest level.
+    box_w, box_h = box[2] - box[0], box[3] - box[1]
+    for z in range(max_zoom + 1):
+        scale = 2 ** (max_zoom - z)
+        if box_w / scale >= size[0] and box_h / scale >= size[1]:
+            return z
+    return max_zoom
+
+
+def render_extract(read_tile, box, size, src_width: int, src_height: int, max_zoom: int) -> Image.Image:
+    z = choose_extract_level(box, size, max_zoom)
+    scale = 2 ** (max_zoom - z)
+    level_w, level_h = math.ceil(src_width / scale), math.ceil(src_height / scale)
+    kx, ky = level_w / src_width, level_h / src_height
+
+    # Box in level pixels, top-down.
+    left, right = box[0] * kx, box[2] * kx
+    top, bottom = (src_height - box[3]) * ky, (src_height - box[1]) * ky
+
+    win_left = max(0, math.floor(left) - RESAMPLE_MARGIN)
+    win_top = max(0, math.floor(top) - RESAMPLE_MARGIN)
+    win_right = min(level_w, math.ceil(right) + RESAMPLE_MARGIN)
+    win_bottom = min(level_h, math.ceil(bottom) + RESAMPLE_MARGIN)
+
+    # Only the tiles overlapping the window are read. Tile rows are counted
+    # from the bottom of the level, whose top row is padded above.
+    tx0, tx1 = win_left // TILE_SIZE, (win_right - 1) // TILE_SIZE
+    ty0, ty1 = (level_h - win_bottom) // TILE_SIZE, (level_h - 1 - win_top) // TILE_SIZE
+    block_top = level_h - (ty1 + 1) * TILE_SIZE
+
+    canvas = Image.new("RGBA", ((tx1 - tx0 + 1) * TILE_SIZE, (ty1 - ty0 + 1) * TILE_SIZE), (0, 0, 0, 0))
+    for x in range(tx0, tx1 + 1):
+        for y in range(ty0, ty1 + 1):
+            data = read_tile(z, x, y)
+            if data is None:
+                continue
+            with Image.open(io.BytesIO(data)) as tile:
+                canvas.paste(tile.convert("RGBA"), ((x - tx0) * TILE_SIZE, (ty1 - y) * TILE_SIZE))
+
+    origin_x, origin_y = tx0 * TILE_SIZE, block_top
+    return canvas.resize(
+        size,
+        Image.LANCZOS,
+        box=(left - origin_x, top - origin_y, right - origin_x, bottom - origin_y),
+    )
+
+
+def encode_extract(image: Image.Image, fmt: str, quality: int) -> bytes:
+    pil_format, _ = EXTRACT_FORMATS[fmt]
+    buf = io.BytesIO()
+    if fmt == "jpeg":
+        flat = Image.new("RGB", image.size, "white")
+        flat.paste(image, (0, 0), image)
+        flat.save(buf, format=pil_format, quality=quality, optimize=True)
+    elif fmt == "webp":
+        image.save(buf, format=pil_format, quality=quality, method=4)
+    else:
+        image.save(buf, format=pil_format, optimize=True)
+    return buf.getvalue()
@@ -0,0 +1,130 @@
+import io
+import math
+import logging
+from PIL import Image
+
+from tile_service_app.config import (TILE_ENCODE_WORKERS, TILE_WRITE_WORKERS, TILE_QUEUE_SIZE, TILE_COMPRESS_LEVEL,
+                                     FANOUT_REGION_SIZE)
+from tile_service_app.pipeline import TilePipeline
+from tile_service_app.tiler import TILE_SIZE, compute_max_zoom, render_zoom_level
+
+logger = logging.getLogger("tile_service")
+
+# Extra source pixels around each region crop, in tiles of the split level, so
+# resampling at region edges sees the same neighbours as a whole-image resize.
+REGION_MARGIN_TILES = 4
+
+
+def plan_fanout(width: int, height: int, region_size: int = FANOUT_REGION_SIZE):
+    # A region is a square of region_size source pixels anchored, like the tile
+    # grid, at the bottom-left corner. At split_zoom each region is exactly one
+    # tile, and every level below that is rendered by the region's own job.
+    if region_size % TILE_SIZE or (region_size // TILE_SIZE) & (region_size // TILE_SIZE - 1):
+        raise ValueError("region_size must be a power-of-two multiple of the tile size")
+
+    max_zoom = compute_max_zoom(width, height)
+    split_zoom = max_zoom - int(math.log2(region_size // TILE_SIZE))
+    cols = math.ceil(width / region_size)
+    rows = math.ceil(height / region_size)
+
+    if split_zoom < 1 or cols * rows < 2:
+        return None
+
+    return {
+        "width": width,
+        "height": height,
+        "max_zoom": max_zoom,
+        "split_zoom": split_zoom,
+        "region_size": region_size,
+        "regions": [[rx, ry] for ry in range(rows) for rx in range(cols)],
+    }
+
+
+def region_box(plan: dict, rx: int, ry: int) -> tuple[int, int, int, int]:
+    size = plan["region_size"]
+    width, height = plan["width"], plan["height"]
+    return (
+        rx * size,
+        max(0, height - (ry + 1) * size),
+        min(width, (rx + 1) * size),
+        height - ry * size,
+    )
+
+
+def region_crop_box(plan: dict, rx: int, ry: int) -> tuple[int, int, int, int]:
+    margin = REGION_MARGIN_TILES * plan["region_size"] // TILE_SIZE
+    left, upper, right, lower = region_box(plan, rx, ry)
+    return (
+        max(0, left - margin),
+        max(0, upper - margin),
+        min(plan["width"], right + margin),
+        min(plan["height"], lower + margin),
+    )
+
+
+def region_source_key(map_id: str, rx: int, ry: int) -> str:
+    return f"{map_id}/regions/{rx}_{ry}.png"
+
+
+def pyramid_keys(width: int, height: int, max_zoom: int) -> set[str]:
+    keys = set()
+    for z in range(max_zoom + 1):
+        scale = 2 ** (max_zoom - z)
+        tiles_x = math.ceil(math.ceil(width / scale) / TILE_SIZE)
+        tiles_y = math.ceil(math.ceil(height / scale) / TILE_SIZE)
+        keys.update(f"{z}/{x}/{y}.png" for x in range(tiles_x) for y in range(tiles_y))
+    return keys
+
+
+def split_source(map_id: str, image: Image.Image, plan: dict, source_storage) -> None:
+    # The source is decoded once here; region jobs then only decode their own
+    # crop. Crops are throwaway, so they are stored with the fastest compression.
+    for rx, ry in plan["regions"]:
+        crop = image.crop(region_crop_box(plan, rx, ry))
+        buf = io.BytesIO()
+        crop.save(buf, format="PNG", compress_level=1)
+        source_storage.put_bytes(region_source_key(map_id, rx, ry), buf.getvalue())
+
+
+def render_region(crop: Image.Image, plan: dict, rx: int, ry: int, writer) -> None:
+    left, upper, right, lower = region_box(plan, rx, ry)
+    crop_left, crop_upper, _, _ = region_crop_box(plan, rx, ry)
+    box = (left - crop_left, upper - crop_upper, right - crop_left, lower - crop_upper)
+    region_w, region_h = right - left, lower - upper
+
+    with TilePipeline(TILE_SIZE, writer.write, TILE_ENCODE_WORKERS, TILE_WRITE_WORKERS, TILE_QUEUE_SIZE,
+                      TILE_COMPRESS_LEVEL) as pipeline:
+        for z in range(plan["split_zoom"], plan["max_zoom"] + 1):
+            scale = 2 ** (plan["max_zoom"] - z)
+            resized = crop.resize(
+                (math.ceil(region_w / scale), math.ceil(region_h / scale)),
+                Image.LANCZOS,
+                box=box,
+            )
+            tiles_per_region = plan["region_size"] // scale // TILE_SIZE
+            render_zoom_level(resized, z, pipeline, rx * tiles_per_region, ry * tiles_per_region)
+
+
+def assemble_coarse_levels(plan: dict, writer) -> None:
+    # Stitch the split level back together from the regions' tiles and render
+    # the coarser levels from it; that image is at most one tile per region.
+    width, height, max_zoom, split_zoom = plan["width"], plan["height"], plan["max_zoom"], plan["split_zoom"]
+
+    scale = 2 ** (max_zoom - split_zoom)
+    level_w, level_h = math.ceil(width / scale), math.ceil(height / scale)
+    tiles_x, tiles_y = math.ceil(level_w / TILE_SIZE), math.ceil(level_h / TILE_SIZE)
+
+    canvas = Image.new("RGBA", (tiles_x * TILE_SIZE, tiles_y * TILE_SIZE), (0, 0, 0, 0))
+    for x in range(tiles_x):
+        for y in range(tiles_y):
+            with Image.open(io.BytesIO(writer.read(f"{split_zoom}/{x}/{y}.png"))) as tile:
+                canvas.paste(tile, (x * TILE_SIZE, canvas.height - (y + 1) * TILE_SIZE))
+
+    level = canvas.crop((0, canvas.height - level_h, level_w, canvas.height))
+
+    with TilePipeline(TILE_SIZE, writer.write, TILE_ENCODE_WORKERS, TILE_WRITE_WORKERS, TILE_QUEUE_SIZE,
+                      TILE_COMPRESS_LEVEL) as pipeline:
+        for z in range(split_zoom):
+            scale = 2 ** (max_zoom - z)
+            resized = level.resize((math.ceil(width / scale), math.ceil(height / scale)), Image.LANCZOS)
+            render_zoom_level(resized, z, pipeline)
@@ -0,0 +1,22 @@
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+from tile_service_app.routes import bundle, estimate, extract, tiles
+
+app = FastAPI(
+    title="Tile Service",
+    description="Сервис выдачи тайлов карт",
+    version="1.0"
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["*"],
+)
+
+app.include_router(bundle.router, prefix="/bundle", tags=["bundle"])
+app.include_router(estimate.router, prefix="/estimate", tags=["estimate"])
+app.include_router(extract.router, prefix="/extract", tags=["extract"])
+app.include_router(tiles.router, tags=["tiles"])
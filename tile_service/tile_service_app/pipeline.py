@@ -0,0 +1,171 @@
+import io
+import queue
+import threading
+from PIL import Image
+
+_STOP = object()
+
+
+class TilePipeline:
+    # Producer (caller) -> encode_queue -> encoder threads -> write_queue -> writer threads.
+    # Pillow releases the GIL while compressing, so encoders overlap with the
+    # blocking filesystem or object-storage writes done by the writers.
+
+    def __init__(self, tile_size: int, write, encode_workers: int, write_workers: int, queue_size: int,
+                 compress_level: int = 6):
+        self.tile_size = tile_size
+        self.write = write
+        self.compress_level = compress_level
+        self.encode_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+
+        self._lock = threading.Lock()
+        self._error = None
+        self._pending = {}
+        self._sealed = {}
+        self._stats = {
+            "encode": {"processed": 0, "peak_depth": 0},
+            "write": {"processed": 0, "peak_depth": 0, "bytes": 0},
+        }
+
+        self._encoders = [
+            threading.Thread(target=self._encode_loop, name=f"tile-encode-{i}", daemon=True)
+            for i in range(max(1, encode_workers))
+        ]
+        self._writers = [
+            threading.Thread(target=self._write_loop, name=f"tile-write-{i}", daemon=True)
+            for i in range(max(1, write_workers))
+        ]
+
+    def __enter__(self):
+        for t in self._encoders + self._writers:
+            t.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+            return False
+
+        try:
+            self.close()
+        except RuntimeError:
+            pass
+        return False
+
+    def submit(self, tile: Image.Image, key: str, group=None) -> None:
+        self._raise_if_failed()
+        if group is not None:
+            with self._lock:
+                self._pending[group] = self._pending.get(group, 0) + 1
+        self.encode_queue.put((tile, key, group))
+        self._track_depth("encode", self.encode_queue)
+
+    def seal(self, group, on_done) -> None:
+        # No more tiles will be submitted for `group`; on_done(group) runs once
+        # all of them are written, on whichever thread writes the last one.
+        with self._lock:
+            if self._pending.get(group, 0) > 0:
+                self._sealed[group] = on_done
+                return
+        self._run_callback(on_done, group)
+
+    def close(self) -> None:
+        for _ in self._encoders:
+            self.encode_queue.put(_STOP)
+        for t in self._encoders:
+            t.join()
+
+        for _ in self._writers:
+            self.write_queue.put(_STOP)
+        for t in self._writers:
+            t.join()
+
+        self._raise_if_failed()
+
+    def queue_depths(self) -> dict:
+        return {"encode": self.encode_queue.qsize(), "write": self.write_queue.qsize()}
+
+    def stats(self) -> dict:
+        depths = self.queue_depths()
+        with self._lock:
+            return {stage: dict(values, depth=depths[stage]) for stage, values in self._stats.items()}
+
+    def _encode_loop(self) -> None:
+        while True:
+            item = self.encode_queue.get()
+            if item is _STOP:
+                return
+            if self._error is not None:
+                continue
+
+            tile, key, group = item
+            try:
+                data = self._encode(tile)
+            except Exception as e:
+                self._fail(e)
+                continue
+
+            self.write_queue.put((data, key, group))
+            self._track_depth("write", self.write_queue)
+            with self._lock:
+                self._stats["encode"]["processed"] += 1
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self.write_queue.get()
+            if item is _STOP:
+                return
+            if self._error is not None:
+                continue
+
+            data, key, group = item
+            try:
+                self.write(key, data)
+            except Exception as e:
+                self._fail(e)
+                continue
+
+            on_done = None
+            with self._lock:
+                self._stats["write"]["processed"] += 1
+                self._stats["write"]["bytes"] += len(data)
+                if group is not None:
+                    self._pending[group] -= 1
+                    if self._pending[group] == 0:
+                        on_done = self._sealed.pop(group, None)
+
+            if on_done is not None:
+                self._run_callback(on_done, group)
+
+    def _run_callback(self, on_done, group) -> None:
+        try:
+            on_done(group)
+        except Exception as e:
+            self._fail(e)
+
+    def _encode(self, tile: Image.Image) -> bytes:
+        tile_w, tile_h = tile.size
+        if tile_w != self.tile_size or tile_h != self.tile_size:
+            padded = Image.new("RGBA", (self.tile_size, self.tile_size), (0, 0, 0, 0))
+            padded.paste(tile, (0, self.tile_size - tile_h))
+            tile = padded
+
+        buf = io.BytesIO()
+        tile.save(buf, format="PNG", compress_level=self.compress_level)
+        return buf.getvalue()
+
+    def _track_depth(self, stage: str, q: queue.Queue) -> None:
+        depth = q.qsize()
+        with self._lock:
+            if depth > self._stats[stage]["peak_depth"]:
+                self._stats[stage]["peak_depth"] = depth
+
+    def _fail(self, error: Exception) -> None:
+        with self._lock:
+            if self._error is None:
+                self._error = error
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"Tile pipeline failed: {self._error}") from self._error
@@ -0,0 +1,43 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from tile_service_app.config import TILE_ENCODE_WORKERS
+
+logger = logging.getLogger("tile_service")
+
+
+def recompress_png(data: bytes) -> bytes | None:
+    # Lossless: same pixels, maximum zlib effort plus Pillow's filter search.
+    # Returns None when that does not beat the bytes we already have.
+    with Image.open(io.BytesIO(data)) as tile:
+        tile.load()
+        buf = io.BytesIO()
+        tile.save(buf, format="PNG", optimize=True)
+
+    smaller = buf.getvalue()
+    return smaller if len(smaller) < len(data) else None
+
+
+def recompress_pyramid(storage, prefix: str, workers: int = TILE_ENCODE_WORKERS) -> dict:
+    keys = [k for k in storage.list_keys(prefix.rstrip("/") + "/") if k.endswith(".png")]
+
+    def recompress_one(key: str) -> tuple[int, int]:
+        data, version = storage.get_versioned(key)
+        smaller = recompress_png(data)
+        if smaller is None or not storage.replace_if_unchanged(key, smaller, version):
+            return len(data), 0
+        return len(data), len(data) - len(smaller)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(recompress_one, keys))
+
+    stats = {
+        "tiles": len(keys),
+        "tiles_replaced": sum(1 for _, saved in results if saved > 0),
+        "bytes_before": sum(size for size, _ in results),
+        "bytes_saved": sum(saved for _, saved in results),
+    }
+    logger.info("recompressed %s: %s", prefix, stats)
+    return stats
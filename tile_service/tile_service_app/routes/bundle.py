@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from uuid import UUID
+
+from tile_service_app.bundle import BUNDLE_MEDIA_TYPE, encode_bundle, iter_tile_range
+from tile_service_app.config import TILES_OUTPUT_PATH, TILES_ARCHIVE_PATH, BUNDLE_MAX_TILES
+from tile_service_app.sources import open_tile_source
+
+router = APIRouter()
+
+
+@router.get("/{map_id}/{z}")
+def get_tile_bundle_endpoint(
+        map_id: UUID,
+        z: int,
+        x_min: int = Query(..., ge=0),
+        x_max: int = Query(..., ge=0),
+        y_min: int = Query(..., ge=0),
+        y_max: int = Query(..., ge=0),
+):
+    if z < 0 or z > 255:
+        raise HTTPException(status_code=400, detail="Invalid zoom level")
+
+    if x_min > x_max or y_min > y_max:
+        raise HTTPException(status_code=400, detail="Invalid tile range")
+
+    # Checked before the response starts; past the level's grid (or a u32
+    # of the bundle format) the stream would break off mid-body.
+    if max(x_max, y_max) >= min(2 ** z, 2 ** 32):
+        raise HTTPException(status_code=400, detail="Tile range outside the zoom level")
+
+    # Sized from the bounds, so a huge range is refused before anything is
+    # allocated for it.
+    if (x_max - x_min + 1) * (y_max - y_min + 1) > BUNDLE_MAX_TILES:
+        raise HTTPException(status_code=400, detail=f"Too many tiles requested (max {BUNDLE_MAX_TILES})")
+    coords = list(iter_tile_range(x_min, x_max, y_min, y_max))
+
+    source = open_tile_source(TILES_OUTPUT_PATH, TILES_ARCHIVE_PATH, str(map_id))
+    if source is None:
+        raise HTTPException(status_code=404, detail="Tiles not found")
+
+    return StreamingResponse(
+        encode_bundle(source, z, coords),
+        media_type=BUNDLE_MEDIA_TYPE,
+        headers={"Cache-Control": "public, max-age=3600"},
+    )
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, HTTPException, Request
+from PIL import Image
+
+from tile_service_app.config import ESTIMATE_HEADER_BYTES
+from tile_service_app.estimate import read_image_header, estimate_tiling_cost
+
+router = APIRouter()
+
+
+@router.post("")
+async def estimate_endpoint(request: Request):
+    header = (await request.body())[:ESTIMATE_HEADER_BYTES]
+
+    try:
+        width, height, mode = read_image_header(header)
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=413, detail="Image is too large to be tiled")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Unreadable image header")
+
+    return estimate_tiling_cost(width, height, mode)
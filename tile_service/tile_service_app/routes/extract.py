@@ -0,0 +1,84 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from uuid import UUID
+
+from tile_service_app.config import TILES_ARCHIVE_PATH, EXTRACT_MAX_DIM
+from tile_service_app.extract import EXTRACT_FORMATS, normalize_extract, extract_key, render_extract, encode_extract
+from tile_service_app.sources import StoredTileSource
+from tile_service_app.storage import get_source_storage, get_tile_storage
+from tile_service_app.tiering import archive_file
+
+router = APIRouter()
+
+
+def parse_bbox(bbox: str) -> tuple[float, float, float, float]:
+    try:
+        values = tuple(float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_x,min_y,max_x,max_y")
+    if len(values) != 4:
+        raise HTTPException(status_code=400, detail="bbox must be min_x,min_y,max_x,max_y")
+    return values
+
+
+def build_extract(map_id: str, key: str, box, size, fmt: str, quality: int,
+                  src_width: int, src_height: int, max_zoom: int) -> bytes | None:
+    source = StoredTileSource(get_tile_storage(), archive_file(TILES_ARCHIVE_PATH, map_id), map_id)
+    try:
+        # Every pyramid has its level 0 tile.
+        if source.read_tile(0, 0, 0) is None:
+            return None
+        image = render_extract(source.read_tile, box, size, src_width, src_height, max_zoom)
+    finally:
+        source.close()
+    data = encode_extract(image, fmt, quality)
+
+    # Entries of older tile versions are dropped when a new one is written.
+    storage = get_source_storage()
+    prefix = f"{map_id}/extracts/"
+    version_prefix = key.rsplit("/", 1)[0] + "/"
+    storage.delete_keys([k for k in storage.list_keys(prefix) if not k.startswith(version_prefix)])
+    storage.put_bytes(key, data)
+    return data
+
+
+@router.get("/{map_id}")
+async def extract_endpoint(
+        map_id: UUID,
+        bbox: str = Query(...),
+        src_width: int = Query(..., ge=1),
+        src_height: int = Query(..., ge=1),
+        max_zoom: int = Query(..., ge=0, le=64),
+        version: str = Query(..., pattern=r"^[0-9a-f]{1,40}$"),
+        width: Optional[int] = Query(None, ge=1),
+        height: Optional[int] = Query(None, ge=1),
+        format: Literal["png", "webp", "jpeg"] = Query("png"),
+        quality: int = Query(85, ge=1, le=100),
+):
+    # Map metadata and access checks come from map_service, which is the
+    # only caller; this endpoint is not routed through nginx.
+    try:
+        box, size = normalize_extract(parse_bbox(bbox), width, height, src_width, src_height, EXTRACT_MAX_DIM)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "png":
+        quality = 0
+    key = extract_key(str(map_id), version, box, size, format, quality)
+    storage = get_source_storage()
+
+    data = await run_in_threadpool(storage.get_bytes, key)
+    if data is None:
+        data = await run_in_threadpool(build_extract, str(map_id), key, box, size, format, quality,
+                                       src_width, src_height, max_zoom)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Tiles not found")
+
+    return Response(
+        content=data,
+        media_type=EXTRACT_FORMATS[format][1],
+        headers={"ETag": f'"{key.rsplit("/", 1)[1].split(".")[0]}"', "Cache-Control": "public, max-age=86400"},
+    )
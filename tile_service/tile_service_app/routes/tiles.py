@@ -0,0 +1,63 @@
+import os
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import Response
+from redis import Redis
+from rq import Queue
+from uuid import UUID
+
+from tile_service_app.config import (TILES_OUTPUT_PATH, TILES_ARCHIVE_PATH, REDIS_URL, REHYDRATE_QUEUE,
+                                     ARCHIVE_CACHE_SIZE)
+from tile_service_app.sources import ArchiveCache, DirectoryTileSource
+from tile_service_app.tiering import archive_file, request_rehydrate, tiering_stats
+
+router = APIRouter()
+
+archives = ArchiveCache(ARCHIVE_CACHE_SIZE)
+
+
+@lru_cache
+def get_redis() -> Redis:
+    return Redis.from_url(REDIS_URL)
+
+
+def rq_enqueue_rehydrate(map_id: str, requested_at: float) -> None:
+    Queue(name=REHYDRATE_QUEUE, connection=get_redis()).enqueue(
+        "tile_service_app.tasks.rehydrate_task",
+        map_id,
+        requested_at,
+        description=f"rehydrate tiles of map {map_id}",
+    )
+
+
+@router.get("/tiles/{map_id}/{z}/{x}/{y}.png")
+def get_tile_endpoint(map_id: UUID, z: int, x: int, y: int,
+                      if_none_match: Optional[str] = Header(None)):
+    # nginx serves loose tiles itself and only falls back to this for tiles
+    # it can't find, which mostly means the map was moved to the cold tier:
+    # the tile is served from the archive and the map is unpacked behind it.
+    tiles_dir = os.path.join(TILES_OUTPUT_PATH, str(map_id))
+    if os.path.isdir(tiles_dir):
+        hit = DirectoryTileSource(tiles_dir).read_tile(z, x, y)
+    else:
+        source = archives.get(archive_file(TILES_ARCHIVE_PATH, str(map_id)))
+        if source is None:
+            raise HTTPException(status_code=404, detail="Tile not found")
+        hit = source.read_tile(z, x, y)
+        request_rehydrate(get_redis(), str(map_id), rq_enqueue_rehydrate)
+
+    if hit is None:
+        raise HTTPException(status_code=404, detail="Tile not found")
+
+    data, etag = hit
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=3600"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type="image/png", headers=headers)
+
+
+@router.get("/tiering/stats")
+def tiering_stats_endpoint():
+    return tiering_stats(get_redis())
@@ -0,0 +1,122 @@
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+def directory_etag(st: os.stat_result) -> str:
+    # Same format nginx uses, so bundle and single-tile responses agree.
+    return f'"{int(st.st_mtime):x}-{st.st_size:x}"'
+
+
+def archive_etag(info: zipfile.ZipInfo) -> str:
+    return f'"{info.CRC:08x}-{info.file_size:x}"'
+
+
+def tile_name(z: int, x: int, y: int) -> str:
+    return f"{z}/{x}/{y}.png"
+
+
+class DirectoryTileSource:
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+
+    def read_tile(self, z: int, x: int, y: int) -> Optional[Tuple[bytes, str]]:
+        path = os.path.join(self.base_path, str(z), str(x), f"{y}.png")
+        try:
+            with open(path, "rb") as f:
+                st = os.fstat(f.fileno())
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return data, directory_etag(st)
+
+    def close(self) -> None:
+        pass
+
+
+class ArchiveTileSource:
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+        self._zip = zipfile.ZipFile(archive_path, "r")
+
+    def read_tile(self, z: int, x: int, y: int) -> Optional[Tuple[bytes, str]]:
+        try:
+            info = self._zip.getinfo(tile_name(z, x, y))
+        except KeyError:
+            return None
+        return self._zip.read(info), archive_etag(info)
+
+    def close(self) -> None:
+        self._zip.close()
+
+
+class ArchiveCache:
+    # The most recently read archives, kept open so tile requests don't each
+    # reopen the zip and parse its central directory. An entry is keyed on
+    # the file it opened: a repack replaces the file and so reopens it, and
+    # once a rehydrate removes it the entry goes. Dropped sources are not
+    # closed here; the ZipFile closes itself once no request is reading it.
+    def __init__(self, size: int):
+        self.size = size
+        self._sources: OrderedDict[str, tuple[tuple, ArchiveTileSource]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, archive_path: str) -> Optional[ArchiveTileSource]:
+        try:
+            st = os.stat(archive_path)
+        except FileNotFoundError:
+            with self._lock:
+                self._sources.pop(archive_path, None)
+            return None
+        ident = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            entry = self._sources.get(archive_path)
+            if entry is not None and entry[0] == ident:
+                self._sources.move_to_end(archive_path)
+                return entry[1]
+
+        try:
+            source = ArchiveTileSource(archive_path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._sources[archive_path] = (ident, source)
+            self._sources.move_to_end(archive_path)
+            while len(self._sources) > self.size:
+                self._sources.popitem(last=False)
+        return source
+
+
+class StoredTileSource:
+    # A map's tiles from the tile storage (local or S3), falling back to its
+    # cold-tier archive: maps idle long enough have their tiles packed away.
+    def __init__(self, tile_storage, archive_path: str, map_id: str):
+        self.tile_storage = tile_storage
+        self.map_id = map_id
+        self._archived = ArchiveTileSource(archive_path) if os.path.isfile(archive_path) else None
+
+    def read_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        data = self.tile_storage.get_bytes(f"{self.map_id}/{tile_name(z, x, y)}")
+        if data is None and self._archived is not None:
+            hit = self._archived.read_tile(z, x, y)
+            data = hit[0] if hit else None
+        return data
+
+    def close(self) -> None:
+        if self._archived is not None:
+            self._archived.close()
+
+
+def open_tile_source(tiles_path: str, archive_path: str, map_id: str):
+    tiles_dir = os.path.join(tiles_path, map_id)
+    if os.path.isdir(tiles_dir):
+        return DirectoryTileSource(tiles_dir)
+
+    archive = os.path.join(archive_path, f"{map_id}.zip")
+    if os.path.isfile(archive):
+        return ArchiveTileSource(archive)
+
+    return None
@@ -0,0 +1,401 @@
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+from tile_service_app.config import (STORAGE_BACKEND, SOURCE_IMAGES_PATH, TILES_OUTPUT_PATH, S3_ENDPOINT_URL,
+                                     S3_ACCESS_KEY, S3_SECRET_KEY, S3_REGION, S3_SOURCES_BUCKET, S3_TILES_BUCKET)
+
+S3_DELETE_BATCH = 1000
+S3_COPY_WORKERS = 16
+DOWNLOAD_CHUNK = 1024 * 1024
+
+
+class LocalPyramidWriter:
+    # Tiles are staged in <map>__tmp. commit() swaps the whole directory in at
+    # once; publish_level() instead replaces single finished zoom levels of
+    # the live directory, so the previous pyramid's other levels stay
+    # viewable meanwhile. Its levels deeper than the new pyramid are only
+    # removed by commit(), and abort() leaves the live tree as it is. The
+    # marker file lists the published levels, so later writers of the same
+    # staging dir (e.g. other jobs) finish the progressive publish instead
+    # of swapping.
+    PROGRESSIVE_MARKER = ".progressive"
+
+    def __init__(self, final_dir: str, fresh: bool = True):
+        self.final_dir = final_dir
+        self.tmp_dir = f"{final_dir}__tmp"
+        self._dirs = set()
+        self._lock = threading.Lock()
+
+        if fresh and os.path.isdir(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def write(self, key: str, data: bytes) -> None:
+        path = os.path.join(self.tmp_dir, key)
+        parent = os.path.dirname(path)
+        if parent not in self._dirs:
+            os.makedirs(parent, exist_ok=True)
+            with self._lock:
+                self._dirs.add(parent)
+
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def read(self, key: str) -> bytes:
+        with open(os.path.join(self.tmp_dir, key), "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _swap(new: str, final: str) -> None:
+        # The old directory is moved aside rather than deleted first, so the
+        # path is only missing between two renames.
+        old = f"{final}__old"
+        if os.path.isdir(old):
+            shutil.rmtree(old)
+        if os.path.isdir(final):
+            os.replace(final, old)
+        os.replace(new, final)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def publish_level(self, z: int) -> None:
+        level_tmp = os.path.join(self.tmp_dir, str(z))
+        if not os.path.isdir(level_tmp):
+            return
+        os.makedirs(self.final_dir, exist_ok=True)
+        self._swap(level_tmp, os.path.join(self.final_dir, str(z)))
+        with open(os.path.join(self.tmp_dir, self.PROGRESSIVE_MARKER), "a") as f:
+            f.write(f"{z}\n")
+
+    def commit(self, expected: set[str] | None = None) -> None:
+        marker = os.path.join(self.tmp_dir, self.PROGRESSIVE_MARKER)
+        if not os.path.exists(marker):
+            self._swap(self.tmp_dir, self.final_dir)
+            return
+
+        levels = sorted(int(name) for name in os.listdir(self.tmp_dir) if name.isdigit())
+        for z in levels:
+            self.publish_level(z)
+        with open(marker) as f:
+            published = {line.strip() for line in f if line.strip()}
+        for name in os.listdir(self.final_dir):
+            if name.isdigit() and name not in published:
+                shutil.rmtree(os.path.join(self.final_dir, name))
+        shutil.rmtree(self.tmp_dir)
+
+    def abort(self) -> None:
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class LocalStorage:
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        # Replaced, never rewritten in place: map clones hardlink our files.
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.part", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.part", path)
+
+    @contextmanager
+    def local_copy(self, key: str):
+        path = self.path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} does not exist")
+        yield path
+
+    def get_bytes(self, key: str) -> bytes | None:
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_file(self, key: str, local_path: str) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(local_path, f"{path}.part")
+        os.replace(f"{path}.part", path)
+
+    def open_pyramid(self, prefix: str, fresh: bool = True) -> LocalPyramidWriter:
+        return LocalPyramidWriter(self.path(prefix), fresh=fresh)
+
+    def link_pyramid(self, src_prefix: str, prefix: str) -> int:
+        # Hardlinks another pyramid's tiles in as this one and commits them;
+        # returns how many there were (0 leaves the pyramid as it is).
+        src = self.path(src_prefix)
+        keys = [os.path.relpath(self.path(k), src) for k in self.list_keys(src_prefix)]
+        if not keys:
+            return 0
+        writer = self.open_pyramid(prefix)
+        for key in keys:
+            dst = os.path.join(writer.tmp_dir, key)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            try:
+                os.link(os.path.join(src, key), dst)
+            except OSError:
+                shutil.copy2(os.path.join(src, key), dst)
+        writer.commit()
+        return len(keys)
+
+    def list_keys(self, prefix: str) -> list[str]:
+        base = self.path(prefix)
+        keys = []
+        for dirpath, _, files in os.walk(base):
+            rel = os.path.relpath(dirpath, self.root)
+            keys.extend(f"{rel}/{name}".replace(os.sep, "/") for name in files)
+        return keys
+
+    def delete_keys(self, keys: list[str]) -> int:
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+        return len(keys)
+
+    def get_versioned(self, key: str) -> tuple[bytes, tuple]:
+        with open(self.path(key), "rb") as f:
+            st = os.fstat(f.fileno())
+            return f.read(), (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def replace_if_unchanged(self, key: str, data: bytes, version: tuple) -> bool:
+        # The new file is written next to the old one and renamed over it, so
+        # readers see either version in full. A file that was rewritten (e.g.
+        # by a re-tile) since get_versioned() is left alone.
+        path = self.path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            st = os.stat(path)
+            if (st.st_ino, st.st_mtime_ns, st.st_size) != version:
+                os.remove(tmp)
+                return False
+            os.replace(tmp, path)
+            return True
+        except FileNotFoundError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return False
+
+    def delete_prefix(self, prefix: str) -> int:
+        path = self.path(prefix)
+        if not os.path.isdir(path):
+            return 0
+        count = sum(len(files) for _, _, files in os.walk(path))
+        shutil.rmtree(path)
+        return count
+
+
+class S3PyramidWriter:
+    # Tiles are staged under <map>__tmp/ and copied server-side to their live
+    # keys by publish_level() or commit(); until then the published pyramid
+    # is untouched, and abort() only drops the staged copies. Tiles left over
+    # from a previous, larger pyramid are removed on commit. When several
+    # jobs write one pyramid, the committing job passes the full set of
+    # expected keys.
+
+    def __init__(self, storage: "S3Storage", prefix: str, fresh: bool = True):
+        self.storage = storage
+        self.prefix = prefix.rstrip("/") + "/"
+        self.staging = prefix.rstrip("/") + "__tmp/"
+        self._written = set()
+        self._lock = threading.Lock()
+
+        if fresh:
+            self.storage.delete_prefix(self.staging)
+
+    def write(self, key: str, data: bytes) -> None:
+        self.storage.client.put_object(
+            Bucket=self.storage.bucket,
+            Key=self.staging + key,
+            Body=data,
+            ContentType="image/png",
+        )
+        with self._lock:
+            self._written.add(self.prefix + key)
+
+    def read(self, key: str) -> bytes:
+        return self.storage.client.get_object(Bucket=self.storage.bucket, Key=self.staging + key)["Body"].read()
+
+    def _publish(self, staged: list[str]) -> None:
+        # Copies staged keys to their live names, then drops the staged copies.
+        def copy(key: str) -> None:
+            self.storage.client.copy_object(
+                Bucket=self.storage.bucket,
+                Key=self.prefix + key[len(self.staging):],
+                CopySource={"Bucket": self.storage.bucket, "Key": key},
+            )
+
+        with ThreadPoolExecutor(max_workers=S3_COPY_WORKERS) as pool:
+            list(pool.map(copy, staged))
+        self.storage.delete_keys(staged)
+
+    def publish_level(self, z: int) -> None:
+        staged = self.storage.list_keys(f"{self.staging}{z}/")
+        if not staged:
+            return
+        self._publish(staged)
+        live = {self.prefix + k[len(self.staging):] for k in staged}
+        self.storage.delete_keys([k for k in self.storage.list_keys(f"{self.prefix}{z}/") if k not in live])
+
+    def commit(self, expected: set[str] | None = None) -> None:
+        self._publish(self.storage.list_keys(self.staging))
+        keep = self._written if expected is None else {self.prefix + k for k in expected}
+        stale = [k for k in self.storage.list_keys(self.prefix) if k not in keep]
+        self.storage.delete_keys(stale)
+
+    def abort(self) -> None:
+        self.storage.delete_prefix(self.staging)
+
+
+class S3Storage:
+    def __init__(self, client, bucket: str):
+        self.client = client
+        self.bucket = bucket
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except Exception as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    @contextmanager
+    def local_copy(self, key: str):
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        try:
+            with os.fdopen(fd, "wb") as f:
+                try:
+                    body = self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+                except Exception as e:
+                    if getattr(e, "response", {}).get("Error", {}).get("Code") == "NoSuchKey":
+                        raise FileNotFoundError(f"s3://{self.bucket}/{key} does not exist") from e
+                    raise
+                while True:
+                    chunk = body.read(DOWNLOAD_CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            yield path
+        finally:
+            os.remove(path)
+
+    def open_pyramid(self, prefix: str, fresh: bool = True) -> S3PyramidWriter:
+        return S3PyramidWriter(self, prefix, fresh=fresh)
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def link_pyramid(self, src_prefix: str, prefix: str) -> int:
+        # S3 has no links: the tiles are copied server-side into staging and
+        # committed like a freshly rendered pyramid.
+        src_prefix = src_prefix.rstrip("/") + "/"
+        keys = self.list_keys(src_prefix)
+        if not keys:
+            return 0
+        writer = self.open_pyramid(prefix)
+
+        def copy(key: str) -> None:
+            rel = key[len(src_prefix):]
+            self.client.copy_object(Bucket=self.bucket, Key=writer.staging + rel,
+                                    CopySource={"Bucket": self.bucket, "Key": key})
+            with writer._lock:
+                writer._written.add(writer.prefix + rel)
+
+        with ThreadPoolExecutor(max_workers=S3_COPY_WORKERS) as pool:
+            list(pool.map(copy, keys))
+        writer.commit()
+        return len(keys)
+
+    def get_bytes(self, key: str) -> bytes | None:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except Exception as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") == "NoSuchKey":
+                return None
+            raise
+
+    def put_file(self, key: str, local_path: str) -> None:
+        # boto3's managed transfer splits large files into a multipart upload.
+        self.client.upload_file(local_path, self.bucket, key)
+
+    def get_versioned(self, key: str) -> tuple[bytes, str]:
+        resp = self.client.get_object(Bucket=self.bucket, Key=key)
+        return resp["Body"].read(), resp["ETag"]
+
+    def replace_if_unchanged(self, key: str, data: bytes, version: str) -> bool:
+        # Conditional PUT: S3 (and MinIO) reject it if the object's ETag changed.
+        try:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType="image/png", IfMatch=version)
+        except Exception as e:
+            code = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if code in ("PreconditionFailed", "NoSuchKey", "ConditionalRequestConflict"):
+                return False
+            raise
+        return True
+
+    def list_keys(self, prefix: str) -> list[str]:
+        keys = []
+        kwargs = {"Bucket": self.bucket, "Prefix": prefix}
+        while True:
+            resp = self.client.list_objects_v2(**kwargs)
+            keys.extend(obj["Key"] for obj in resp.get("Contents", []))
+            if not resp.get("IsTruncated"):
+                return keys
+            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+
+    def delete_keys(self, keys: list[str]) -> int:
+        for i in range(0, len(keys), S3_DELETE_BATCH):
+            batch = keys[i:i + S3_DELETE_BATCH]
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True},
+            )
+        return len(keys)
+
+    def delete_prefix(self, prefix: str) -> int:
+        return self.delete_keys(self.list_keys(prefix.rstrip("/") + "/"))
+
+
+def make_s3_client():
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        "s3",
+        endpoint_url=S3_ENDPOINT_URL,
+        aws_access_key_id=S3_ACCESS_KEY,
+        aws_secret_access_key=S3_SECRET_KEY,
+        region_name=S3_REGION,
+        config=Config(max_pool_connections=32),
+    )
+
+
+@lru_cache
+def get_source_storage():
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(make_s3_client(), S3_SOURCES_BUCKET)
+    return LocalStorage(SOURCE_IMAGES_PATH)
+
+
+@lru_cache
+def get_tile_storage():
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(make_s3_client(), S3_TILES_BUCKET)
+    return LocalStorage(TILES_OUTPUT_PATH)
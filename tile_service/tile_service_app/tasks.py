@@ -1,26 +1,229 @@
 import os
+import tempfile
+import time
+
 import httpx
+from PIL import Image
+from rq import Callback, Queue, Retry, get_current_job
+from rq.job import Dependency
 
-from tile_service_app.config import SOURCE_IMAGES_PATH, TILES_OUTPUT_PATH, MAP_SERVICE_URL
+from tile_service_app.config import (TILES_OUTPUT_PATH, TILES_ARCHIVE_PATH, MAP_SERVICE_URL, FANOUT_MIN_PIXELS,
+                                     FANOUT_RETRIES, FANOUT_JOB_TIMEOUT, RECOMPRESS_QUEUE, RECOMPRESS_JOB_TIMEOUT,
+                                     TILE_FORMAT)
+from tile_service_app.export import export_map
+from tile_service_app.fanout import (plan_fanout, split_source, region_source_key, render_region,
+                                     assemble_coarse_levels, pyramid_keys)
+from tile_service_app.recompress import recompress_pyramid
+from tile_service_app.sources import StoredTileSource
+from tile_service_app.storage import get_source_storage, get_tile_storage
 from tile_service_app.tiler import generate_tile_pyramid
+from tile_service_app.tiering import (archive_file, pack_pyramid, rehydrate_pyramid, discard_archive,
+                                      record_archived, record_rehydrated)
 
-def process_task(map_id: str):
-    source_image_path = os.path.join(SOURCE_IMAGES_PATH, f"{map_id}", "source.png")
 
-    if not os.path.exists(source_image_path):
-        raise FileNotFoundError(f"{source_image_path} does not exist")
+_http_client = None
 
-    callback_payload = generate_tile_pyramid(
-        map_id = map_id,
-        source_image_path = source_image_path,
-        output_base_path=TILES_OUTPUT_PATH
-    )
 
-    callback_url = f"{MAP_SERVICE_URL}/maps/{map_id}/tiles_info"
+def get_http_client() -> httpx.Client:
+    # Kept for the life of the process, so pre-warmed workers reuse connections.
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(timeout=30)
+    return _http_client
+
 
+def send_tiles_info(map_id: str, payload: dict) -> None:
+    post_callback(f"{MAP_SERVICE_URL}/maps/{map_id}/tiles_info", payload)
+
+
+def post_callback(callback_url: str, payload: dict) -> None:
     try:
-        with httpx.Client() as client:
-            response = client.post(callback_url, json=callback_payload)
-            response.raise_for_status()
+        response = get_http_client().post(callback_url, json=payload)
+        response.raise_for_status()
     except Exception as e:
-        raise RuntimeError(f"Callback failed: {e}")
\ No newline at end of file
+        raise RuntimeError(f"Callback failed: {e}")
+
+
+def refund_tiling_charge(job, connection, *exc_info):
+    # on_failure callback of upload jobs and their fan-out jobs: once a job
+    # has failed for good, the admission charge in its meta is given back.
+    # The charge's token is consumed by the first refund, so several failed
+    # jobs of one upload refund it once.
+    charge = job.meta.get("tiling_charge")
+    if charge is None or job.retries_left:
+        return
+    if not connection.delete(charge["token"]):
+        return
+    pipe = connection.pipeline()
+    for key, ttl in charge["keys"]:
+        pipe.incrbyfloat(key, -charge["cpu"])
+        pipe.expire(key, ttl)
+    pipe.execute()
+
+
+def process_task(map_id: str, progressive: bool = True):
+    source_storage = get_source_storage()
+
+    with source_storage.local_copy(f"{map_id}/source.png") as source_image_path:
+        with Image.open(source_image_path) as header:
+            width, height = header.size
+
+        plan = plan_fanout(width, height) if width * height >= FANOUT_MIN_PIXELS else None
+
+        if plan is None:
+            def publish_interim(info: dict) -> None:
+                # The final payload is sent below, once the pyramid is committed.
+                if info["ready_zoom"] < info["max_zoom"]:
+                    send_tiles_info(map_id, info)
+
+            callback_payload = generate_tile_pyramid(
+                map_id = map_id,
+                source_image_path = source_image_path,
+                output_base_path=TILES_OUTPUT_PATH,
+                storage=get_tile_storage(),
+                # Re-tiles of live maps swap the pyramid in at the end instead,
+                # so viewers keep the old deep levels until the new ones exist.
+                on_level_ready=publish_interim if progressive else None
+            )
+            discard_archive(TILES_ARCHIVE_PATH, map_id)
+            send_tiles_info(map_id, callback_payload)
+            enqueue_recompress(map_id)
+            return
+
+        with Image.open(source_image_path) as image:
+            split_source(map_id, image.convert("RGBA"), plan, source_storage)
+
+    get_tile_storage().open_pyramid(f"{map_id}", fresh=True)
+    enqueue_fanout(map_id, plan)
+
+
+def link_task(map_id: str, source_prefix: str, info: dict):
+    # Uploads of an image that was tiled before in the current format: the
+    # shared pyramid is linked (on S3, copied) in instead of being rendered.
+    if not get_tile_storage().link_pyramid(source_prefix, f"{map_id}"):
+        # The shared pyramid went away meanwhile; tile the image after all.
+        process_task(map_id)
+        return
+    discard_archive(TILES_ARCHIVE_PATH, map_id)
+    send_tiles_info(map_id, info)
+
+
+def enqueue_fanout(map_id: str, plan: dict) -> None:
+    job = get_current_job()
+    queue = Queue(name=job.origin, connection=job.connection)
+    retry = Retry(max=FANOUT_RETRIES, interval=[10, 30, 60])
+    # The upload's charge follows the work, so a region that fails for good
+    # refunds it.
+    refund = {}
+    if job.meta.get("tiling_charge") is not None:
+        refund = {"meta": {"tiling_charge": job.meta["tiling_charge"]}, "on_failure": Callback(refund_tiling_charge)}
+
+    region_jobs = queue.enqueue_many([
+        Queue.prepare_data(
+            process_region_task,
+            args=(map_id, plan, rx, ry),
+            timeout=FANOUT_JOB_TIMEOUT,
+            retry=retry,
+            description=f"tile region {rx},{ry} of map {map_id}",
+            **refund,
+        )
+        for rx, ry in plan["regions"]
+    ])
+
+    queue.enqueue(
+        assemble_task,
+        map_id,
+        plan,
+        depends_on=Dependency(jobs=region_jobs),
+        job_timeout=FANOUT_JOB_TIMEOUT,
+        retry=retry,
+        **refund,
+    )
+
+
+def process_region_task(map_id: str, plan: dict, rx: int, ry: int):
+    source_storage = get_source_storage()
+    writer = get_tile_storage().open_pyramid(f"{map_id}", fresh=False)
+
+    with source_storage.local_copy(region_source_key(map_id, rx, ry)) as crop_path:
+        with Image.open(crop_path) as crop:
+            render_region(crop.convert("RGBA"), plan, rx, ry, writer)
+
+
+def assemble_task(map_id: str, plan: dict):
+    writer = get_tile_storage().open_pyramid(f"{map_id}", fresh=False)
+
+    assemble_coarse_levels(plan, writer)
+    writer.commit(expected=pyramid_keys(plan["width"], plan["height"], plan["max_zoom"]))
+
+    get_source_storage().delete_prefix(f"{map_id}/regions")
+    discard_archive(TILES_ARCHIVE_PATH, map_id)
+
+    send_tiles_info(map_id, {
+        "width": plan["width"],
+        "height": plan["height"],
+        "max_zoom": plan["max_zoom"],
+        "ready_zoom": plan["max_zoom"],
+        "tile_format": TILE_FORMAT,
+        "tiles_path": f"/tiles/{map_id}/"
+    })
+    enqueue_recompress(map_id)
+
+
+def enqueue_recompress(map_id: str) -> None:
+    # Tiles are published with a fast encoder setting; squeezing them is left
+    # to a low-priority job that only runs when tiling work is drained.
+    job = get_current_job()
+    queue = Queue(name=RECOMPRESS_QUEUE, connection=job.connection)
+    queue.enqueue(
+        recompress_task,
+        map_id,
+        job_timeout=RECOMPRESS_JOB_TIMEOUT,
+        description=f"recompress tiles of map {map_id}",
+    )
+
+
+def recompress_task(map_id: str):
+    stats = recompress_pyramid(get_tile_storage(), f"{map_id}")
+    post_callback(f"{MAP_SERVICE_URL}/maps/{map_id}/tiles_recompressed", {
+        "tiles": stats["tiles_replaced"],
+        "bytes_saved": stats["bytes_saved"],
+    })
+
+
+def export_task(map_id: str, version: str, key: str, fmt: str, max_dim: int, map_info: dict, locations: list[dict]):
+    # key is derived from version, which map_service bumps whenever the map,
+    # its tiles or its locations change; older versions are dropped here.
+    source_storage = get_source_storage()
+    if source_storage.exists(key):
+        return
+
+    tiles = StoredTileSource(get_tile_storage(), archive_file(TILES_ARCHIVE_PATH, map_id), map_id)
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            export_map(tiles.read_tile, map_info, locations, fmt, max_dim, f)
+
+        prefix = f"{map_id}/exports/"
+        source_storage.delete_keys([k for k in source_storage.list_keys(prefix) if not k.startswith(prefix + version)])
+        source_storage.put_file(key, path)
+    finally:
+        os.remove(path)
+        tiles.close()
+
+
+def tier_task(map_id: str):
+    stats = pack_pyramid(TILES_OUTPUT_PATH, TILES_ARCHIVE_PATH, map_id)
+    if stats is None:
+        return
+    record_archived(get_current_job().connection, stats)
+    post_callback(f"{MAP_SERVICE_URL}/maps/{map_id}/tiles_archived", stats)
+
+
+def rehydrate_task(map_id: str, requested_at: float):
+    if not rehydrate_pyramid(TILES_OUTPUT_PATH, TILES_ARCHIVE_PATH, map_id):
+        return
+    # Measured from the first tile request that found the map archived.
+    seconds = time.time() - requested_at
+    record_rehydrated(get_current_job().connection, map_id, seconds)
+    post_callback(f"{MAP_SERVICE_URL}/maps/{map_id}/tiles_rehydrated", {"seconds": round(seconds, 3)})
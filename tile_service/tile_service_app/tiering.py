@@ -0,0 +1,135 @@
+import os
+import shutil
+import time
+import zipfile
+
+STATS_KEY = "tiering:stats"
+LATENCY_KEY = "tiering:rehydrate_ms"
+LATENCY_SAMPLES = 1000
+REHYDRATE_LOCK_SECONDS = 600
+
+
+def archive_file(archive_root: str, map_id: str) -> str:
+    return os.path.join(archive_root, f"{map_id}.zip")
+
+
+def pack_pyramid(tiles_root: str, archive_root: str, map_id: str) -> dict | None:
+    # Packs a map's loose tiles into <archive_root>/<map_id>.zip and removes
+    # them. Tiles are stored, not deflated: PNGs are already compressed and
+    # stored entries can be served without inflating. Only files with no
+    # other hardlink (clones, the shared pyramid store) free any space, and a
+    # pyramid that would free nothing is left alone.
+    tiles_dir = os.path.join(tiles_root, map_id)
+    try:
+        dir_ino = os.stat(tiles_dir).st_ino
+    except FileNotFoundError:
+        return None
+
+    files = []
+    reclaimable = 0
+    for dirpath, _, names in os.walk(tiles_dir):
+        for name in names:
+            if not name.endswith(".png"):
+                continue
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            files.append((path, os.path.relpath(path, tiles_dir)))
+            if st.st_nlink == 1:
+                reclaimable += st.st_size
+    if not files or not reclaimable:
+        return None
+
+    target = archive_file(archive_root, map_id)
+    os.makedirs(archive_root, exist_ok=True)
+    with zipfile.ZipFile(f"{target}.part", "w", zipfile.ZIP_STORED) as zf:
+        for path, name in sorted(files, key=lambda f: f[1]):
+            zf.write(path, name)
+    os.replace(f"{target}.part", target)
+
+    # The archive is in place before the loose tiles go, so tiles never 404.
+    # If a re-tile swapped in a new pyramid meanwhile, the archive is stale.
+    cold_dir = f"{tiles_dir}__cold"
+    try:
+        os.rename(tiles_dir, cold_dir)
+    except FileNotFoundError:
+        os.remove(target)
+        return None
+    if os.stat(cold_dir).st_ino != dir_ino:
+        os.rename(cold_dir, tiles_dir)
+        os.remove(target)
+        return None
+    shutil.rmtree(cold_dir)
+
+    return {"tiles": len(files), "bytes_reclaimed": reclaimable, "archive_bytes": os.path.getsize(target)}
+
+
+def rehydrate_pyramid(tiles_root: str, archive_root: str, map_id: str) -> bool:
+    target = archive_file(archive_root, map_id)
+    if not os.path.isfile(target):
+        return False
+
+    tiles_dir = os.path.join(tiles_root, map_id)
+    if not os.path.isdir(tiles_dir):
+        tmp_dir = f"{tiles_dir}__rehydrate"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        with zipfile.ZipFile(target) as zf:
+            zf.extractall(tmp_dir)
+        try:
+            os.rename(tmp_dir, tiles_dir)
+        except OSError:
+            # A re-tile got there first; its tiles win.
+            shutil.rmtree(tmp_dir)
+
+    os.remove(target)
+    return True
+
+
+def discard_archive(archive_root: str, map_id: str) -> None:
+    # Called once a map has a new pyramid, which makes any archive stale.
+    try:
+        os.remove(archive_file(archive_root, map_id))
+    except FileNotFoundError:
+        pass
+
+
+def request_rehydrate(redis_conn, map_id: str, enqueue) -> bool:
+    # Every tile served from an archive asks for the map to be unpacked; only
+    # the first request in REHYDRATE_LOCK_SECONDS enqueues the job.
+    if not redis_conn.set(f"tiering:rehydrate:{map_id}", "1", nx=True, ex=REHYDRATE_LOCK_SECONDS):
+        return False
+    enqueue(map_id, time.time())
+    return True
+
+
+def record_archived(redis_conn, stats: dict) -> None:
+    pipe = redis_conn.pipeline()
+    pipe.hincrby(STATS_KEY, "maps_archived", 1)
+    pipe.hincrby(STATS_KEY, "bytes_reclaimed", stats["bytes_reclaimed"])
+    pipe.hincrby(STATS_KEY, "archive_bytes", stats["archive_bytes"])
+    pipe.execute()
+
+
+def record_rehydrated(redis_conn, map_id: str, seconds: float) -> None:
+    pipe = redis_conn.pipeline()
+    pipe.hincrby(STATS_KEY, "rehydrations", 1)
+    pipe.lpush(LATENCY_KEY, int(seconds * 1000))
+    pipe.ltrim(LATENCY_KEY, 0, LATENCY_SAMPLES - 1)
+    pipe.delete(f"tiering:rehydrate:{map_id}")
+    pipe.execute()
+
+
+def tiering_stats(redis_conn) -> dict:
+    raw = {k.decode() if isinstance(k, bytes) else k: int(v) for k, v in redis_conn.hgetall(STATS_KEY).items()}
+    samples = sorted(int(v) for v in redis_conn.lrange(LATENCY_KEY, 0, -1))
+
+    def pct(p: float) -> int | None:
+        return samples[min(len(samples) - 1, int(p * len(samples)))] if samples else None
+
+    return {
+        "maps_archived": raw.get("maps_archived", 0),
+        "bytes_reclaimed": raw.get("bytes_reclaimed", 0),
+        "archive_bytes": raw.get("archive_bytes", 0),
+        "rehydrations": raw.get("rehydrations", 0),
+        "rehydrate_ms": {"p50": pct(0.5), "p95": pct(0.95), "max": samples[-1] if samples else None,
+                         "samples": len(samples)},
+    }
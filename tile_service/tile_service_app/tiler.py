@@ -1,70 +1,131 @@
-import os
 import math
-import shutil
+import logging
+import threading
 from PIL import Image
 
-TILE_SIZE = 256
-
-def generate_tile_pyramid(map_id: str, source_image_path: str, output_base_path: str):
-    image = Image.open(source_image_path).convert("RGBA")
-    width, height = image.size
-
-    max_dim = max(width, height)
-    max_zoom = math.ceil(math.log2(max(1.0, max_dim / TILE_SIZE)))
-
-    final_base = os.path.join(output_base_path, f"{map_id}")
-    tmp_base = os.path.join(output_base_path, f"{map_id}__tmp")
-
-    if os.path.isdir(tmp_base):
-        shutil.rmtree(tmp_base)
-
-    os.makedirs(tmp_base, exist_ok=True)
-
-    for z in range(max_zoom + 1):
-        scale = 2 ** (max_zoom - z)
-        resized = image.resize(
-            (math.ceil(width / scale), math.ceil(height / scale)),
-            Image.LANCZOS
-        )
+from tile_service_app.config import (TILE_ENCODE_WORKERS, TILE_WRITE_WORKERS, TILE_QUEUE_SIZE, TILE_COMPRESS_LEVEL,
+                                     TILE_FORMAT, MAX_SOURCE_PIXELS)
+from tile_service_app.pipeline import TilePipeline
+from tile_service_app.storage import LocalStorage
 
-        resized_width, resized_height = resized.size
-
-        tiles_x = math.ceil(resized_width / TILE_SIZE)
-        tiles_y = math.ceil(resized_height / TILE_SIZE)
-
-        for x in range(tiles_x):
-            tile_dir = os.path.join(tmp_base, str(z), str(x))
-            os.makedirs(tile_dir, exist_ok=True)
-
-            for y in range(tiles_y):
-
-                left = x * TILE_SIZE
-                lower = resized_height - y * TILE_SIZE
-                right = min(left + TILE_SIZE, resized.width)
-                upper = max(lower - TILE_SIZE, 0)
-
-                tile = resized.crop((left, upper, right, lower))
-
-                tile_w, tile_h = tile.size
-                if tile_w != TILE_SIZE or tile_h != TILE_SIZE:
-                    padded = Image.new("RGBA", (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0))
-                    paste_x = 0
-                    paste_y = TILE_SIZE - tile_h
+TILE_SIZE = 256
 
-                    padded.paste(tile, (paste_x, paste_y))
-                    tile = padded
+# Pillow's default bomb guard (~179 MP) would reject the large maps we fan out;
+# sizes are bounded by admission control before a job is enqueued.
+Image.MAX_IMAGE_PIXELS = MAX_SOURCE_PIXELS
 
-                tile_path = os.path.join(tile_dir, f"{y}.png")
-                tile.save(tile_path, format="PNG")
+logger = logging.getLogger("tile_service")
 
-    if os.path.isdir(final_base):
-        shutil.rmtree(final_base)
 
-    os.replace(tmp_base, final_base)
+def compute_max_zoom(width: int, height: int) -> int:
+    max_dim = max(width, height)
+    return math.ceil(math.log2(max(1.0, max_dim / TILE_SIZE)))
+
+
+class LevelPublisher:
+    # Publishes zoom levels strictly in order (z=0 first) as the pipeline
+    # reports them fully written, then reports the deepest ready level.
+    # on_ready (an HTTP call) runs outside the lock, on one thread at a
+    # time, which reports the latest level until it is caught up; the other
+    # writer threads only hand it their levels.
+
+    def __init__(self, writer, on_ready=None):
+        self.writer = writer
+        self.on_ready = on_ready
+        self.ready_zoom = -1
+        self._reported = -1
+        self._reporting = False
+        self._done = set()
+        self._lock = threading.Lock()
+
+    def level_done(self, z: int) -> None:
+        with self._lock:
+            self._done.add(z)
+            while self.ready_zoom + 1 in self._done:
+                self.writer.publish_level(self.ready_zoom + 1)
+                self.ready_zoom += 1
+            if self.on_ready is None or self._reporting:
+                return
+            self._reporting = True
+
+        while True:
+            with self._lock:
+                ready_zoom = self.ready_zoom
+                if ready_zoom <= self._reported:
+                    self._reporting = False
+                    return
+                self._reported = ready_zoom
+            try:
+                self.on_ready(ready_zoom)
+            except Exception:
+                logger.warning("interim publish callback failed at z=%s", ready_zoom, exc_info=True)
+
+
+def render_zoom_level(resized: Image.Image, z: int, pipeline: TilePipeline, x_offset: int = 0, y_offset: int = 0) -> None:
+    resized_width, resized_height = resized.size
+
+    tiles_x = math.ceil(resized_width / TILE_SIZE)
+    tiles_y = math.ceil(resized_height / TILE_SIZE)
+
+    for x in range(tiles_x):
+        for y in range(tiles_y):
+
+            left = x * TILE_SIZE
+            lower = resized_height - y * TILE_SIZE
+            right = min(left + TILE_SIZE, resized_width)
+            upper = max(lower - TILE_SIZE, 0)
+
+            tile = resized.crop((left, upper, right, lower))
+
+            pipeline.submit(tile, f"{z}/{x + x_offset}/{y + y_offset}.png", group=z)
+
+
+def generate_tile_pyramid(map_id: str, source_image_path: str, output_base_path: str, storage=None,
+                          on_level_ready=None):
+    image = Image.open(source_image_path).convert("RGBA")
+    width, height = image.size
 
-    return {
-        "width": width,
-        "height": height,
-        "max_zoom": max_zoom,
-        "tiles_path": f"/tiles/{map_id}/"
-    }
\ No newline at end of file
+    max_zoom = compute_max_zoom(width, height)
+
+    if storage is None:
+        storage = LocalStorage(output_base_path)
+
+    def tiles_info(ready_zoom: int) -> dict:
+        return {
+            "width": width,
+            "height": height,
+            "max_zoom": max_zoom,
+            "ready_zoom": ready_zoom,
+            "tile_format": TILE_FORMAT,
+            "tiles_path": f"/tiles/{map_id}/"
+        }
+
+    writer = storage.open_pyramid(f"{map_id}")
+    publisher = None
+    if on_level_ready is not None:
+        publisher = LevelPublisher(writer, lambda z: on_level_ready(tiles_info(z)))
+
+    # Coarse levels are cheap and go first, so with on_level_ready they are
+    # published within seconds while the deep levels are still being rendered.
+    # Without it the whole pyramid is swapped in on commit.
+    try:
+        with TilePipeline(TILE_SIZE, writer.write, TILE_ENCODE_WORKERS, TILE_WRITE_WORKERS, TILE_QUEUE_SIZE,
+                          TILE_COMPRESS_LEVEL) as pipeline:
+            for z in range(max_zoom + 1):
+                scale = 2 ** (max_zoom - z)
+                resized = image.resize(
+                    (math.ceil(width / scale), math.ceil(height / scale)),
+                    Image.LANCZOS
+                )
+
+                render_zoom_level(resized, z, pipeline)
+                if publisher is not None:
+                    pipeline.seal(z, publisher.level_done)
+                logger.info("map %s: z=%s queued, stages %s", map_id, z, pipeline.queue_depths())
+        logger.info("map %s: tiling done, %s", map_id, pipeline.stats())
+        writer.commit()
+    except Exception:
+        writer.abort()
+        raise
+
+    return tiles_info(max_zoom)
@@ -1,16 +1,85 @@
-import os
+import io
+import logging
+import resource
+from PIL import Image
 from redis import Redis
-from rq import Worker, Queue
-from tile_service_app.config import REDIS_URL
+from rq import Worker, SimpleWorker, Queue
+from rq.worker_pool import WorkerPool
+
+from tile_service_app.config import (REDIS_URL, TILE_QUEUES, WORKER_MODE, WORKER_POOL_SIZE, WORKER_MAX_JOBS,
+                                     WORKER_RECYCLE_RSS_MB, WORKER_MEMORY_LIMIT_MB)
+
+logger = logging.getLogger("tile_service")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def should_recycle(jobs_done: int, rss_mb: float) -> bool:
+    if WORKER_MAX_JOBS and jobs_done >= WORKER_MAX_JOBS:
+        return True
+    if WORKER_RECYCLE_RSS_MB and rss_mb >= WORKER_RECYCLE_RSS_MB:
+        return True
+    return False
+
+
+def apply_memory_limit() -> None:
+    if WORKER_MEMORY_LIMIT_MB <= 0:
+        return
+    limit = WORKER_MEMORY_LIMIT_MB * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def prewarm() -> None:
+    import tile_service_app.tasks as tasks
+    from tile_service_app.storage import get_source_storage, get_tile_storage
+
+    Image.init()
+    Image.new("RGBA", (256, 256)).save(io.BytesIO(), format="PNG")
+
+    get_source_storage()
+    get_tile_storage()
+    tasks.get_http_client()
+
+
+class PrewarmedWorker(SimpleWorker):
+    # Runs jobs in its own long-lived process instead of forking a work horse
+    # per job, so imports, storage/HTTP clients and other module-level caches
+    # survive between jobs. Timeouts still apply (SimpleWorker enforces them
+    # with SIGALRM); the process exits after WORKER_MAX_JOBS jobs or once its
+    # peak RSS passes WORKER_RECYCLE_RSS_MB, and the pool starts a fresh one.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.jobs_done = 0
+        apply_memory_limit()
+        prewarm()
+
+    def execute_job(self, job, queue):
+        try:
+            super().execute_job(job, queue)
+        finally:
+            self.jobs_done += 1
+            rss_mb = peak_rss_mb()
+            if should_recycle(self.jobs_done, rss_mb):
+                self.log.info("Worker %s: recycling after %d jobs, peak RSS %.0f MB", self.key, self.jobs_done, rss_mb)
+                self._stop_requested = True
+
 
 def main():
     redis_conn = Redis.from_url(REDIS_URL)
 
-    queue_name = "default"
-    queue = Queue(name=queue_name, connection=redis_conn)
+    queues = [Queue(name=name, connection=redis_conn) for name in TILE_QUEUES]
+
+    if WORKER_MODE == "prewarmed":
+        pool = WorkerPool(queues, connection=redis_conn, num_workers=WORKER_POOL_SIZE, worker_class=PrewarmedWorker)
+        pool.start(burst=False)
+        return
 
-    worker = Worker([queue])
+    worker = Worker(queues)
     worker.work()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
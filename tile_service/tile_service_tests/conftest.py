@@ -0,0 +1,94 @@
+import hashlib
+import io
+import threading
+
+import pytest
+
+
+class FakeClientError(Exception):
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+def _etag(data: bytes) -> str:
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+class FakeS3Client:
+    # In-memory stand-in for a MinIO/S3 endpoint, covering the calls our storage makes.
+
+    def __init__(self, page_size: int = 1000):
+        self.buckets: dict[str, dict[str, bytes]] = {}
+        self.page_size = page_size
+        self.calls: list[str] = []
+        self._lock = threading.Lock()
+
+    def _bucket(self, name: str) -> dict[str, bytes]:
+        return self.buckets.setdefault(name, {})
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, **kwargs):
+        data = Body if isinstance(Body, bytes) else Body.read()
+        with self._lock:
+            self.calls.append("put_object")
+            if IfMatch is not None:
+                current = self._bucket(Bucket).get(Key)
+                if current is None:
+                    raise FakeClientError("NoSuchKey")
+                if _etag(current) != IfMatch:
+                    raise FakeClientError("PreconditionFailed")
+            self._bucket(Bucket)[Key] = data
+        return {"ETag": _etag(data)}
+
+    def get_object(self, Bucket, Key):
+        with self._lock:
+            data = self._bucket(Bucket).get(Key)
+            if data is None:
+                raise FakeClientError("NoSuchKey")
+            return {"Body": io.BytesIO(data), "ETag": _etag(data)}
+
+    def head_object(self, Bucket, Key):
+        with self._lock:
+            data = self._bucket(Bucket).get(Key)
+            if data is None:
+                raise FakeClientError("404")
+            return {"ContentLength": len(data), "ETag": _etag(data)}
+
+    def copy_object(self, Bucket, Key, CopySource):
+        with self._lock:
+            self.calls.append("copy_object")
+            data = self._bucket(CopySource["Bucket"]).get(CopySource["Key"])
+            if data is None:
+                raise FakeClientError("NoSuchKey")
+            self._bucket(Bucket)[Key] = data
+        return {"CopyObjectResult": {"ETag": _etag(data)}}
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, "rb") as f:
+            self.put_object(Bucket=Bucket, Key=Key, Body=f.read())
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=None, ContinuationToken=None):
+        with self._lock:
+            self.calls.append("list_objects_v2")
+            keys = sorted(k for k in self._bucket(Bucket) if k.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        limit = min(MaxKeys or self.page_size, self.page_size)
+        page = keys[start:start + limit]
+        resp = {"Contents": [{"Key": k, "Size": len(self.buckets[Bucket][k])} for k in page]}
+        if start + limit < len(keys):
+            resp["IsTruncated"] = True
+            resp["NextContinuationToken"] = str(start + limit)
+        return resp
+
+    def delete_objects(self, Bucket, Delete):
+        assert len(Delete["Objects"]) <= 1000
+        with self._lock:
+            self.calls.append("delete_objects")
+            for obj in Delete["Objects"]:
+                self._bucket(Bucket).pop(obj["Key"], None)
+        return {}
+
+
+@pytest.fixture
+def s3_client():
+    return FakeS3Client(page_size=50)
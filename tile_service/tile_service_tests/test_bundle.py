@@ -0,0 +1,102 @@
+import os
+import shutil
+import zipfile
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from tile_service_app.bundle import decode_bundle
+from tile_service_app.tiler import generate_tile_pyramid
+
+
+@pytest.fixture
+def tiles_root(tmp_path, monkeypatch):
+    output_path = tmp_path / "tiles"
+    os.makedirs(output_path, exist_ok=True)
+
+    import tile_service_app.routes.bundle as bundle_routes
+    monkeypatch.setattr(bundle_routes, "TILES_OUTPUT_PATH", str(output_path))
+    monkeypatch.setattr(bundle_routes, "TILES_ARCHIVE_PATH", str(output_path))
+    return output_path
+
+
+@pytest.fixture
+def client():
+    from tile_service_app.main import app
+    return TestClient(app)
+
+
+@pytest.fixture
+def map_id(tmp_path, tiles_root):
+    map_id = str(uuid4())
+    source_path = tmp_path / "source.png"
+    Image.new("RGB", (600, 300), color=(10, 20, 30)).save(source_path)
+    generate_tile_pyramid(map_id=map_id, source_image_path=str(source_path), output_base_path=str(tiles_root))
+    return map_id
+
+
+def test_bundle_returns_all_tiles_in_range(client, map_id, tiles_root):
+    resp = client.get(f"/bundle/{map_id}/2", params={"x_min": 0, "x_max": 3, "y_min": 0, "y_max": 1})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/x-tile-bundle"
+
+    bundle = decode_bundle(resp.content)
+    assert bundle["z"] == 2
+    assert len(bundle["tiles"]) == 8
+
+    data, etag = bundle["tiles"][(1, 0)]
+    with open(tiles_root / map_id / "2" / "1" / "0.png", "rb") as f:
+        assert data == f.read()
+    assert etag.startswith('"') and etag.endswith('"')
+
+    # 600px wide at z=2 is 3 tiles across, so x=3 is a hole.
+    assert bundle["tiles"][(3, 0)] is None
+
+
+def test_bundle_reads_from_archive(client, map_id, tiles_root):
+    tiles_dir = tiles_root / map_id
+    with zipfile.ZipFile(tiles_root / f"{map_id}.zip", "w", zipfile.ZIP_STORED) as zf:
+        for root, _, files in os.walk(tiles_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                zf.write(path, os.path.relpath(path, tiles_dir))
+
+    expected = (tiles_dir / "0" / "0" / "0.png").read_bytes()
+    shutil.rmtree(tiles_dir)
+
+    resp = client.get(f"/bundle/{map_id}/0", params={"x_min": 0, "x_max": 0, "y_min": 0, "y_max": 0})
+    assert resp.status_code == 200
+    data, _ = decode_bundle(resp.content)["tiles"][(0, 0)]
+    assert data == expected
+
+
+def test_bundle_rejects_bad_ranges(client, map_id):
+    resp = client.get(f"/bundle/{map_id}/1", params={"x_min": 2, "x_max": 1, "y_min": 0, "y_max": 0})
+    assert resp.status_code == 400
+
+    resp = client.get(f"/bundle/{map_id}/1", params={"x_min": 0, "x_max": 100, "y_min": 0, "y_max": 100})
+    assert resp.status_code == 400
+
+    resp = client.get(f"/bundle/{map_id}/1", params={"x_min": 0, "x_max": 10 ** 12, "y_min": 0, "y_max": 10 ** 12})
+    assert resp.status_code == 400
+
+    resp = client.get(f"/bundle/{map_id}/1", params={"x_min": -1, "x_max": 0, "y_min": 0, "y_max": 0})
+    assert resp.status_code == 422
+
+
+@pytest.mark.parametrize("z, params", [
+    (1, {"x_min": 2, "x_max": 2, "y_min": 0, "y_max": 0}),
+    (2, {"x_min": 0, "x_max": 0, "y_min": 3, "y_max": 4}),
+    (40, {"x_min": 2 ** 32, "x_max": 2 ** 32, "y_min": 0, "y_max": 0}),
+])
+def test_bundle_rejects_tiles_outside_the_level(client, map_id, z, params):
+    resp = client.get(f"/bundle/{map_id}/{z}", params=params)
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == "Tile range outside the zoom level"
+
+
+def test_bundle_unknown_map(client, tiles_root):
+    resp = client.get(f"/bundle/{uuid4()}/0", params={"x_min": 0, "x_max": 0, "y_min": 0, "y_max": 0})
+    assert resp.status_code == 404
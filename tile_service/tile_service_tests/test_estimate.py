@@ -0,0 +1,73 @@
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from tile_service_app.estimate import estimate_tiling_cost, read_image_header
+from tile_service_app.fanout import pyramid_keys
+
+
+def png_bytes(width, height, mode="RGB"):
+    buf = io.BytesIO()
+    Image.new(mode, (width, height)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_tile_count_matches_pyramid():
+    est = estimate_tiling_cost(1500, 1000)
+    assert est["max_zoom"] == 3
+    assert est["tiles"] == len(pyramid_keys(1500, 1000, 3))
+
+
+def test_estimate_grows_with_image_size():
+    small = estimate_tiling_cost(2000, 2000)
+    large = estimate_tiling_cost(60000, 60000)
+
+    assert large["tiles"] > small["tiles"]
+    assert large["cpu_seconds"] > small["cpu_seconds"]
+    assert large["peak_memory_mb"] > 60000 * 60000 * 8 / (1024 * 1024)
+    assert large["output_bytes"] > small["output_bytes"]
+    assert large["fanout"] is True
+    assert small["fanout"] is False
+
+
+def test_header_is_read_from_truncated_file():
+    data = png_bytes(700, 300, "RGBA")
+    assert read_image_header(data[:100]) == (700, 300, "RGBA")
+
+
+@pytest.fixture
+def client():
+    from tile_service_app.main import app
+    return TestClient(app)
+
+
+def test_estimate_endpoint(client):
+    resp = client.post("/estimate", content=png_bytes(1024, 512)[:200])
+    assert resp.status_code == 200
+    assert resp.json()["width"] == 1024
+    assert resp.json()["tiles"] == len(pyramid_keys(1024, 512, 2))
+
+    resp = client.post("/estimate", content=b"not an image")
+    assert resp.status_code == 400
+
+
+def png_header(width, height):
+    import struct
+    import zlib
+
+    ihdr = struct.pack("!IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    header = b"\x89PNG\r\n\x1a\n" + struct.pack("!I", len(ihdr)) + b"IHDR" + ihdr
+    header += struct.pack("!I", zlib.crc32(b"IHDR" + ihdr))
+    return header + struct.pack("!I", 64) + b"IDAT" + b"\0" * 16
+
+
+def test_header_of_huge_image_is_readable():
+    assert read_image_header(png_header(60000, 60000)) == (60000, 60000, "RGBA")
+
+
+def test_decompression_bomb_is_too_large(client):
+    # Past twice Image.MAX_IMAGE_PIXELS Pillow refuses to open the image.
+    resp = client.post("/estimate", content=png_header(200000, 200000))
+    assert resp.status_code == 413
@@ -0,0 +1,93 @@
+import io
+import re
+import zlib
+
+from PIL import Image, ImageChops, ImageStat
+
+from tile_service_app.export import choose_export_level, export_map, iter_export_bands, LevelRows
+from tile_service_app.storage import LocalStorage
+from tile_service_app.tiler import generate_tile_pyramid
+
+
+def make_gradient(width, height):
+    img = Image.new("RGB", (width, height))
+    img.putdata([(x * 255 // width, y * 255 // height, 100) for y in range(height) for x in range(width)])
+    return img
+
+
+def tiled_map(tmp_path, width=1500, height=1000):
+    source = make_gradient(width, height)
+    source.save(tmp_path / "source.png")
+    info = generate_tile_pyramid("m", str(tmp_path / "source.png"), str(tmp_path / "tiles"))
+    storage = LocalStorage(str(tmp_path / "tiles"))
+    return source, info, lambda z, x, y: storage.get_bytes(f"m/{z}/{x}/{y}.png")
+
+
+def test_choose_export_level():
+    # 1500x1000, max_zoom 3: levels 188, 375, 750 and 1500 wide.
+    assert choose_export_level(1500, 1000, 3, 600) == (2, (750, 500), (600, 400))
+    assert choose_export_level(1500, 1000, 3, 750) == (2, (750, 500), (750, 500))
+    assert choose_export_level(1500, 1000, 3, 5000) == (3, (1500, 1000), (1500, 1000))
+
+
+def test_png_export_matches_source(tmp_path):
+    source, info, read_tile = tiled_map(tmp_path)
+
+    buf = io.BytesIO()
+    assert export_map(read_tile, info, [], "png", 600, buf) == (600, 400)
+
+    with Image.open(io.BytesIO(buf.getvalue())) as exported:
+        assert exported.size == (600, 400)
+        reference = source.resize((600, 400), Image.LANCZOS)
+        diff = ImageStat.Stat(ImageChops.difference(exported.convert("RGB"), reference))
+        assert max(diff.mean) < 2.0
+
+
+def test_bands_hold_at_most_two_tile_rows(tmp_path):
+    _, info, read_tile = tiled_map(tmp_path, 1500, 2600)
+    rows = []
+
+    def tracking_read(z, x, y):
+        rows.append(y)
+        return read_tile(z, x, y)
+
+    bands = list(iter_export_bands(tracking_read, info, [], 1300))
+    assert sum(b.height for b in bands) == 1300
+    # Level 2 (750x1300, three tiles wide) is read once, top row first.
+    assert rows[0] == max(rows) == 5
+    assert len(rows) == 6 * 3
+
+    level_rows = LevelRows(read_tile, 3, 1500, 2600)
+    for top in range(0, 2600, 200):
+        level_rows.band(top, min(2600, top + 210))
+    assert level_rows.peak_rows <= 2 * 256 + 210
+
+
+def test_locations_are_drawn(tmp_path):
+    _, info, read_tile = tiled_map(tmp_path)
+    locations = [{"x": 750, "y": 500, "name": "Tower"}]
+
+    buf = io.BytesIO()
+    export_map(read_tile, info, locations, "png", 750, buf)
+
+    with Image.open(io.BytesIO(buf.getvalue())) as exported:
+        # Viewer coordinates are y-up, so (750, 500) is the centre either way.
+        assert exported.convert("RGB").getpixel((375, 250)) == (200, 30, 30)
+
+
+def test_pdf_export_is_well_formed(tmp_path):
+    _, info, read_tile = tiled_map(tmp_path)
+
+    buf = io.BytesIO()
+    export_map(read_tile, info, [], "pdf", 600, buf)
+    pdf = buf.getvalue()
+
+    assert pdf.startswith(b"%PDF-1.4")
+    startxref = int(re.search(rb"startxref\n(\d+)\n%%EOF\n$", pdf).group(1))
+    offsets = [int(o) for o in re.findall(rb"(\d{10}) 00000 n \n", pdf[startxref:])]
+    for number, offset in enumerate(offsets, start=1):
+        assert pdf[offset:].startswith(b"%d 0 obj" % number)
+
+    length = int(re.search(rb"6 0 obj\n(\d+)\nendobj", pdf).group(1))
+    start = pdf.index(b"stream\n", offsets[4]) + len(b"stream\n")
+    assert len(zlib.decompress(pdf[start:start + length])) == 600 * 400 * 3
@@ -0,0 +1,117 @@
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image, ImageChops, ImageStat
+
+from tile_service_app.extract import normalize_extract, choose_extract_level, render_extract
+from tile_service_app.storage import LocalStorage
+from tile_service_app.tiler import generate_tile_pyramid
+
+
+def make_gradient(width, height):
+    img = Image.new("RGB", (width, height))
+    img.putdata([(x * 255 // width, y * 255 // height, (x // 16 + y // 16) % 2 * 255)
+                 for y in range(height) for x in range(width)])
+    return img
+
+
+@pytest.fixture
+def tiled(tmp_path):
+    source = make_gradient(1500, 1000)
+    source.save(tmp_path / "source.png")
+    generate_tile_pyramid("22222222-2222-2222-2222-222222222222", str(tmp_path / "source.png"), str(tmp_path / "tiles"))
+    return source, tmp_path
+
+
+def test_normalize_extract():
+    box, size = normalize_extract((-10, 900, 400.004, 1200), 200, None, 1500, 1000, 4096)
+    assert box == (0.0, 900.0, 400.0, 1000.0)
+    assert size == (200, 50)
+
+    assert normalize_extract((0, 0, 3000, 1000), None, None, 1500, 1000, 1000)[1] == (1000, 667)
+
+    with pytest.raises(ValueError):
+        normalize_extract((2000, 0, 3000, 10), 10, 10, 1500, 1000, 4096)
+    with pytest.raises(ValueError):
+        normalize_extract((0, 0, 100, 100), 5000, 5000, 1500, 1000, 4096)
+
+
+def test_choose_extract_level():
+    assert choose_extract_level((0, 0, 1500, 1000), (180, 120), 3) == 0
+    assert choose_extract_level((0, 0, 1500, 1000), (200, 120), 3) == 1
+    assert choose_extract_level((0, 0, 100, 100), (400, 400), 3) == 3
+
+
+@pytest.mark.parametrize("box,size", [
+    ((100, 100, 700, 500), (300, 200)),
+    ((1000, 0, 1500, 1000), (250, 500)),
+    ((333.5, 777.25, 901, 999), (567, 222)),
+])
+def test_render_extract_matches_source(tiled, box, size):
+    source, tmp_path = tiled
+    storage = LocalStorage(str(tmp_path / "tiles"))
+    read = []
+
+    def read_tile(z, x, y):
+        read.append((z, x, y))
+        return storage.get_bytes(f"22222222-2222-2222-2222-222222222222/{z}/{x}/{y}.png")
+
+    image = render_extract(read_tile, box, size, 1500, 1000, 3)
+    assert image.size == size
+
+    # Source rows are top-down, the box is y-up.
+    crop = (box[0], 1000 - box[3], box[2], 1000 - box[1])
+    reference = source.resize(size, Image.LANCZOS, box=crop)
+    diff = ImageStat.Stat(ImageChops.difference(image.convert("RGB"), reference))
+    assert max(diff.mean) < 6.0
+
+    assert len(read) == len(set(read))
+
+
+def test_render_extract_reads_only_overlapping_tiles(tiled):
+    _, tmp_path = tiled
+    storage = LocalStorage(str(tmp_path / "tiles"))
+    read = []
+
+    def read_tile(z, x, y):
+        read.append((z, x, y))
+        return storage.get_bytes(f"22222222-2222-2222-2222-222222222222/{z}/{x}/{y}.png")
+
+    # Level 2 is 750x500 (3x2 tiles, the bottom row covering level rows
+    # 244-500); the box covers level x 50-350, rows 250-450.
+    render_extract(read_tile, (100, 100, 700, 500), (300, 200), 1500, 1000, 3)
+    assert sorted(read) == [(2, 0, 0), (2, 1, 0)]
+
+
+def test_extract_endpoint_caches(tiled, monkeypatch):
+    _, tmp_path = tiled
+    import tile_service_app.routes.extract as extract_routes
+    cache = LocalStorage(str(tmp_path / "cache"))
+    monkeypatch.setattr(extract_routes, "get_tile_storage", lambda: LocalStorage(str(tmp_path / "tiles")))
+    monkeypatch.setattr(extract_routes, "TILES_ARCHIVE_PATH", str(tmp_path / "tiles"))
+    monkeypatch.setattr(extract_routes, "get_source_storage", lambda: cache)
+
+    from tile_service_app.main import app
+    client = TestClient(app)
+    url = "/extract/22222222-2222-2222-2222-222222222222"
+    params = {"bbox": "100,100,700,500", "width": 300, "src_width": 1500, "src_height": 1000,
+              "max_zoom": 3, "version": "abc1", "format": "jpeg"}
+
+    first = client.get(url, params=params)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "image/jpeg"
+    with Image.open(io.BytesIO(first.content)) as img:
+        assert img.size == (300, 200)
+
+    # Same request, written differently: served from the cache.
+    again = client.get(url, params=dict(params, bbox="700,500,100.001,100"))
+    assert again.headers["etag"] == first.headers["etag"]
+    assert len(list((tmp_path / "cache").rglob("*.jpeg"))) == 1
+
+    # A new tile version replaces the old entries.
+    client.get(url, params=dict(params, version="abc2"))
+    assert [p.parent.name for p in (tmp_path / "cache").rglob("*.jpeg")] == ["abc2"]
+
+    assert client.get(url, params=dict(params, bbox="1,2,3")).status_code == 400
+    assert client.get("/extract/33333333-3333-3333-3333-333333333333", params=params).status_code == 404
@@ -0,0 +1,76 @@
+import io
+
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from tile_service_app.fanout import (plan_fanout, split_source, region_source_key, render_region,
+                                     assemble_coarse_levels, pyramid_keys)
+from tile_service_app.storage import LocalStorage
+from tile_service_app.tiler import generate_tile_pyramid
+
+
+def make_gradient(width, height):
+    img = Image.new("RGB", (width, height))
+    img.putdata([(x * 255 // width, y * 255 // height, (x + y) % 256) for y in range(height) for x in range(width)])
+    return img
+
+
+def tile_files(root):
+    return {str(p.relative_to(root)) for p in root.rglob("*.png")}
+
+
+def test_plan_skips_small_images():
+    assert plan_fanout(300, 300, region_size=512) is None
+    assert plan_fanout(1000, 400, region_size=1024) is None
+
+    with pytest.raises(ValueError):
+        plan_fanout(5000, 5000, region_size=768)
+
+
+def test_fanout_matches_monolithic_pyramid(tmp_path):
+    width, height = 1500, 1000
+    source = make_gradient(width, height)
+    source_path = tmp_path / "source.png"
+    source.save(source_path)
+
+    plan = plan_fanout(width, height, region_size=512)
+    assert plan["max_zoom"] == 3
+    assert plan["split_zoom"] == 2
+    assert len(plan["regions"]) == 6
+
+    sources = LocalStorage(str(tmp_path / "sources"))
+    tiles = LocalStorage(str(tmp_path / "tiles"))
+
+    split_source("m", source.convert("RGBA"), plan, sources)
+    tiles.open_pyramid("m", fresh=True)
+
+    # Regions out of order, as they would finish on different workers.
+    for rx, ry in reversed(plan["regions"]):
+        with sources.local_copy(region_source_key("m", rx, ry)) as path:
+            with Image.open(path) as crop:
+                render_region(crop.convert("RGBA"), plan, rx, ry, tiles.open_pyramid("m", fresh=False))
+
+    writer = tiles.open_pyramid("m", fresh=False)
+    assemble_coarse_levels(plan, writer)
+    writer.commit(expected=pyramid_keys(width, height, plan["max_zoom"]))
+
+    generate_tile_pyramid("ref", str(source_path), str(tmp_path / "ref"))
+
+    fanned = tile_files(tmp_path / "tiles" / "m")
+    assert fanned == tile_files(tmp_path / "ref" / "ref")
+    assert fanned == pyramid_keys(width, height, plan["max_zoom"])
+
+    for key in ("3/0/0.png", "3/5/3.png", "2/1/1.png", "1/0/0.png", "0/0/0.png"):
+        with Image.open(tmp_path / "tiles" / "m" / key) as a, Image.open(tmp_path / "ref" / "ref" / key) as b:
+            diff = ImageStat.Stat(ImageChops.difference(a.convert("RGBA"), b.convert("RGBA")))
+            assert max(diff.mean) < 2.0, key
+
+
+def test_split_crops_include_margin(tmp_path):
+    plan = plan_fanout(1500, 1000, region_size=512)
+    sources = LocalStorage(str(tmp_path))
+    split_source("m", Image.new("RGBA", (1500, 1000)), plan, sources)
+
+    with Image.open(io.BytesIO((tmp_path / region_source_key("m", 1, 0)).read_bytes())) as crop:
+        # 512px region plus 4 split-level tiles' worth (2px * 4 = 8px) each side.
+        assert crop.size == (512 + 16, 512 + 8)
@@ -0,0 +1,48 @@
+import io
+import pytest
+from PIL import Image
+
+from tile_service_app.pipeline import TilePipeline
+from tile_service_app.storage import LocalStorage
+
+
+def test_pipeline_writes_all_tiles_and_reports_stats(tmp_path):
+    writer = LocalStorage(str(tmp_path)).open_pyramid("m")
+    with TilePipeline(16, writer.write, encode_workers=2, write_workers=2, queue_size=4) as pipeline:
+        for x in range(5):
+            for y in range(5):
+                tile = Image.new("RGBA", (16, 16), (x * 40, y * 40, 0, 255))
+                pipeline.submit(tile, f"0/{x}/{y}.png")
+    writer.commit()
+
+    stats = pipeline.stats()
+    assert stats["encode"]["processed"] == 25
+    assert stats["write"]["processed"] == 25
+    assert stats["encode"]["peak_depth"] <= 4
+    assert stats["write"]["peak_depth"] <= 4
+    assert stats["encode"]["depth"] == 0
+
+    with Image.open(tmp_path / "m" / "0" / "3" / "2.png") as img:
+        assert img.getpixel((0, 0)) == (120, 80, 0, 255)
+
+
+def test_pipeline_pads_edge_tiles_to_bottom_left():
+    written = {}
+    with TilePipeline(16, written.__setitem__, encode_workers=1, write_workers=1, queue_size=1) as pipeline:
+        pipeline.submit(Image.new("RGBA", (10, 6), (255, 0, 0, 255)), "edge.png")
+
+    with Image.open(io.BytesIO(written["edge.png"])) as img:
+        assert img.size == (16, 16)
+        assert img.getpixel((0, 15)) == (255, 0, 0, 255)
+        assert img.getpixel((0, 0))[3] == 0
+        assert img.getpixel((12, 15))[3] == 0
+
+
+def test_pipeline_propagates_write_errors():
+    def failing_write(key, data):
+        raise OSError("disk full")
+
+    with pytest.raises(RuntimeError):
+        with TilePipeline(16, failing_write, encode_workers=1, write_workers=1, queue_size=2) as pipeline:
+            for i in range(10):
+                pipeline.submit(Image.new("RGBA", (16, 16)), f"0/0/{i}.png")
@@ -0,0 +1,148 @@
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+from tile_service_app.tiler import LevelPublisher, generate_tile_pyramid
+
+
+def test_levels_are_published_coarse_to_fine(tmp_path):
+    source_path = tmp_path / "source.png"
+    Image.new("RGB", (1500, 1000), color=(5, 6, 7)).save(source_path)
+
+    output = tmp_path / "tiles"
+    final_dir = output / "m"
+    seen = []
+
+    def on_level_ready(info):
+        z = info["ready_zoom"]
+        # Every level up to ready_zoom is already live.
+        published = sorted(int(name) for name in os.listdir(final_dir) if name.isdigit())
+        seen.append((z, published, info["max_zoom"], info["width"]))
+
+    result = generate_tile_pyramid("m", str(source_path), str(output), on_level_ready=on_level_ready)
+
+    # In order, though levels finished during a callback are reported
+    # together.
+    zs = [z for z, _, _, _ in seen]
+    assert zs == sorted(set(zs)) and zs[-1] == 3
+    for z, published, max_zoom, width in seen:
+        assert published[:z + 1] == list(range(z + 1))
+        assert max_zoom == 3
+        assert width == 1500
+
+    assert result["ready_zoom"] == result["max_zoom"] == 3
+    assert not (output / "m__tmp").exists()
+    assert (final_dir / "3" / "5" / "3.png").exists()
+
+
+def test_republish_replaces_previous_pyramid(tmp_path):
+    output = tmp_path / "tiles"
+
+    big = tmp_path / "big.png"
+    Image.new("RGB", (1500, 1000)).save(big)
+    generate_tile_pyramid("m", str(big), str(output))
+
+    small = tmp_path / "small.png"
+    Image.new("RGB", (300, 200)).save(small)
+    result = generate_tile_pyramid("m", str(small), str(output))
+
+    assert result["max_zoom"] == 1
+    assert sorted(os.listdir(output / "m")) == ["0", "1"]
+
+
+def test_progressive_republish_keeps_old_levels_until_commit(tmp_path):
+    output = tmp_path / "tiles"
+    big = tmp_path / "big.png"
+    Image.new("RGB", (1500, 1000), color=(1, 1, 1)).save(big)
+    generate_tile_pyramid("m", str(big), str(output))
+    old_deep = (output / "m" / "3" / "5" / "3.png").read_bytes()
+
+    seen = []
+
+    def on_level_ready(info):
+        # The old z=3 stays viewable while the new levels come in.
+        seen.append((output / "m" / "3" / "5" / "3.png").read_bytes() == old_deep)
+
+    small = tmp_path / "small.png"
+    Image.new("RGB", (300, 200), color=(2, 2, 2)).save(small)
+    generate_tile_pyramid("m", str(small), str(output), on_level_ready=on_level_ready)
+
+    assert seen == [True, True]
+    assert sorted(os.listdir(output / "m")) == ["0", "1"]
+
+
+def test_failed_progressive_publish_leaves_old_tree(tmp_path, monkeypatch):
+    import tile_service_app.tiler as tiler
+
+    output = tmp_path / "tiles"
+    big = tmp_path / "big.png"
+    Image.new("RGB", (1500, 1000)).save(big)
+    generate_tile_pyramid("m", str(big), str(output))
+
+    original = tiler.render_zoom_level
+
+    def render(resized, z, pipeline, *args):
+        if z == 2:
+            raise RuntimeError("tiling failed")
+        return original(resized, z, pipeline, *args)
+
+    monkeypatch.setattr(tiler, "render_zoom_level", render)
+    with pytest.raises(RuntimeError):
+        generate_tile_pyramid("m", str(big), str(output), on_level_ready=lambda info: None)
+
+    assert sorted(os.listdir(output / "m")) == ["0", "1", "2", "3"]
+    assert not (output / "m__tmp").exists()
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.published = []
+
+    def publish_level(self, z):
+        self.published.append(z)
+
+
+def test_slow_ready_callback_does_not_hold_up_other_writers():
+    writer, reported = RecordingWriter(), []
+    in_callback, release = threading.Event(), threading.Event()
+
+    def on_ready(z):
+        reported.append(z)
+        in_callback.set()
+        release.wait(5)
+
+    publisher = LevelPublisher(writer, on_ready)
+    slow = threading.Thread(target=publisher.level_done, args=(0,))
+    slow.start()
+    assert in_callback.wait(5)
+
+    # While z=0 is being reported, other writers publish and return.
+    for z in (2, 1, 3):
+        done = threading.Thread(target=publisher.level_done, args=(z,))
+        done.start()
+        done.join(1)
+        assert not done.is_alive()
+    assert writer.published == [0, 1, 2, 3]
+
+    release.set()
+    slow.join(5)
+    # The reporting thread catches up with the latest level.
+    assert reported == [0, 3]
+
+
+def test_failed_commit_discards_the_staged_pyramid(tmp_path, monkeypatch):
+    from tile_service_app.storage import LocalPyramidWriter
+
+    def commit(self, expected=None):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(LocalPyramidWriter, "commit", commit)
+    source = tmp_path / "source.png"
+    Image.new("RGB", (300, 200)).save(source)
+    output = tmp_path / "tiles"
+    with pytest.raises(OSError):
+        generate_tile_pyramid("m", str(source), str(output))
+
+    assert not (output / "m__tmp").exists()
@@ -0,0 +1,76 @@
+import io
+
+from PIL import Image
+
+from tile_service_app.recompress import recompress_png, recompress_pyramid
+from tile_service_app.storage import LocalStorage, S3Storage
+from tile_service_app.tiler import generate_tile_pyramid
+
+
+def make_source(path, width=700, height=500):
+    img = Image.new("RGB", (width, height))
+    img.putdata([((x // 8) % 256, (y // 8) % 256, 128) for y in range(height) for x in range(width)])
+    img.save(path)
+
+
+def pixels(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return img.convert("RGBA").tobytes()
+
+
+def test_recompress_is_lossless_and_smaller(tmp_path):
+    make_source(tmp_path / "source.png")
+    generate_tile_pyramid("m", str(tmp_path / "source.png"), str(tmp_path / "tiles"))
+
+    storage = LocalStorage(str(tmp_path / "tiles"))
+    keys = storage.list_keys("m/")
+    assert "m/0/0/0.png" in keys
+    before = {k: (tmp_path / "tiles" / k).read_bytes() for k in keys}
+
+    stats = recompress_pyramid(storage, "m", workers=2)
+
+    assert stats["tiles"] == len(keys)
+    assert stats["bytes_saved"] > 0
+    after = {k: (tmp_path / "tiles" / k).read_bytes() for k in keys}
+    assert stats["bytes_saved"] == sum(len(v) for v in before.values()) - sum(len(v) for v in after.values())
+    for k in keys:
+        assert len(after[k]) <= len(before[k])
+        assert pixels(after[k]) == pixels(before[k])
+    assert not list((tmp_path / "tiles").rglob("*.part"))
+
+
+def test_recompress_keeps_smaller_original():
+    buf = io.BytesIO()
+    Image.new("RGBA", (256, 256)).save(buf, format="PNG", optimize=True)
+    assert recompress_png(buf.getvalue()) is None
+
+
+def test_rewritten_tile_is_not_replaced(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    buf = io.BytesIO()
+    Image.new("RGBA", (256, 256), (1, 2, 3, 255)).save(buf, format="PNG", compress_level=0)
+    storage.put_bytes("m/0/0/0.png", buf.getvalue())
+
+    data, version = storage.get_versioned("m/0/0/0.png")
+    storage.put_bytes("m/0/0/0.png", b"retiled")
+    assert not storage.replace_if_unchanged("m/0/0/0.png", recompress_png(data), version)
+    assert (tmp_path / "m/0/0/0.png").read_bytes() == b"retiled"
+
+
+def test_s3_recompress_uses_conditional_put(s3_client):
+    storage = S3Storage(s3_client, "tiles")
+    buf = io.BytesIO()
+    Image.new("RGBA", (256, 256), (9, 9, 9, 255)).save(buf, format="PNG", compress_level=0)
+    storage.put_bytes("m/0/0/0.png", buf.getvalue())
+    storage.put_bytes("m/1/0/0.png", buf.getvalue())
+
+    data, version = storage.get_versioned("m/1/0/0.png")
+    retiled = io.BytesIO()
+    Image.new("RGBA", (256, 256), (7, 7, 7, 255)).save(retiled, format="PNG", optimize=True)
+    storage.put_bytes("m/1/0/0.png", retiled.getvalue())
+    assert not storage.replace_if_unchanged("m/1/0/0.png", data, version)
+
+    stats = recompress_pyramid(storage, "m")
+    assert stats["tiles_replaced"] == 1
+    assert s3_client.buckets["tiles"]["m/1/0/0.png"] == retiled.getvalue()
+    assert len(s3_client.buckets["tiles"]["m/0/0/0.png"]) < len(buf.getvalue())
@@ -0,0 +1,136 @@
+import io
+import os
+import tempfile
+
+import pytest
+from PIL import Image
+
+from tile_service_app.storage import LocalStorage, S3Storage
+from tile_service_app.tiler import generate_tile_pyramid
+
+
+def test_s3_pyramid_is_written_and_stale_tiles_removed(tmp_path, s3_client):
+    storage = S3Storage(s3_client, "tiles")
+    s3_client.put_object(Bucket="tiles", Key="m1/9/0/0.png", Body=b"stale")
+
+    source_path = tmp_path / "source.png"
+    Image.new("RGB", (600, 300), color=(1, 2, 3)).save(source_path)
+
+    result = generate_tile_pyramid("m1", str(source_path), str(tmp_path), storage=storage)
+    assert result["max_zoom"] == 2
+
+    keys = set(s3_client.buckets["tiles"])
+    assert "m1/9/0/0.png" not in keys
+    assert "m1/0/0/0.png" in keys
+    assert "m1/2/2/1.png" in keys
+    assert len(keys) == 1 + 2 + 6
+
+
+def test_s3_delete_prefix_batches_and_paginates(s3_client):
+    storage = S3Storage(s3_client, "tiles")
+    for i in range(1200):
+        s3_client.put_object(Bucket="tiles", Key=f"m2/0/{i}.png", Body=b"x")
+    s3_client.put_object(Bucket="tiles", Key="m20/0/0.png", Body=b"x")
+
+    deleted = storage.delete_prefix("m2")
+    assert deleted == 1200
+    assert list(s3_client.buckets["tiles"]) == ["m20/0/0.png"]
+    assert s3_client.calls.count("delete_objects") == 2
+
+
+def test_s3_local_copy_downloads_to_temp_file(s3_client):
+    storage = S3Storage(s3_client, "sources")
+    s3_client.put_object(Bucket="sources", Key="m3/source.png", Body=b"png-bytes")
+
+    with storage.local_copy("m3/source.png") as path:
+        with open(path, "rb") as f:
+            assert f.read() == b"png-bytes"
+
+
+def test_s3_local_copy_of_missing_key_leaves_no_temp_file(s3_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    storage = S3Storage(s3_client, "sources")
+
+    with pytest.raises(FileNotFoundError):
+        with storage.local_copy("m3/missing.png"):
+            pass
+    assert os.listdir(tmp_path) == []
+
+
+def test_s3_exists_matches_whole_key(s3_client):
+    storage = S3Storage(s3_client, "sources")
+    s3_client.put_object(Bucket="sources", Key="m3/source.png.part", Body=b"x")
+
+    assert not storage.exists("m3/source.png")
+    assert storage.exists("m3/source.png.part")
+
+
+def test_s3_pyramid_abort_keeps_published_tiles(s3_client):
+    storage = S3Storage(s3_client, "tiles")
+
+    writer = storage.open_pyramid("m5")
+    writer.write("0/0/0.png", b"v1")
+    writer.commit()
+
+    writer = storage.open_pyramid("m5")
+    writer.write("0/0/0.png", b"v2")
+    writer.write("1/0/0.png", b"v2")
+    assert s3_client.buckets["tiles"]["m5/0/0/0.png"] == b"v1"
+    writer.abort()
+
+    assert s3_client.buckets["tiles"] == {"m5/0/0/0.png": b"v1"}
+
+
+def test_local_pyramid_abort_keeps_published_tiles(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+
+    writer = storage.open_pyramid("m4")
+    writer.write("0/0/0.png", b"v1")
+    writer.commit()
+
+    writer = storage.open_pyramid("m4")
+    writer.write("0/0/0.png", b"v2")
+    writer.abort()
+
+    assert (tmp_path / "m4" / "0" / "0" / "0.png").read_bytes() == b"v1"
+    assert not (tmp_path / "m4__tmp").exists()
+
+
+def test_link_pyramid_replaces_tiles_with_shared_ones(tmp_path, s3_client):
+    local = LocalStorage(str(tmp_path))
+    s3 = S3Storage(s3_client, "tiles")
+    for storage in (local, s3):
+        storage.put_bytes("cas/d1/png/0/0/0.png", b"shared")
+        storage.put_bytes("cas/d1/png/1/0/0.png", b"shared")
+        storage.put_bytes("m6/9/0/0.png", b"stale")
+
+        assert storage.link_pyramid("cas/d1/png", "m6") == 2
+        assert storage.get_bytes("m6/1/0/0.png") == b"shared"
+        assert storage.get_bytes("m6/9/0/0.png") is None
+        assert not storage.list_keys("m6__tmp/")
+
+        # Nothing to link leaves the map's tiles alone.
+        assert storage.link_pyramid("cas/d2/png", "m6") == 0
+        assert storage.get_bytes("m6/0/0/0.png") == b"shared"
+
+    assert os.path.samefile(tmp_path / "m6/0/0/0.png", tmp_path / "cas/d1/png/0/0/0.png")
+
+
+def test_extract_reads_tiles_from_s3(tmp_path, s3_client, monkeypatch):
+    import tile_service_app.routes.extract as extract_routes
+    tiles = S3Storage(s3_client, "tiles")
+    Image.new("RGB", (600, 300), color=(200, 40, 10)).save(tmp_path / "source.png")
+    generate_tile_pyramid("m7", str(tmp_path / "source.png"), str(tmp_path), storage=tiles)
+    monkeypatch.setattr(extract_routes, "get_tile_storage", lambda: tiles)
+    monkeypatch.setattr(extract_routes, "get_source_storage", lambda: S3Storage(s3_client, "sources"))
+    monkeypatch.setattr(extract_routes, "TILES_ARCHIVE_PATH", str(tmp_path / "archive"))
+
+    data = extract_routes.build_extract("m7", "m7/extracts/v1/a.png", (0, 0, 600, 300), (60, 30), "png", 0,
+                                        600, 300, 2)
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.size == (60, 30)
+        assert img.convert("RGB").getpixel((30, 15)) == (200, 40, 10)
+    assert s3_client.buckets["sources"]["m7/extracts/v1/a.png"] == data
+
+    assert extract_routes.build_extract("m8", "m8/extracts/v1/a.png", (0, 0, 600, 300), (60, 30), "png", 0,
+                                        600, 300, 2) is None
@@ -0,0 +1,179 @@
+import os
+import shutil
+import zipfile
+
+from fastapi.testclient import TestClient
+
+import tile_service_app.routes.tiles as tiles_routes
+from tile_service_app.sources import ArchiveCache
+from tile_service_app.storage import LocalStorage
+from tile_service_app.tiering import (pack_pyramid, rehydrate_pyramid, discard_archive, request_rehydrate,
+                                      record_archived, record_rehydrated, tiering_stats, archive_file)
+
+MAP_ID = "22222222-2222-2222-2222-222222222222"
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def hincrby(self, key, field, amount):
+        h = self.data.setdefault(key, {})
+        h[field] = h.get(field, 0) + amount
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def lpush(self, key, value):
+        self.data.setdefault(key, []).insert(0, value)
+
+    def ltrim(self, key, start, end):
+        self.data[key] = self.data.get(key, [])[start:end + 1]
+
+    def lrange(self, key, start, end):
+        return list(self.data.get(key, []))
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+
+def write_pyramid(root, map_id=MAP_ID):
+    for z, x, y in ((0, 0, 0), (1, 0, 0), (1, 1, 0)):
+        path = root / map_id / str(z) / str(x) / f"{y}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(f"tile {z}/{x}/{y}".encode() * 10)
+
+
+def test_pack_and_rehydrate_round_trip(tmp_path):
+    tiles, cold = tmp_path / "tiles", tmp_path / "cold"
+    write_pyramid(tiles)
+
+    stats = pack_pyramid(str(tiles), str(cold), MAP_ID)
+    assert stats["tiles"] == 3
+    assert stats["bytes_reclaimed"] == 3 * 100
+    assert not (tiles / MAP_ID).exists()
+    with zipfile.ZipFile(archive_file(str(cold), MAP_ID)) as zf:
+        assert sorted(zf.namelist()) == ["0/0/0.png", "1/0/0.png", "1/1/0.png"]
+        assert zf.getinfo("1/1/0.png").compress_type == zipfile.ZIP_STORED
+
+    assert rehydrate_pyramid(str(tiles), str(cold), MAP_ID)
+    assert (tiles / MAP_ID / "1" / "1" / "0.png").read_bytes() == b"tile 1/1/0" * 10
+    assert not os.path.exists(archive_file(str(cold), MAP_ID))
+    assert not rehydrate_pyramid(str(tiles), str(cold), MAP_ID)
+
+
+def test_pack_skips_pyramids_that_free_nothing(tmp_path):
+    tiles = tmp_path / "tiles"
+    write_pyramid(tiles)
+    for path in (tiles / MAP_ID).rglob("*.png"):
+        shared = tmp_path / "shared" / path.relative_to(tiles)
+        shared.parent.mkdir(parents=True, exist_ok=True)
+        os.link(path, shared)
+
+    assert pack_pyramid(str(tiles), str(tmp_path / "cold"), MAP_ID) is None
+    assert (tiles / MAP_ID / "0" / "0" / "0.png").exists()
+    assert pack_pyramid(str(tiles), str(tmp_path / "cold"), "missing") is None
+
+
+def test_pack_map_linked_from_a_holder(tmp_path):
+    # Uploads of an image tiled before link the holder map's tiles in
+    # (link_task); neither copy frees anything until the other goes.
+    tiles, cold = tmp_path / "tiles", tmp_path / "cold"
+    write_pyramid(tiles, "holder")
+    assert LocalStorage(str(tiles)).link_pyramid("holder", MAP_ID) == 3
+
+    assert pack_pyramid(str(tiles), str(cold), MAP_ID) is None
+    shutil.rmtree(tiles / "holder")
+    assert pack_pyramid(str(tiles), str(cold), MAP_ID)["tiles"] == 3
+
+
+def test_archive_cache_reopens_replaced_archives(tmp_path):
+    tiles, cold = tmp_path / "tiles", tmp_path / "cold"
+    write_pyramid(tiles)
+    pack_pyramid(str(tiles), str(cold), MAP_ID)
+    path = archive_file(str(cold), MAP_ID)
+    cache = ArchiveCache(1)
+
+    source = cache.get(path)
+    assert cache.get(path) is source
+    assert source.read_tile(1, 1, 0)[0] == b"tile 1/1/0" * 10
+
+    # Rehydrated: the archive is gone.
+    rehydrate_pyramid(str(tiles), str(cold), MAP_ID)
+    assert cache.get(path) is None
+
+    # Packed again after a re-tile.
+    (tiles / MAP_ID / "1" / "1" / "0.png").write_bytes(b"new")
+    pack_pyramid(str(tiles), str(cold), MAP_ID)
+    again = cache.get(path)
+    assert again is not source
+    assert again.read_tile(1, 1, 0)[0] == b"new"
+    # The old source still reads for a request that holds it.
+    assert source.read_tile(0, 0, 0)[0] == b"tile 0/0/0" * 10
+
+    write_pyramid(tiles, "other")
+    pack_pyramid(str(tiles), str(cold), "other")
+    cache.get(archive_file(str(cold), "other"))
+    assert cache.get(path) is not again
+
+
+def test_discard_archive_after_retile(tmp_path):
+    tiles, cold = tmp_path / "tiles", tmp_path / "cold"
+    write_pyramid(tiles)
+    pack_pyramid(str(tiles), str(cold), MAP_ID)
+    discard_archive(str(cold), MAP_ID)
+    discard_archive(str(cold), MAP_ID)
+    assert not os.listdir(cold)
+
+
+def test_rehydrate_is_requested_once_and_stats_are_kept():
+    redis, enqueued = FakeRedis(), []
+    assert request_rehydrate(redis, MAP_ID, lambda m, t: enqueued.append(m))
+    assert not request_rehydrate(redis, MAP_ID, lambda m, t: enqueued.append(m))
+    assert enqueued == [MAP_ID]
+
+    record_archived(redis, {"tiles": 3, "bytes_reclaimed": 3000, "archive_bytes": 3300})
+    for seconds in (0.2, 0.4, 1.5):
+        record_rehydrated(redis, MAP_ID, seconds)
+
+    stats = tiering_stats(redis)
+    assert (stats["maps_archived"], stats["bytes_reclaimed"], stats["rehydrations"]) == (1, 3000, 3)
+    assert stats["rehydrate_ms"] == {"p50": 400, "p95": 1500, "max": 1500, "samples": 3}
+    assert request_rehydrate(redis, MAP_ID, lambda m, t: enqueued.append(m))
+
+
+def test_tile_endpoint_serves_from_archive(tmp_path, monkeypatch):
+    tiles, cold = tmp_path / "tiles", tmp_path / "cold"
+    write_pyramid(tiles)
+    pack_pyramid(str(tiles), str(cold), MAP_ID)
+
+    redis, enqueued = FakeRedis(), []
+    monkeypatch.setattr(tiles_routes, "TILES_OUTPUT_PATH", str(tiles))
+    monkeypatch.setattr(tiles_routes, "TILES_ARCHIVE_PATH", str(cold))
+    monkeypatch.setattr(tiles_routes, "get_redis", lambda: redis)
+    monkeypatch.setattr(tiles_routes, "rq_enqueue_rehydrate", lambda m, t: enqueued.append(m))
+
+    from tile_service_app.main import app
+    client = TestClient(app)
+
+    resp = client.get(f"/tiles/{MAP_ID}/1/1/0.png")
+    assert resp.status_code == 200
+    assert resp.content == b"tile 1/1/0" * 10
+    assert client.get(f"/tiles/{MAP_ID}/1/1/0.png", headers={"If-None-Match": resp.headers["etag"]}).status_code == 304
+    assert client.get(f"/tiles/{MAP_ID}/5/0/0.png").status_code == 404
+    assert enqueued == [MAP_ID]
+
+    assert client.get("/tiles/33333333-3333-3333-3333-333333333333/0/0/0.png").status_code == 404
+    assert client.get("/tiering/stats").json()["maps_archived"] == 0
@@ -0,0 +1,129 @@
+import pytest
+
+import tile_service_app.worker as worker
+from tile_service_app.worker import should_recycle, peak_rss_mb
+
+
+def test_should_recycle_after_max_jobs(monkeypatch):
+    monkeypatch.setattr(worker, "WORKER_MAX_JOBS", 3)
+    monkeypatch.setattr(worker, "WORKER_RECYCLE_RSS_MB", 0)
+
+    assert should_recycle(2, 10_000) is False
+    assert should_recycle(3, 10) is True
+
+
+def test_should_recycle_on_memory_growth(monkeypatch):
+    monkeypatch.setattr(worker, "WORKER_MAX_JOBS", 0)
+    monkeypatch.setattr(worker, "WORKER_RECYCLE_RSS_MB", 512)
+
+    assert should_recycle(10_000, 511) is False
+    assert should_recycle(1, 512) is True
+
+
+def test_peak_rss_is_reported():
+    assert peak_rss_mb() > 0
+
+
+def test_prewarm_keeps_http_client_between_calls():
+    import tile_service_app.tasks as tasks
+
+    worker.prewarm()
+    client = tasks.get_http_client()
+    worker.prewarm()
+    assert tasks.get_http_client() is client
+
+
+def noop():
+    return None
+
+
+def run_prewarmed_worker(monkeypatch, jobs: int):
+    fakeredis = pytest.importorskip("fakeredis")
+    from rq import Queue
+
+    monkeypatch.setattr(worker, "WORKER_MEMORY_LIMIT_MB", 0)
+    redis = fakeredis.FakeStrictRedis()
+    queue = Queue("default", connection=redis)
+    for _ in range(jobs):
+        queue.enqueue(noop)
+    w = worker.PrewarmedWorker([queue], connection=redis)
+    w.work(burst=True)
+    assert queue.failed_job_registry.count == 0
+    return w, queue
+
+
+def test_prewarmed_worker_stops_after_max_jobs(monkeypatch):
+    monkeypatch.setattr(worker, "WORKER_MAX_JOBS", 2)
+    monkeypatch.setattr(worker, "WORKER_RECYCLE_RSS_MB", 0)
+
+    w, queue = run_prewarmed_worker(monkeypatch, jobs=5)
+    assert w.jobs_done == 2
+    assert queue.count == 3
+
+
+def test_prewarmed_worker_stops_once_past_the_rss_limit(monkeypatch):
+    monkeypatch.setattr(worker, "WORKER_MAX_JOBS", 0)
+    monkeypatch.setattr(worker, "WORKER_RECYCLE_RSS_MB", 512)
+    monkeypatch.setattr(worker, "peak_rss_mb", lambda: 600.0)
+
+    w, queue = run_prewarmed_worker(monkeypatch, jobs=3)
+    assert w.jobs_done == 1
+    assert queue.count == 2
+
+
+def test_memory_limit_caps_the_address_space(monkeypatch):
+    calls = []
+    monkeypatch.setattr(worker.resource, "setrlimit", lambda which, limits: calls.append((which, limits)))
+
+    monkeypatch.setattr(worker, "WORKER_MEMORY_LIMIT_MB", 0)
+    worker.apply_memory_limit()
+    assert calls == []
+
+    monkeypatch.setattr(worker, "WORKER_MEMORY_LIMIT_MB", 2048)
+    worker.apply_memory_limit()
+    assert calls == [(worker.resource.RLIMIT_AS, (2048 * 1024 * 1024, 2048 * 1024 * 1024))]
+
+
+class FakeJob:
+    def __init__(self, meta, retries_left=None):
+        self.meta = meta
+        self.retries_left = retries_left
+
+
+class FakeRedis:
+    def __init__(self, data):
+        self.data = data
+        self.ttl = {}
+
+    def delete(self, key):
+        return 1 if self.data.pop(key, None) is not None else 0
+
+    def pipeline(self):
+        return self
+
+    def incrbyfloat(self, key, amount):
+        self.data[key] = self.data.get(key, 0.0) + amount
+
+    def expire(self, key, seconds):
+        self.ttl[key] = seconds
+
+    def execute(self):
+        pass
+
+
+def test_failed_upload_job_refunds_its_charge_once():
+    from tile_service_app.tasks import refund_tiling_charge
+
+    charge = {"token": "t", "cpu": 30.0, "keys": [["user", 100], ["global", 10]]}
+    redis = FakeRedis({"t": 30.0, "user": 50.0, "global": 80.0})
+
+    # A job that will be retried keeps its charge.
+    refund_tiling_charge(FakeJob({"tiling_charge": charge}, retries_left=2), redis)
+    assert redis.data["user"] == 50.0
+
+    refund_tiling_charge(FakeJob({"tiling_charge": charge}), redis)
+    refund_tiling_charge(FakeJob({"tiling_charge": charge}), redis)
+    assert redis.data == {"user": 20.0, "global": 50.0}
+    assert redis.ttl == {"user": 100, "global": 10}
+
+    refund_tiling_charge(FakeJob({}), redis)
@@ -1,9 +1,22 @@
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv('DATABASE_URL')
+# Same database for the async endpoints, through asyncpg.
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL') or re.sub(r'^postgresql(\+psycopg2)?://', 'postgresql+asyncpg://',
+                                                              DATABASE_URL or '')
+# Per-process pool sizing; the async engine gets a pool of its own with the
+# same settings. -1 disables recycling.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '-1'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'false').lower() == 'true'
+# Sent by the metrics scraper as X-Metrics-Token; /metrics is off without it.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
\ No newline at end of file
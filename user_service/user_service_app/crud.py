@@ -1,4 +1,7 @@
+import asyncio
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
 from uuid import UUID
 
@@ -40,4 +43,37 @@ def is_email_taken(db: Session, email: str) -> bool:
     return db.query(User).filter(User.email == email).first() is not None
 
 def get_user_by_id(db: Session, user_id: UUID) -> User | None:
-    return db.query(User).filter(User.id == user_id).first()
\ No newline at end of file
+    return db.query(User).filter(User.id == user_id).first()
+
+
+# Async variants for the async endpoints. Argon2 hashing is CPU-bound, so
+# it runs in a worker thread instead of blocking the event loop.
+
+async def create_user_async(db: AsyncSession, user_data: UserCreate) -> User:
+    hashed_password = await asyncio.to_thread(get_password_hash, user_data.password)
+    db_user = User(
+        username=user_data.username,
+        email=str(user_data.email),
+        password_hash=hashed_password
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+async def authenticate_user_async(db: AsyncSession, username: str, password: str) -> User | None:
+    user = await db.scalar(select(User).filter(User.username == username).limit(1))
+    if not user:
+        return None
+    if not await asyncio.to_thread(verify_password, password, user.password_hash):
+        return None
+    return user
+
+async def is_username_taken_async(db: AsyncSession, username: str) -> bool:
+    return await db.scalar(select(User.id).filter(User.username == username).limit(1)) is not None
+
+async def is_email_taken_async(db: AsyncSession, email: str) -> bool:
+    return await db.scalar(select(User.id).filter(User.email == email).limit(1)) is not None
+
+async def get_user_by_id_async(db: AsyncSession, user_id: UUID) -> User | None:
+    return await db.scalar(select(User).filter(User.id == user_id).limit(1))
@@ -1,15 +1,30 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 
-from user_service_app.config import DATABASE_URL
+from user_service_app.config import (DATABASE_URL, ASYNC_DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                                      DB_POOL_RECYCLE, DB_POOL_PRE_PING)
+from user_service_app.pool_metrics import MeteredQueuePool, MeteredAsyncPool
 
-engine = create_engine(DATABASE_URL)
+POOL_OPTIONS = dict(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=DB_POOL_PRE_PING)
+
+engine = create_engine(DATABASE_URL, poolclass=MeteredQueuePool, **POOL_OPTIONS)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Endpoints are async and use this engine; the sync one creates the schema.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=MeteredAsyncPool, **POOL_OPTIONS)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
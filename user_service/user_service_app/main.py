@@ -2,7 +2,7 @@ from fastapi import FastAPI
 
 from user_service_app.models import Base
 from user_service_app.database import engine
-from user_service_app.routes import auth, users
+from user_service_app.routes import auth, users, metrics
 
 Base.metadata.create_all(bind=engine)
 
@@ -13,4 +13,5 @@ app = FastAPI(
 )
 
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
-app.include_router(users.router, prefix="/users", tags=["users"])
\ No newline at end of file
+app.include_router(users.router, prefix="/users", tags=["users"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
\ No newline at end of file
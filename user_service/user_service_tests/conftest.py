@@ -17,4 +17,16 @@ def db():
         yield db
     finally:
         db.close()
-        Base.metadata.drop_all(bind=engine)
\ No newline at end of file
+        Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+async def async_db(tmp_path):
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.db'}")
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)() as db:
+        yield db
+    await async_engine.dispose()
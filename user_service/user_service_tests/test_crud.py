@@ -44,3 +44,17 @@ def test_get_user_by_id(db):
     assert fetched_user.id == user.id
     assert fetched_user.username == create_request.username
     assert fetched_user.email == create_request.email
+
+async def test_async_crud(async_db):
+    user = await crud.create_user_async(async_db, create_request)
+    assert user.username == "testuser"
+    assert user.password_hash != "StrongPass123!"
+
+    assert await crud.is_username_taken_async(async_db, "testuser") is True
+    assert await crud.is_username_taken_async(async_db, "nonexistent") is False
+    assert await crud.is_email_taken_async(async_db, "test@example.com") is True
+    assert await crud.is_email_taken_async(async_db, "nonexistent@example.com") is False
+
+    assert (await crud.authenticate_user_async(async_db, "testuser", "StrongPass123!")).id == user.id
+    assert await crud.authenticate_user_async(async_db, "testuser", "wrongpassword") is None
+    assert (await crud.get_user_by_id_async(async_db, user.id)).email == "test@example.com"
@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from user_service_app.pool_metrics import PoolMetrics, MeteredQueuePool, MeteredAsyncPool
+
+
+def test_wait_buckets_are_cumulative():
+    metrics = PoolMetrics()
+    metrics.checked_out(0.0005)
+    metrics.checked_out(0.003)
+    metrics.checked_out(20, overflow=True)
+
+    snapshot = metrics.snapshot()
+    assert (snapshot["checkouts"], snapshot["overflow_checkouts"]) == (3, 1)
+    assert snapshot["wait_ms"]["max"] == 20000
+    assert snapshot["wait_ms"]["buckets"]["1"] == 1
+    assert snapshot["wait_ms"]["buckets"]["5"] == 2
+    assert snapshot["wait_ms"]["buckets"]["+Inf"] == 3
+
+
+def test_sql_pool_counts_overflow_and_timeouts(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=MeteredQueuePool,
+                           pool_size=1, max_overflow=1, pool_timeout=0.05)
+    first, second = engine.connect(), engine.connect()
+    first.execute(text("SELECT 1"))
+
+    stats = engine.pool.stats()
+    assert (stats["in_use"], stats["overflow"], stats["checkouts"], stats["overflow_checkouts"]) == (2, 1, 2, 1)
+
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    assert engine.pool.stats()["timeouts"] == 1
+
+    first.close()
+    second.close()
+    stats = engine.pool.stats()
+    assert (stats["in_use"], stats["idle"]) == (0, 1)
+    engine.dispose()
+
+
+async def test_async_pool_is_metered(tmp_path):
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", poolclass=MeteredAsyncPool,
+                                 pool_size=1, max_overflow=0)
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        assert engine.pool.stats()["in_use"] == 1
+    stats = engine.pool.stats()
+    assert (stats["in_use"], stats["checkouts"]) == (0, 1)
+    await engine.dispose()